@@ -0,0 +1,282 @@
+"""Сборка статики: минификация, хэш содержимого в имени, сжатые копии.
+
+Запуск:
+    python assets.py build
+
+Для каждого файла из static/ (кроме static/dist) в static/dist пишется
+копия с хэшем содержимого в имени (css/style.1a2b3c4d5e.css), рядом -
+.gz и .br (пакет Brotli из requirements.txt; без него - только .gz и
+предупреждение). Карта "исходный путь -> путь с хэшем" сохраняется в
+static/dist/manifest.json; по ней шаблонная функция
+static_url() выдаёт адреса, а PrecompressedStaticFiles отдаёт хэшированные
+файлы с Cache-Control: immutable. Без сборки всё работает по старым адресам.
+
+При запуске сборка сверяется с исходниками (mtime и набор файлов): если
+static/ менялся после сборки, она пересобирается, чтобы не отдавать старые
+файлы под новыми шаблонами (ASSETS_AUTOBUILD=0 - вместо этого ошибка).
+"""
+import os, re, sys, gzip, json, hashlib, mimetypes
+
+from starlette.datastructures import Headers
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.responses import FileResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST = "dist"
+MANIFEST = "manifest.json"
+STATIC_PREFIX = "/static/"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Нехэшированные адреса могут поменяться без смены имени - только с ревалидацией
+REVALIDATE = "public, max-age=0, must-revalidate"
+
+# Уже сжатые форматы повторно не сжимаем
+COMPRESSIBLE = (".css", ".js", ".svg", ".html", ".json", ".txt")
+MIN_COMPRESS_SIZE = 256
+# Устаревший static/dist при запуске пересобирается; 0 - вместо этого ошибка
+ASSETS_AUTOBUILD = os.environ.get("ASSETS_AUTOBUILD", "1") == "1"
+
+
+# === Минификация ===
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SPACE_RE = re.compile(r"\s+")
+_CSS_PUNCT_RE = re.compile(r"\s*([{};,>])\s*")
+
+
+def minify_css(text):
+    text = _CSS_COMMENT_RE.sub("", text)
+    text = _CSS_SPACE_RE.sub(" ", text)
+    text = _CSS_PUNCT_RE.sub(r"\1", text)
+    # Пробел после ":" убираем только в объявлениях, селекторы вида "a :hover" не трогаем
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text):
+    """Осторожная минификация: отступы, пустые строки и строки-комментарии.
+
+    Полноценный минификатор JS без node не написать, а переносы строк мы
+    сохраняем, чтобы не сломать автоматическую расстановку точек с запятой.
+    Строки внутри шаблонных литералов (`...`) - это данные, они остаются
+    как есть, вместе с отступами и пустыми строками.
+    """
+    lines = []
+    state = []
+    for line in text.splitlines():
+        in_literal = bool(state) and state[-1] == "`"
+        state = _js_scan(line, state)
+        if in_literal:
+            lines.append(line)
+            continue
+        # Строка, которая открывает многострочный литерал, хвостовых пробелов не теряет
+        line = line.strip() if not state or state[-1] != "`" else line.lstrip()
+        if not line or line.startswith("//"):
+            continue
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def _js_scan(line, state):
+    """Состояние после строки: стек из "`" (литерал) и "{" (выражение ${...} в нём).
+
+    Обычные строки и комментарии в JS не переходят на следующую строку,
+    поэтому следим только за ними внутри строки. Регулярные выражения не
+    разбираем: кавычка или ` в них может сбить счёт.
+    """
+    state = list(state)
+    i, n = 0, len(line)
+    while i < n:
+        ch = line[i]
+        if state and state[-1] == "`":
+            if ch == "\\":
+                i += 1
+            elif ch == "`":
+                state.pop()
+            elif line.startswith("${", i):
+                state.append("{")
+                i += 1
+        elif ch in "'\"":
+            i += 1
+            while i < n and line[i] != ch:
+                i += 2 if line[i] == "\\" else 1
+        elif ch == "`":
+            state.append("`")
+        elif line.startswith("//", i):
+            break
+        elif ch == "{" and state:
+            state.append("{")
+        elif ch == "}" and state:
+            state.pop()
+        i += 1
+    return state
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+# === Сборка ===
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def _write(path, data):
+    """Запись через временный файл: воркеры, которые стартуют одновременно, не видят полузаписанный файл"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _sources(static_dir):
+    """Исходные файлы static/ (без dist): {относительный путь: полный путь}"""
+    sources = {}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir):
+            dirs[:] = [d for d in dirs if d != DIST]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            sources[os.path.relpath(source, static_dir).replace(os.sep, "/")] = source
+    return sources
+
+
+def build(static_dir=STATIC_DIR):
+    """Собираем static/dist и возвращаем манифест"""
+    if brotli is None:
+        print("Warning: brotli is not installed (see requirements.txt), building .gz copies only")
+    dist_dir = os.path.join(static_dir, DIST)
+    manifest = {}
+    for rel, source in _sources(static_dir).items():
+        base, ext = os.path.splitext(rel)
+        with open(source, "rb") as f:
+            data = f.read()
+
+        minify = MINIFIERS.get(ext)
+        if minify:
+            data = minify(data.decode("utf-8")).encode("utf-8")
+
+        hashed = f"{base}.{fingerprint(data)}{ext}"
+        target = os.path.join(dist_dir, hashed)
+        _write(target, data)
+        if ext in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+            # mtime=0 - одинаковый вход даёт побайтно одинаковый .gz
+            _write(target + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write(target + ".br", brotli.compress(data, quality=11))
+        manifest[rel] = f"{DIST}/{hashed}"
+
+    _write(os.path.join(dist_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+def is_stale(static_dir=STATIC_DIR):
+    """Сборка устарела: исходник новее манифеста или набор файлов другой"""
+    path = os.path.join(static_dir, DIST, MANIFEST)
+    try:
+        built_at = os.stat(path).st_mtime
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return True
+    sources = _sources(static_dir)
+    if set(sources) != set(manifest):
+        return True
+    return any(os.stat(source).st_mtime > built_at for source in sources.values())
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    """Манифест сборки; устаревшую сборку пересобираем (или падаем при ASSETS_AUTOBUILD=0).
+
+    Без static/dist ничего не собираем: файлы отдаются по старым адресам.
+    """
+    if not os.path.isdir(os.path.join(static_dir, DIST)):
+        return {}
+    if is_stale(static_dir):
+        if not ASSETS_AUTOBUILD:
+            raise RuntimeError(f"Static build in {os.path.join(static_dir, DIST)} is stale, "
+                               "run 'python assets.py build'")
+        print("Static build is stale, rebuilding")
+        return build(static_dir)
+    with open(os.path.join(static_dir, DIST, MANIFEST), encoding="utf-8") as f:
+        return json.load(f)
+
+
+# === Раздача ===
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles, который отдаёт .br/.gz копии по Accept-Encoding.
+
+    Файлы из dist/ содержат хэш в имени и кэшируются навсегда, остальные -
+    с обязательной ревалидацией по ETag, как и раньше.
+    """
+
+    def __init__(self, *args, manifest=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = manifest if manifest is not None else load_manifest(self.directory)
+
+    def static_url(self, path):
+        """Шаблонная функция: адрес файла с хэшем, если сборка есть"""
+        return STATIC_PREFIX + self.manifest.get(path, path)
+
+    async def get_response(self, path, scope):
+        immutable = path.replace(os.sep, "/").startswith(DIST + "/")
+        if immutable and scope["method"] in ("GET", "HEAD"):
+            for encoding, suffix in self._accepted_encodings(scope):
+                full_path, stat_result = self.lookup_path(f"{path}.{suffix}")
+                if stat_result is None:
+                    continue
+                media_type = mimetypes.guess_type(path)[0] or "text/plain"
+                response = FileResponse(full_path, stat_result=stat_result, media_type=media_type,
+                                        headers={"Content-Encoding": encoding})
+                if self.is_not_modified(response.headers, Headers(scope=scope)):
+                    response = NotModifiedResponse(response.headers)
+                return self._finish(response, immutable)
+        response = await super().get_response(path, scope)
+        return self._finish(response, immutable)
+
+    @staticmethod
+    def _accepted_encodings(scope):
+        """Сжатые варианты, которые принимает клиент, в порядке предпочтения"""
+        accept = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept = value.decode("latin-1").lower()
+                break
+        offered = {}
+        for part in accept.split(","):
+            name, _, params = part.strip().partition(";")
+            q = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            offered[name.strip()] = q
+        # .br ищем даже без пакета brotli: сборка могла быть сделана на другой машине
+        return [(name, suffix) for name, suffix in (("br", "br"), ("gzip", "gz")) if offered.get(name, 0) > 0]
+
+    @staticmethod
+    def _finish(response, immutable):
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE if immutable else REVALIDATE
+            if immutable:
+                response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def main(argv):
+    if argv[:1] != ["build"]:
+        print(__doc__)
+        return 2
+    manifest = build()
+    print(f"Built {len(manifest)} assets into {os.path.join(STATIC_DIR, DIST)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
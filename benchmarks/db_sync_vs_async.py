@@ -0,0 +1,84 @@
+"""Сравнение пропускной способности Database и AsyncDatabase.
+
+Запуск: python benchmarks/db_sync_vs_async.py [--ops 2000] [--levels 1,50,500]
+
+Синхронный вариант гоняется через пул потоков размером как у threadpool
+Starlette (40), асинхронный - через задачи asyncio в одном потоке.
+Результат печатается в JSON.
+"""
+import os, sys, time, json, asyncio, argparse, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Путь к базе читается при импорте database, поэтому задаём его до импорта
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db, AsyncDatabase, DB_PATH
+
+THREADPOOL_SIZE = 40
+USERS = 200
+
+
+def seed(db):
+    for i in range(USERS):
+        db.create_user(f"user{i}", f"user{i}@example.com", "Passw0rd!")
+        db.save_password(i + 1, f"Saved#{i}", 80)
+
+
+def workload(i):
+    return f"user{i % USERS}@example.com"
+
+
+def run_sync(db, ops, concurrency):
+    def op(i):
+        user = db.get_user_by_email(workload(i))
+        db.get_saved_passwords(user["id"], limit=5)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(concurrency, THREADPOOL_SIZE)) as ex:
+        list(ex.map(op, range(ops)))
+    return time.perf_counter() - start
+
+
+async def run_async(ops, concurrency):
+    # Соединения aiosqlite привязаны к циклу, поэтому на каждый прогон свой пул
+    adb = AsyncDatabase(DB_PATH)
+    counter = iter(range(ops))
+
+    async def client():
+        for i in counter:
+            user = await adb.get_user_by_email(workload(i))
+            await adb.get_saved_passwords(user["id"], limit=5)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await adb.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--levels", default="1,50,500")
+    args = parser.parse_args()
+
+    db.setup()
+    seed(db)
+
+    results = []
+    for concurrency in [int(x) for x in args.levels.split(",")]:
+        sync_time = run_sync(db, args.ops, concurrency)
+        async_time = asyncio.run(run_async(args.ops, concurrency))
+        results.append({
+            "concurrency": concurrency,
+            "sync_ops_per_sec": round(args.ops / sync_time, 1),
+            "async_ops_per_sec": round(args.ops / async_time, 1),
+        })
+
+    print(json.dumps({"ops": args.ops, "results": results}, indent=2))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Сколько входов в секунду на ядро выдерживает каждая настройка стоимости KDF.
+
+Запуск: python benchmarks/hashing.py [--seconds 2] [--workers N]
+
+Для каждой стоимости меряется проверка пароля (то, что делает login_post)
+в один поток и в пуле из N потоков. Результат печатается в JSON.
+"""
+import os, sys, time, json, argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hashing import BcryptHasher, ScryptHasher
+
+PASSWORD = "TestPass123!"
+COSTS = [
+    BcryptHasher(rounds=10),
+    BcryptHasher(rounds=11),
+    BcryptHasher(rounds=12),
+    BcryptHasher(rounds=13),
+    ScryptHasher(n=2 ** 14),
+    ScryptHasher(n=2 ** 15),
+    ScryptHasher(n=2 ** 16),
+]
+
+
+def cost_label(hasher):
+    if hasher.name == "bcrypt":
+        return f"bcrypt rounds={hasher.rounds}"
+    return f"scrypt n={hasher.n} r={hasher.r} p={hasher.p}"
+
+
+def measure(hasher, encoded, workers, seconds):
+    """Число проверок за seconds секунд в пуле из workers потоков"""
+    deadline = time.perf_counter() + seconds
+
+    def loop(_):
+        done = 0
+        while time.perf_counter() < deadline:
+            hasher.verify(PASSWORD, encoded)
+            done += 1
+        return done
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        total = sum(ex.map(loop, range(workers)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    results = []
+    for hasher in COSTS:
+        encoded = hasher.hash(PASSWORD)
+        single = measure(hasher, encoded, 1, args.seconds)
+        parallel = measure(hasher, encoded, args.workers, args.seconds)
+        results.append({
+            "cost": cost_label(hasher),
+            "verify_ms": round(1000 / single, 2),
+            "logins_per_sec_1_core": round(single, 1),
+            f"logins_per_sec_{args.workers}_workers": round(parallel, 1),
+            "logins_per_sec_per_core": round(parallel / args.workers, 1),
+        })
+
+    print(json.dumps({"cpu_count": os.cpu_count(), "workers": args.workers, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""Нагрузочный прогон всех маршрутов main.py в одном процессе.
+
+Запуск:
+    python benchmarks/routes.py [--users 50] [--saved 200] [--tips 1000]
+                                [--clients 20] [--requests 200]
+                                [--output result.json]
+                                [--baseline benchmarks/baseline.json] [--save-baseline]
+
+Создаёт временную базу с N пользователями, M сохранёнными паролями у
+каждого, историей тренажёра и K советами - через методы Database, как в
+работе, поэтому агрегаты статистики заполнены. Все пользователи прогона -
+администраторы (ADMIN_EMAILS), чтобы мерить и /api/admin/*. Гоняет
+настоящее ASGI-приложение через httpx без сети и печатает JSON с
+пропускной способностью и p50/p95/p99 по каждому сценарию. С --baseline
+сравнивает с сохранённым результатом и завершается с кодом 1, если
+какой-то сценарий стал медленнее больше чем на --tolerance.
+
+Цифры зависят от машины: baseline.json нужно пересобирать (--save-baseline)
+на той же машине, где потом проверяются регрессии.
+"""
+import os, sys, time, json, random, asyncio, argparse, itertools, tempfile, datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+PASSWORD = "Bench#Pass123"
+SEARCH_WORDS = ["пароль", "надежный", "менеджер", "2FA", "смена", "личной"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--saved", type=int, default=200, help="saved passwords per user")
+    parser.add_argument("--tips", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=20, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per scenario")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4,
+                        help="KDF cost for the run (login cost is benchmarked by benchmarks/hashing.py)")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed p95/throughput regression")
+    return parser.parse_args()
+
+
+def seed(db, users, saved, password_hash):
+    """Заполняем базу пачками через Database: вместе с данными обновляются агрегаты статистики"""
+    now = datetime.datetime.utcnow()
+    db.insert_users_many([(f"bench{i}", f"bench{i}@example.com", password_hash, "", now.isoformat())
+                          for i in range(users)])
+    user_ids = [db.get_user_by_email(f"bench{i}@example.com")["id"] for i in range(users)]
+    question_ids = json.dumps([q["id"] for q in db.get_trainer_questions()][:10])
+    attempts = []
+    for user_id in user_ids:
+        db.insert_saved_passwords_many(user_id, [
+            (f"Saved#{user_id}x{j}", random.choice([20, 40, 60, 80, 100]),
+             (now - datetime.timedelta(minutes=j)).isoformat())
+            for j in range(saved)])
+        # История тренажёра за неделю - для trainer_daily и /api/trainer/attempts
+        for day in range(7):
+            finished = (now - datetime.timedelta(days=day)).isoformat()
+            score = random.randint(0, 10)
+            attempts.append((user_id, question_ids, json.dumps([0] * 10), score, 10, score >= 8, finished, finished))
+    db.insert_trainer_attempts(attempts)
+    return user_ids
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def ndjson(rows):
+    return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+async def trainer_submit(client, i):
+    """POST /api/trainer/submit: ответы на весь набор одним запросом.
+
+    Попытку перед сдачей начинает POST /api/trainer/start; в задержку этот
+    запрос не входит, в пропускную способность - входит.
+    """
+    response = await client.post("/api/trainer/start", json={})
+    answers = [(i + j) % 3 for j in range(len(response.json()["questions"]))]
+    start = time.perf_counter()
+    response = await client.post("/api/trainer/submit", json={"answers": answers})
+    return response, time.perf_counter() - start
+
+
+def scenarios(password_hash, user_ids):
+    """(имя, метод, путь, kwargs для httpx).
+
+    Путь и kwargs могут быть функциями от номера запроса. Метод может быть
+    async-функцией (клиент, номер) -> (ответ, секунды) - для сценариев с
+    состоянием.
+    """
+    imports = itertools.count()
+
+    def users_import(i):
+        n = next(imports)
+        rows = [{"name": f"Imported{n}x{j}", "email": f"imported{n}x{j}@example.com",
+                 "password_hash": password_hash} for j in range(10)]
+        return {"content": ndjson(rows), "headers": {"Content-Type": "application/x-ndjson"}}
+
+    saved_import = {"content": ndjson({"password": f"Imported#{j}pass"} for j in range(20)),
+                    "headers": {"Content-Type": "application/x-ndjson"}}
+    return [
+        ("GET /", "GET", "/", {}),
+        ("GET /login", "GET", "/login", {}),
+        ("GET /navigation", "GET", "/navigation", {}),
+        ("GET /profile", "GET", "/profile", {}),
+        ("GET /favorites", "GET", "/favorites", {}),
+        ("GET /info", "GET", "/info", {}),
+        ("GET /trainer", "GET", "/trainer", {}),
+        ("GET /check-password", "GET", "/check-password", {}),
+        ("GET /search?q=", "GET", lambda i: f"/search?q={SEARCH_WORDS[i % len(SEARCH_WORDS)]}", {}),
+        ("GET /api/tips", "GET", lambda i: f"/api/tips?q={SEARCH_WORDS[i % len(SEARCH_WORDS)]}", {}),
+        ("GET /api/progress", "GET", "/api/progress", {}),
+        ("POST /api/progress", "POST", "/api/progress", {"json": {"info_viewed": True, "trainer_score": 7}}),
+        ("POST /api/save-password", "POST", "/api/save-password", {"json": {"password": "New#Pass987", "score": 0}}),
+        ("GET /api/saved-passwords", "GET", "/api/saved-passwords", {}),
+        ("GET /api/saved-passwords/export", "GET", "/api/saved-passwords/export", {}),
+        ("POST /api/saved-passwords/import", "POST", "/api/saved-passwords/import", saved_import),
+        ("DELETE /api/saved-passwords/{id}", "DELETE", lambda i: f"/api/saved-passwords/{10 ** 9 + i}", {}),
+        ("POST /api/strength", "POST", "/api/strength",
+         {"json": {"passwords": [f"Cand#{i}pass" for i in range(100)]}}),
+        ("POST /api/check-breach", "POST", "/api/check-breach", {"json": {"password": "qwerty"}}),
+        ("POST /api/generate", "POST", "/api/generate", {"json": {"count": 10, "kind": "password", "length": 16}}),
+        ("POST /api/generate (passphrase)", "POST", "/api/generate",
+         {"json": {"count": 10, "kind": "passphrase", "words": 6}}),
+        ("GET /api/stats", "GET", "/api/stats", {}),
+        ("POST /api/trainer/start", "POST", "/api/trainer/start", {"json": {}}),
+        ("POST /api/trainer/submit", trainer_submit, None, {}),
+        ("GET /api/trainer/attempts", "GET", "/api/trainer/attempts", {}),
+        ("GET /api/admin/stats", "GET", "/api/admin/stats", {}),
+        ("GET /api/admin/jobs", "GET", "/api/admin/jobs", {}),
+        ("GET /api/admin/users/export", "GET", "/api/admin/users/export", {}),
+        ("POST /api/admin/users/import", "POST", "/api/admin/users/import", users_import),
+        ("GET /api/version", "GET", "/api/version", {}),
+        ("GET /health", "GET", "/health", {}),
+        ("GET /metrics", "GET", "/metrics", {}),
+        # Последним: задачи переоценки выполняются в фоне и мешали бы следующим сценариям
+        ("POST /api/admin/jobs/rescore", "POST", "/api/admin/jobs/rescore", {"json": {"user_id": user_ids[0]}}),
+    ]
+
+
+async def send(client, method, path, kwargs, i):
+    """Запрос сценария -> (ответ, секунды)"""
+    if callable(method):
+        return await method(client, i)
+    url = path(i) if callable(path) else path
+    start = time.perf_counter()
+    response = await client.request(method, url, **(kwargs(i) if callable(kwargs) else kwargs))
+    return response, time.perf_counter() - start
+
+
+async def run_scenario(clients, method, path, kwargs, total, warmup):
+    for i in range(warmup):
+        await send(clients[0], method, path, kwargs, i)
+
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker(client):
+        nonlocal errors
+        for i in counter:
+            response, elapsed = await send(client, method, path, kwargs, i)
+            latencies.append(elapsed)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(c) for c in clients))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+async def run(args):
+    import httpx
+    import main
+    from database import db
+    from hashing import password_hasher
+
+    db.setup()
+    for i in range(args.tips):
+        db.add_tip(f"Совет {i}: {random.choice(SEARCH_WORDS)}",
+                   f"Текст совета {i} про {random.choice(SEARCH_WORDS)} и безопасность", random.choice(
+                       ["basic", "storage", "advanced"]))
+    password_hash = password_hasher.hash(PASSWORD)
+    user_ids = seed(db, args.users, args.saved, password_hash)
+
+    transport = httpx.ASGITransport(app=main.app)
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        clients = [httpx.AsyncClient(transport=transport, base_url="http://bench") for _ in range(args.clients)]
+        try:
+            # Логин меряем отдельно: каждый клиент входит своим пользователем
+            login_latencies = []
+            start = time.perf_counter()
+            for i, client in enumerate(clients):
+                t = time.perf_counter()
+                r = await client.post("/login", data={"email": f"bench{i % args.users}@example.com",
+                                                      "password": PASSWORD})
+                login_latencies.append(time.perf_counter() - t)
+                if r.status_code != 302:
+                    raise RuntimeError(f"login failed for client {i}: {r.status_code}")
+            login_latencies.sort()
+            results["POST /login"] = {
+                "requests": len(clients),
+                "errors": 0,
+                "throughput_rps": round(len(clients) / (time.perf_counter() - start), 1),
+                "p50_ms": round(percentile(login_latencies, 50) * 1000, 3),
+                "p95_ms": round(percentile(login_latencies, 95) * 1000, 3),
+                "p99_ms": round(percentile(login_latencies, 99) * 1000, 3),
+            }
+
+            for name, method, path, kwargs in scenarios(password_hash, user_ids):
+                results[name] = await run_scenario(clients, method, path, kwargs, args.requests, args.warmup)
+        finally:
+            for client in clients:
+                await client.aclose()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно базового прогона"""
+    regressions = []
+    for name, base in baseline["results"].items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {current['p95_ms']} ms")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {current['throughput_rps']} rps")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    # Настройки должны попасть в окружение до импорта database/hashing
+    os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # Все клиенты приходят с одного адреса - лимит входа по IP здесь не нужен
+    os.environ.setdefault("LOGIN_IP_BURST", str(max(args.clients, 20) * 10))
+    os.environ.setdefault("ADMIN_EMAILS", ",".join(f"bench{i}@example.com" for i in range(args.users)))
+    random.seed(0)
+
+    results = asyncio.run(run(args))
+    report = {
+        "params": {k: getattr(args, k)
+                   for k in ("users", "saved", "tips", "clients", "requests", "warmup", "bcrypt_rounds")},
+        "time": datetime.datetime.now().isoformat(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    if args.save_baseline:
+        with open(args.baseline or BASELINE, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        return 0
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:", file=sys.stderr)
+            for line in regressions:
+                print("  " + line, file=sys.stderr)
+            return 1
+        print("No regressions against baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
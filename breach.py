@@ -0,0 +1,194 @@
+"""Индекс утёкших паролей (SHA-1) для проверки без обращения к внешним сервисам.
+
+Формат файла:
+    MAGIC (8 байт) | count (uint64) | offsets (65537 x uint32) | count x 20 байт SHA-1
+
+Записи отсортированы, offsets[p] - номер первой записи с двухбайтовым
+префиксом p, так что бинарный поиск идёт по ~count/65536 записям. Файл
+открывается через mmap: все воркеры uvicorn делят одни и те же страницы,
+а открытие индекса не зависит от его размера.
+
+Сборка из текстового дампа (одна строка - SHA-1 в hex, можно с ":count"
+как у HIBP, либо пароль открытым текстом):
+    python breach.py build dump.txt breach.idx
+Проверка:
+    python breach.py check breach.idx "P@ssw0rd"
+"""
+import os, sys, mmap, struct, hashlib, heapq, tempfile, argparse, time
+from array import array
+
+MAGIC = b"PWNIDX1\0"
+RECORD = 20
+PREFIXES = 65536
+HEADER = struct.Struct("<8sQ")
+OFFSETS_SIZE = (PREFIXES + 1) * 4
+DATA_START = HEADER.size + OFFSETS_SIZE
+CHUNK_RECORDS = 1000000
+
+BREACH_INDEX = os.environ.get("BREACH_INDEX", os.path.join(os.path.dirname(__file__), "breach.idx"))
+
+
+def sha1(password):
+    return hashlib.sha1(password.encode("utf-8")).digest()
+
+
+class BreachIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a breach index")
+        # Таблица смещений тоже читается прямо из mmap, без копии
+        self._offsets = memoryview(self._mm)[HEADER.size:DATA_START].cast("I")
+
+    def contains_sha1(self, digest):
+        prefix = (digest[0] << 8) | digest[1]
+        lo = self._offsets[prefix]
+        hi = self._offsets[prefix + 1]
+        mm = self._mm
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = DATA_START + mid * RECORD
+            record = mm[pos:pos + RECORD]
+            if record < digest:
+                lo = mid + 1
+            elif record > digest:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __contains__(self, password):
+        return self.contains_sha1(sha1(password))
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._offsets.release()
+        self._mm.close()
+
+
+def open_index(path=BREACH_INDEX):
+    """Индекс, если файл есть; иначе None (проверка утечек отключена)"""
+    if not os.path.exists(path):
+        return None
+    try:
+        return BreachIndex(path)
+    except (OSError, ValueError) as e:
+        print(f"Error opening breach index: {e}")
+        return None
+
+
+# === Сборка индекса ===
+def _parse_line(line):
+    line = line.strip()
+    if not line:
+        return None
+    candidate = line.split(":", 1)[0]
+    if len(candidate) == 40:
+        try:
+            return bytes.fromhex(candidate)
+        except ValueError:
+            pass
+    return sha1(line)
+
+
+def _write_run(records, tmpdir):
+    records.sort()
+    fd, path = tempfile.mkstemp(dir=tmpdir, suffix=".run")
+    with os.fdopen(fd, "wb") as f:
+        f.write(b"".join(records))
+    return path
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(RECORD * 4096)
+            if not block:
+                break
+            for i in range(0, len(block), RECORD):
+                yield block[i:i + RECORD]
+
+
+def build_index(src, dst, chunk_records=CHUNK_RECORDS):
+    """Внешняя сортировка дампа кусками по chunk_records записей и слияние в индекс"""
+    tmpdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(dst)))
+    runs = []
+    try:
+        records = []
+        with open(src, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                digest = _parse_line(line)
+                if digest is not None:
+                    records.append(digest)
+                if len(records) >= chunk_records:
+                    runs.append(_write_run(records, tmpdir))
+                    records = []
+        if records:
+            runs.append(_write_run(records, tmpdir))
+
+        counts = array("I", [0]) * PREFIXES
+        count = 0
+        tmp_dst = dst + ".tmp"
+        with open(tmp_dst, "wb") as out:
+            out.write(b"\0" * DATA_START)
+            previous = None
+            buffer = []
+            for record in heapq.merge(*(_read_run(r) for r in runs)):
+                if record == previous:
+                    continue
+                previous = record
+                buffer.append(record)
+                counts[(record[0] << 8) | record[1]] += 1
+                count += 1
+                if len(buffer) >= 4096:
+                    out.write(b"".join(buffer))
+                    buffer = []
+            out.write(b"".join(buffer))
+
+            offsets = array("I", [0]) * (PREFIXES + 1)
+            for p in range(PREFIXES):
+                offsets[p + 1] = offsets[p] + counts[p]
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, count))
+            out.write(offsets.tobytes())
+        os.replace(tmp_dst, dst)
+        return count
+    finally:
+        for r in runs:
+            os.remove(r)
+        os.rmdir(tmpdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Breached password index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build index from a text dump")
+    build.add_argument("src")
+    build.add_argument("dst", nargs="?", default=BREACH_INDEX)
+    check = sub.add_parser("check", help="check passwords against an index")
+    check.add_argument("index")
+    check.add_argument("passwords", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        count = build_index(args.src, args.dst)
+        print(f"{count} hashes written to {args.dst} in {time.perf_counter() - start:.1f}s")
+    else:
+        index = BreachIndex(args.index)
+        for password in args.passwords:
+            start = time.perf_counter()
+            found = password in index
+            elapsed = (time.perf_counter() - start) * 1e6
+            print(f"{password}: {'BREACHED' if found else 'not found'} ({elapsed:.1f} us)")
+        index.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""Массовый импорт и экспорт пользователей и сохранённых паролей.
+
+Запуск:
+    python bulk.py import-users users.csv
+    python bulk.py import-saved --email user@example.com passwords.ndjson
+    python bulk.py export-users [--format ndjson|csv] [-o users.ndjson]
+    python bulk.py export-saved --email user@example.com [--format csv] [-o saved.csv]
+
+Формат берётся из --format или расширения файла (.csv, иначе NDJSON).
+Строки читаются потоком и пишутся пачками по BULK_CHUNK: одна транзакция с
+executemany на пачку, пароли пачки хэшируются параллельно в пуле хэшера.
+Ошибочные строки попадают в отчёт с номером строки и не останавливают импорт.
+Те же функции использует HTTP API (/api/saved-passwords/import,
+/api/admin/users/import).
+"""
+import os, io, sys, csv, json, argparse, datetime
+
+from hashing import password_hasher
+from strength import score_password
+
+BULK_CHUNK = int(os.environ.get("BULK_CHUNK", "1000"))
+# Больше ошибок в отчёт не кладём, только считаем
+MAX_REPORTED_ERRORS = 1000
+
+USER_FIELDS = ("name", "email", "password_hash", "salt", "created_at")
+SAVED_FIELDS = ("id", "password_hash", "strength_score", "created_at")
+
+
+# === Чтение ===
+def detect_format(name=None, content_type=None, default="ndjson"):
+    """Формат по явному "csv"/"ndjson", имени файла или Content-Type"""
+    name = (name or "").lower()
+    if name == "csv" or name.endswith(".csv") or "csv" in (content_type or "").lower():
+        return "csv"
+    return default
+
+
+def read_rows(lines, fmt):
+    """Строки файла -> (номер строки, dict или ValueError)"""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield line_no, ValueError("expected a JSON object")
+            continue
+        yield line_no, row
+
+
+def _chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _field(row, name):
+    value = row.get(name)
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def _password(row, name):
+    # Пробелы в пароле значимы, не обрезаем
+    value = row.get(name)
+    return "" if value is None else str(value)
+
+
+def _created_at(row):
+    value = _field(row, "created_at")
+    if not value:
+        return datetime.datetime.utcnow().isoformat()
+    datetime.datetime.fromisoformat(value)  # ValueError -> ошибка строки
+    return value
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": str(message)})
+
+    def to_dict(self):
+        return {"imported": self.imported, "failed": self.failed,
+                "errors": sorted(self.errors, key=lambda e: e["line"])}
+
+
+# === Импорт ===
+def _clean_user(row):
+    """Строка файла -> (name, email, password или None, готовый хэш или None, salt, created_at)"""
+    name, email = _field(row, "name"), _field(row, "email")
+    if not name:
+        raise ValueError("name is required")
+    if "@" not in email or "." not in email:
+        raise ValueError("invalid email")
+    password, password_hash = _password(row, "password") or None, _field(row, "password_hash") or None
+    if password is None and password_hash is None:
+        raise ValueError("password or password_hash is required")
+    if password is None and not password_hasher.is_known(password_hash):
+        raise ValueError("unsupported password_hash format")
+    return name, email, password, password_hash, _field(row, "salt"), _created_at(row)
+
+
+def import_users(database, rows, chunk_size=BULK_CHUNK):
+    """Импорт пользователей; email, которые уже есть в базе или в файле, - ошибки строк"""
+    report = ImportReport()
+    seen = set()
+    for chunk in _chunks(rows, chunk_size):
+        valid = []
+        for line, row in chunk:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                user = _clean_user(row)
+            except ValueError as e:
+                report.error(line, e)
+                continue
+            if user[1] in seen:
+                report.error(line, "duplicate email in file")
+                continue
+            seen.add(user[1])
+            valid.append((line, user))
+
+        # Уже существующих отсеиваем до хэширования - оно самое дорогое
+        existing = database.existing_emails([user[1] for _, user in valid])
+        for line, user in valid:
+            if user[1] in existing:
+                report.error(line, "user already exists")
+        valid = [(line, user) for line, user in valid if user[1] not in existing]
+
+        # Хэшируем только открытые пароли, готовые хэши переносим как есть
+        plain = [i for i, (_, user) in enumerate(valid) if user[3] is None]
+        hashes = password_hasher.hash_many([valid[i][1][2] for i in plain])
+        hashed = dict(zip(plain, hashes))
+        records = []
+        for i, (_, (name, email, _, password_hash, salt, created_at)) in enumerate(valid):
+            if i in hashed:
+                password_hash, salt = hashed[i], ""
+            records.append((name, email, password_hash, salt, created_at))
+
+        try:
+            existing = database.insert_users_many(records)
+        except Exception as e:
+            print(f"Error importing users: {e}")
+            for line, _ in valid:
+                report.error(line, "database error")
+            continue
+        for line, user in valid:
+            # Мог появиться между проверкой и вставкой
+            if user[1] in existing:
+                report.error(line, "user already exists")
+            else:
+                report.imported += 1
+    return report
+
+
+def _clean_saved(row):
+    password = _password(row, "password") or _password(row, "password_hash")
+    if not password:
+        raise ValueError("password is required")
+    score = _field(row, "strength_score")
+    score = int(score) if score else score_password(password)["score"]
+    if not 0 <= score <= 100:
+        raise ValueError("strength_score must be 0-100")
+    return password, score, _created_at(row)
+
+
+def import_saved_passwords(database, user_id, rows, chunk_size=BULK_CHUNK):
+    report = ImportReport()
+    for chunk in _chunks(rows, chunk_size):
+        valid = []
+        for line, row in chunk:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                valid.append((line, _clean_saved(row)))
+            except ValueError as e:
+                report.error(line, e)
+        try:
+            report.imported += database.insert_saved_passwords_many(user_id, [saved for _, saved in valid])
+        except Exception as e:
+            print(f"Error importing saved passwords: {e}")
+            for line, _ in valid:
+                report.error(line, "database error")
+    return report
+
+
+# === Экспорт ===
+def header(fmt, fields):
+    """Первая строка выгрузки (только для CSV)"""
+    return format_row({f: f for f in fields}, "csv", fields) if fmt == "csv" else ""
+
+
+def format_row(row, fmt, fields):
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerow([row.get(f, "") for f in fields])
+        return buf.getvalue()
+    return json.dumps({f: row.get(f) for f in fields}, ensure_ascii=False) + "\n"
+
+
+def media_type(fmt):
+    return "text/csv" if fmt == "csv" else "application/x-ndjson"
+
+
+# === CLI ===
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("import-users", "import-saved"):
+        cmd = sub.add_parser(name)
+        cmd.add_argument("file", help="CSV or NDJSON file, '-' for stdin")
+        cmd.add_argument("--format", choices=("csv", "ndjson"))
+        cmd.add_argument("--chunk", type=int, default=BULK_CHUNK)
+        if name == "import-saved":
+            cmd.add_argument("--email", required=True, help="owner of the saved passwords")
+    for name in ("export-users", "export-saved"):
+        cmd = sub.add_parser(name)
+        cmd.add_argument("--format", choices=("csv", "ndjson"), default="ndjson")
+        cmd.add_argument("-o", "--output", help="file (stdout by default)")
+        if name == "export-saved":
+            cmd.add_argument("--email", required=True)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    from database import db
+    db.setup()
+
+    user = None
+    if args.command in ("import-saved", "export-saved"):
+        user = db.get_user_by_email(args.email)
+        if user is None:
+            print(f"User not found: {args.email}", file=sys.stderr)
+            return 1
+
+    if args.command.startswith("import"):
+        fmt = args.format or detect_format(args.file)
+        stream = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8-sig", newline="")
+        try:
+            rows = read_rows(stream, fmt)
+            if args.command == "import-users":
+                report = import_users(db, rows, args.chunk)
+            else:
+                report = import_saved_passwords(db, user["id"], rows, args.chunk)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            password_hasher.shutdown()
+        print(json.dumps(report.to_dict(), indent=2, ensure_ascii=False))
+        return 0 if report.failed == 0 else 1
+
+    if args.command == "export-users":
+        rows, fields = db.iter_users(), USER_FIELDS
+    else:
+        rows, fields = db.iter_saved_passwords(user["id"]), SAVED_FIELDS
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        out.write(header(args.format, fields))
+        for row in rows:
+            out.write(format_row(row, args.format, fields))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
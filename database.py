@@ -1,71 +1,569 @@
-import sqlite3, os, hashlib, secrets, datetime, json
+import sqlite3, os, datetime, json, threading, queue, time, asyncio, base64
+from contextlib import contextmanager, asynccontextmanager
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "app.db")
+import aiosqlite
 
+from cache import TTLCache
+from hashing import password_hasher
+from textsearch import stem_text, match_query
+from metrics import instrument_queries
+from migrations import MIGRATIONS, migrate, full_scans
+from stats import SITE_STATS, STATS_TREND_DAYS, strength_deltas, trainer_results, trend_since, summarize
 
-def _hash_password(password: str, salt: str) -> str:
-    return hashlib.sha256((salt + password).encode("utf-8")).hexdigest()
+DB_PATH = os.environ.get("DB_PATH", os.path.join(os.path.dirname(__file__), "app.db"))
+# postgresql+psycopg://... - PostgreSQL (storage.py), sqlite:///path - SQLite по другому пути
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+PAGE_SIZE = 50
+EXPORT_BATCH = 500
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "60"))
 
+# Кэш пользователей по id, общий для Database и AsyncDatabase
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
 
-class Database:
-    def __init__(self, path=DB_PATH):
+
+def invalidate_user(tag):
+    """Любое изменение строки users (тег "user:<id>") сбрасывает пользователя из кэша"""
+    if tag.startswith("user:"):
+        user_cache.invalidate(int(tag[len("user:"):]))
+
+
+# Подписчики на изменения данных (кэш страниц и т.п.), вызываются с тегом изменения
+# после commit: "tips", "saved:<user_id>", "user:<user_id>", "trainer:<user_id>".
+# Кэш пользователей - первым: перерендер страницы не должен взять из него старую строку
+change_listeners = [invalidate_user]
+
+
+def notify_change(tag):
+    for listener in change_listeners:
+        try:
+            listener(tag)
+        except Exception as e:
+            print(f"Error in change listener: {e}")
+
+
+def encode_cursor(row):
+    """Курсор keyset-пагинации: (created_at, id) последней выданной строки"""
+    raw = json.dumps([row["created_at"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """ValueError, если курсор не выдан encode_cursor (испорчен или подделан)"""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(created_at, str):
+            raise TypeError("created_at must be a string")
+        return created_at, int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def _saved_passwords_sql(user_id, limit=None, cursor=None):
+    """Выборка по индексу (user_id, created_at, id) - без сортировки и сканирования"""
+    sql = """SELECT id, password_hash, strength_score, created_at 
+             FROM saved_passwords 
+             WHERE user_id = ?"""
+    params = [user_id]
+    if cursor:
+        sql += " AND (created_at, id) < (?, ?)"
+        params.extend(decode_cursor(cursor))
+    sql += " ORDER BY created_at DESC, id DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def _page(rows, limit):
+    """Отрезаем лишнюю строку, запрошенную для проверки следующей страницы"""
+    rows = [dict(row) for row in rows]
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"passwords": rows[:limit], "next_cursor": next_cursor}
+
+
+# Запросы Database и AsyncDatabase - одни и те же строки для обоих классов (и обоих
+# диалектов): RETURNING вместо lastrowid и ON CONFLICT вместо IntegrityError
+_INSERT_USER = """INSERT INTO users (name, email, password_hash, salt, created_at)
+                  VALUES (?, ?, ?, ?, ?) ON CONFLICT (email) DO NOTHING"""
+_CREATE_USER = _INSERT_USER + " RETURNING id"
+_USER_BY_EMAIL_SQL = "SELECT * FROM users WHERE email = ?"
+_USER_BY_ID_SQL = "SELECT * FROM users WHERE id = ?"
+_UPDATE_HASH = "UPDATE users SET password_hash = ?, salt = '' WHERE id = ?"
+# Отложенный перехэш - только если хэш в базе не сменился с момента входа
+_REHASH = "UPDATE users SET password_hash = ?, salt = '' WHERE id = ? AND password_hash = ? RETURNING id"
+_LIST_USERS_SQL = "SELECT id, name, email, created_at FROM users ORDER BY id DESC"
+
+_INSERT_SAVED = """INSERT INTO saved_passwords (user_id, password_hash, strength_score, created_at)
+                   VALUES (?, ?, ?, ?)"""
+_DELETE_SAVED = """DELETE FROM saved_passwords WHERE id = ? AND user_id = ?
+                   RETURNING strength_score, created_at"""
+_PROGRESS_SQL = "SELECT * FROM user_progress WHERE user_id = ?"
+
+_INSERT_TIP = "INSERT INTO password_tips (title, content, category) VALUES (?, ?, ?) RETURNING id"
+_UPDATE_TIP = "UPDATE password_tips SET title = ?, content = ?, category = ? WHERE id = ?"
+_DELETE_TIP = "DELETE FROM password_tips WHERE id = ?"
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+def _existing_emails_sql(emails):
+    return f"SELECT email FROM users WHERE email IN ({','.join('?' * len(emails))})", list(emails)
+
+
+def _users_batch_sql(after_id, limit):
+    """Выгрузка пользователей по первичному ключу (keyset), с хэшами для переноса"""
+    return ("SELECT id, name, email, password_hash, salt, created_at FROM users "
+            "WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+
+
+_PROGRESS_UPSERT = """INSERT INTO user_progress
+    (user_id, info_viewed, trainer_score, trainer_passed, password_checked, last_activity)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        info_viewed = COALESCE(excluded.info_viewed, user_progress.info_viewed),
+        trainer_score = COALESCE(excluded.trainer_score, user_progress.trainer_score),
+        trainer_passed = COALESCE(excluded.trainer_passed, user_progress.trainer_passed),
+        password_checked = COALESCE(excluded.password_checked, user_progress.password_checked),
+        last_activity = COALESCE(excluded.last_activity, user_progress.last_activity)"""
+
+
+def _progress_params(batch):
+    """{user_id: изменения} -> параметры UPSERT; отсутствующие поля не трогаются (NULL)"""
+    return [(user_id, patch.get("info_viewed"), patch.get("trainer_score"), patch.get("trainer_passed"),
+             patch.get("password_checked"), patch.get("last_activity"))
+            for user_id, patch in batch.items()]
+
+
+def _progress_from_row(row):
+    progress = {}
+    for key in ("info_viewed", "trainer_passed", "password_checked"):
+        if row[key] is not None:
+            progress[key] = bool(row[key])
+    if row["trainer_score"] is not None:
+        progress["trainer_score"] = row["trainer_score"]
+    progress["last_activity"] = row["last_activity"]
+    return progress
+
+
+# Агрегаты статистики (stats.py): приращения count/score_sum, для удаления - отрицательные
+_HISTOGRAM_UPSERT = """INSERT INTO strength_histogram (user_id, score, count) VALUES (?, ?, ?)
+    ON CONFLICT (user_id, score) DO UPDATE SET count = strength_histogram.count + excluded.count"""
+_DAILY_UPSERT = """INSERT INTO strength_daily (user_id, day, count, score_sum) VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        count = strength_daily.count + excluded.count,
+        score_sum = strength_daily.score_sum + excluded.score_sum"""
+_TRAINER_UPSERT = """INSERT INTO trainer_daily (user_id, day, results, passed, score_sum, best_score)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        results = trainer_daily.results + excluded.results,
+        passed = trainer_daily.passed + excluded.passed,
+        score_sum = trainer_daily.score_sum + excluded.score_sum,
+        best_score = CASE WHEN excluded.best_score > trainer_daily.best_score
+                          THEN excluded.best_score ELSE trainer_daily.best_score END"""
+
+
+def _trainer_tags(batch):
+    return [f"trainer:{user_id}" for user_id, patch in batch.items() if "trainer_score" in patch]
+
+
+def _attempt_tags(rows):
+    return [f"trainer:{row[0]}" for row in rows]
+
+
+# Версии тегов изменений - в той же транзакции, что и сами данные, чтобы кэш
+# страниц в других процессах (render_cache, RENDER_CACHE_VERSIONS=db) увидел их сразу
+_BUMP_VERSION = """INSERT INTO cache_versions (tag, version) VALUES (?, 1)
+    ON CONFLICT (tag) DO UPDATE SET version = cache_versions.version + 1"""
+
+
+def _bump_params(tags):
+    # Сортировка - параллельные транзакции берут блокировки строк в одном порядке
+    return [(tag,) for tag in sorted(set(tags))]
+
+
+def _cache_versions_sql(tags):
+    return f"SELECT tag, version FROM cache_versions WHERE tag IN ({','.join('?' * len(tags))})", list(tags)
+
+
+_HISTOGRAM_SQL = "SELECT score, count FROM strength_histogram WHERE user_id = ? ORDER BY score"
+_STRENGTH_TREND_SQL = """SELECT day, count, score_sum FROM strength_daily
+                         WHERE user_id = ? AND day >= ? ORDER BY day"""
+_TRAINER_TREND_SQL = """SELECT day, results, passed, score_sum, best_score FROM trainer_daily
+                        WHERE user_id = ? AND day >= ? ORDER BY day"""
+# Сводка по сайту: шарды (stats.site_shard) и строка SITE_STATS складываются
+_SITE_HISTOGRAM_SQL = """SELECT score, SUM(count) FROM strength_histogram
+                         WHERE user_id <= ? GROUP BY score ORDER BY score"""
+_SITE_STRENGTH_TREND_SQL = """SELECT day, SUM(count), SUM(score_sum) FROM strength_daily
+                              WHERE user_id <= ? AND day >= ? GROUP BY day ORDER BY day"""
+
+
+def _strength_stats_sql(user_id):
+    if user_id == SITE_STATS:
+        return _SITE_HISTOGRAM_SQL, _SITE_STRENGTH_TREND_SQL
+    return _HISTOGRAM_SQL, _STRENGTH_TREND_SQL
+
+
+_TRAINER_QUESTIONS_SQL = "SELECT id, question, options, correct FROM trainer_questions WHERE active ORDER BY id"
+_INSERT_ATTEMPT = """INSERT INTO trainer_attempts
+    (user_id, question_ids, answers, score, total, passed, started_at, finished_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+# Незавершённые попытки (trainer.py): state - JSON с вопросами набора. Попытка
+# сдаётся одним запросом, DELETE ... RETURNING делает сдачу одноразовой: повтор
+# того же запроса или старой cookie попытку уже не найдёт
+_INSERT_TRAINER_SESSION = "INSERT INTO trainer_sessions (id, user_id, state, created_at) VALUES (?, ?, ?, ?)"
+_DELETE_USER_TRAINER_SESSIONS = "DELETE FROM trainer_sessions WHERE user_id = ?"
+_DELETE_EXPIRED_TRAINER_SESSIONS = "DELETE FROM trainer_sessions WHERE created_at < ?"
+_FINISH_TRAINER_SESSION = """DELETE FROM trainer_sessions WHERE id = ? AND user_id = ? AND created_at >= ?
+    RETURNING state"""
+
+
+def _trainer_attempts_sql(user_id, limit):
+    return ("""SELECT id, question_ids, answers, score, total, passed, started_at, finished_at
+               FROM trainer_attempts WHERE user_id = ?
+               ORDER BY finished_at DESC, id DESC LIMIT ?""", (user_id, limit))
+
+
+def _question_from_row(row):
+    return {"id": row["id"], "question": row["question"], "options": json.loads(row["options"]),
+            "correct": row["correct"]}
+
+
+def _attempt_from_row(row):
+    attempt = dict(row)
+    attempt["question_ids"] = json.loads(attempt["question_ids"])
+    attempt["answers"] = json.loads(attempt["answers"])
+    attempt["passed"] = bool(attempt["passed"])
+    return attempt
+
+
+# Фоновые задачи (jobs.py): захват готовых и брошенных (аренда истекла) задач.
+# Повторная проверка статуса во внешнем WHERE - чтобы в PostgreSQL два
+# процесса не забрали одну задачу: второй перечитает строку после блокировки.
+_CLAIM_JOB_TASKS = """UPDATE job_tasks SET status = 'running', attempts = attempts + 1, lease_until = ?
+    WHERE id IN (SELECT id FROM job_tasks
+                 WHERE (status = 'pending' AND run_after <= ?) OR (status = 'running' AND lease_until < ?)
+                 ORDER BY id LIMIT ?)
+      AND (status = 'pending' OR lease_until < ?)
+    RETURNING id, name, payload, attempts"""
+_INSERT_JOB_TASK = """INSERT INTO job_tasks (name, payload, run_after, created_at)
+                      VALUES (?, ?, ?, ?) RETURNING id"""
+_COMPLETE_JOB_TASK = "DELETE FROM job_tasks WHERE id = ?"
+_FAIL_JOB_TASK = "UPDATE job_tasks SET status = 'failed', lease_until = NULL, error = ? WHERE id = ?"
+_RETRY_JOB_TASK = "UPDATE job_tasks SET status = 'pending', lease_until = NULL, error = ?, run_after = ? WHERE id = ?"
+# Возвращённая задача не начиналась: попытку, засчитанную при захвате, отменяем
+_RELEASE_JOB_TASK = """UPDATE job_tasks SET status = 'pending', lease_until = NULL, attempts = attempts - 1
+    WHERE id = ? AND status = 'running'"""
+_JOB_TASK_COUNTS_SQL = "SELECT status, COUNT(*) FROM job_tasks GROUP BY status"
+_INSERT_AUDIT = "INSERT INTO audit_log (created_at, user_id, event, ip, detail) VALUES (?, ?, ?, ?, ?)"
+_UPDATE_SCORE = """UPDATE saved_passwords SET strength_score = ?
+                   WHERE id = ? AND user_id = ? AND strength_score = ? RETURNING id"""
+
+
+def _claim_params(limit, now, lease_until):
+    return lease_until, now, now, limit, now
+
+
+def _fail_job_sql(task_id, error, run_after):
+    """run_after=None - окончательный отказ, иначе повтор после run_after"""
+    if run_after is None:
+        return _FAIL_JOB_TASK, (error, task_id)
+    return _RETRY_JOB_TASK, (error, run_after, task_id)
+
+
+def _audit_params(user_id, event, ip, detail):
+    return _now(), user_id, event, ip, json.dumps(detail, ensure_ascii=False) if detail else None
+
+
+def _score_deltas(updated):
+    """Переоценённые строки (старая, новая, created_at) -> строки агрегатов на вычитание и добавление"""
+    return [(old, created_at) for old, _, created_at in updated], [(new, created_at) for _, new, created_at in updated]
+
+
+# Вопросы тренажёра по умолчанию (раньше - массив pool в script.js): (вопрос, варианты, номер верного)
+DEFAULT_TRAINER_QUESTIONS = [
+    ("Выберите самый надёжный пароль", ["123456", "qwerty", "M#9k!2zL@7pT"], 2),
+    ("Выберите самый лёгкий пароль", ["P@ssw0rd123", "admin", "S!lverM00n!"], 1),
+    ("Какой пароль самый надёжный?", ["1q2w3e", "K@9b*L3!nV", "password"], 1),
+    ("Выберите ненадёжный пароль", ["LetMeIn", "H#2rL!xT7z", "Dr@gon$5"], 0),
+    ("Выберите надёжный пароль", ["Qwerty", "123456789", "B$7k@L9#tM"], 2),
+    ("Какой пароль слабый?", ["G@laxy$4P", "sunshine", "N0va!xT#3"], 1),
+    ("Выберите надёжный пароль", ["Football1", "Z@p!rK#7qP", "111111"], 1),
+    ("Какой пароль небезопасный?", ["AaBbCc", "Strong#Pass9!", "MyCat123"], 0),
+    ("Выберите сильный пароль", ["X#9tR$8v!", "welcome", "Password1"], 0),
+    ("Выберите слабый пароль", ["R@nd0mP@ss", "monkey", "Star$5Sky"], 1),
+]
+
+
+_TIP_CATEGORIES_SQL = "SELECT DISTINCT category FROM password_tips WHERE category IS NOT NULL"
+
+
+def _search_tips_sql(query, category, limit):
+    """SQL поиска советов: FTS5 с ранжированием BM25, без запроса - просто последние"""
+    params = []
+    match = match_query(query)
+    if match:
+        # Совпадение в заголовке весит вдвое больше, чем в тексте
+        sql = """SELECT t.id, t.title, t.content, t.category
+                 FROM password_tips_fts
+                 JOIN password_tips t ON t.id = password_tips_fts.rowid
+                 WHERE password_tips_fts MATCH ?"""
+        params.append(match)
+        order = "bm25(password_tips_fts, 2.0, 1.0)"
+    else:
+        sql = """SELECT t.id, t.title, t.content, t.category
+                 FROM password_tips t
+                 WHERE 1=1"""
+        if query:
+            # В запросе нет ни одного слова - ищем подстроку как раньше
+            sql += " AND (t.title LIKE ? OR t.content LIKE ?)"
+            params.extend([f"%{query}%", f"%{query}%"])
+        order = "t.id DESC"
+
+    if category:
+        sql += " AND t.category = ?"
+        params.append(category)
+
+    sql += f" ORDER BY {order} LIMIT ?"
+    params.append(limit)
+    return sql, params
+
+
+def _hot_queries():
+    """Запросы обработчиков для проверки EXPLAIN QUERY PLAN (migrations.py check).
+
+    Последние советы без фильтров сюда не входят: это проход по rowid с LIMIT,
+    он читает только LIMIT строк.
+    """
+    cursor = encode_cursor({"created_at": "9999", "id": 0})
+    return {
+        "get_saved_passwords": _saved_passwords_sql(1, PAGE_SIZE),
+        "get_saved_passwords (next page)": _saved_passwords_sql(1, PAGE_SIZE, cursor),
+        "search_tips (query)": _search_tips_sql("пароль", None, 20),
+        "search_tips (category)": _search_tips_sql(None, "basic", 20),
+        "search_tips (query + category)": _search_tips_sql("пароль", "basic", 20),
+        "get_tip_categories": (_TIP_CATEGORIES_SQL, ()),
+        "existing_emails": _existing_emails_sql(["a@example.com"]),
+        "iter_users": _users_batch_sql(0, EXPORT_BATCH),
+        "get_stats (histogram)": (_HISTOGRAM_SQL, (1,)),
+        "get_stats (trend)": (_STRENGTH_TREND_SQL, (1, "2024-01-01")),
+        "get_stats (trainer)": (_TRAINER_TREND_SQL, (1, "2024-01-01")),
+        "get_stats (site histogram)": (_SITE_HISTOGRAM_SQL, (SITE_STATS,)),
+        "get_stats (site trend)": (_SITE_STRENGTH_TREND_SQL, (SITE_STATS, "2024-01-01")),
+        "get_trainer_attempts": _trainer_attempts_sql(1, 20),
+        "claim_job_tasks": (_CLAIM_JOB_TASKS, _claim_params(10, 0.0, 300.0)),
+        "get_cache_versions": _cache_versions_sql(["user:1", "saved:1", "trainer:1"]),
+    }
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Пул соединений SQLite: каждый запрос/поток получает своё соединение и курсор"""
+    dialect = "sqlite"
+    migrations = MIGRATIONS
+
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
         self.path = path
-        self.conn = sqlite3.connect(self.path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.cur = self.conn.cursor()
-        self._ensure_tables()
-        self._ensure_default_data()
-
-    def _ensure_tables(self):
-        # Таблица пользователей
-        self.cur.execute("""CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL UNIQUE,
-            password_hash TEXT NOT NULL,
-            salt TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        )""")
-
-        # Таблица сохраненных паролей
-        self.cur.execute("""CREATE TABLE IF NOT EXISTS saved_passwords (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            password_hash TEXT NOT NULL,
-            strength_score INTEGER,
-            created_at TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-        )""")
-
-        # Таблица советов по паролям
-        self.cur.execute("""CREATE TABLE IF NOT EXISTS password_tips (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            category TEXT
-        )""")
-
-        self.conn.commit()
-
-    def _ensure_default_data(self):
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        # Метрики пула
+        self.checkouts = 0
+        self.in_use = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Нужна триггерам полнотекстового индекса советов
+        conn.create_function("ru_stem", 1, stem_text, deterministic=True)
+        return conn
+
+    def acquire(self):
+        start = time.perf_counter()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise PoolTimeout(f"No free connection in {self.timeout}s (pool size {self.size})")
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self.in_use -= 1
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def begin_exclusive(self, cur):
+        """Транзакция, которую другие процессы ждут целиком (setup)"""
+        cur.execute("BEGIN IMMEDIATE")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self.in_use,
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+                "wait_avg_ms": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = self.in_use
+
+
+def open_pool(url, path, size=POOL_SIZE):
+    """Пул соединений по DATABASE_URL; без него - SQLite по пути path"""
+    if url.startswith("postgresql"):
+        from storage import PostgresPool
+        return PostgresPool(url, size=size, timeout=POOL_TIMEOUT)
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):]
+    elif url:
+        raise ValueError(f"Unsupported DATABASE_URL: {url}")
+    return ConnectionPool(path, size=size)
+
+
+class Database:
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE, url=DATABASE_URL):
+        self.pool = open_pool(url, path, pool_size)
+        self.path = getattr(self.pool, "path", None) or self.pool.url
+        if self.pool.dialect == "postgresql":
+            from storage import pg_search_tips_sql
+            self._search_tips_sql = pg_search_tips_sql
+        else:
+            self._search_tips_sql = _search_tips_sql
+
+    def setup(self):
+        """Миграции схемы и начальные данные. Не вызывается при импорте: запускается
+        один раз перед стартом воркеров (run.py) или в lifespan приложения.
+
+        Всё выполняется в одной транзакции под блокировкой (BEGIN IMMEDIATE в
+        SQLite, advisory lock в PostgreSQL), поэтому одновременный запуск из
+        нескольких процессов безопасен - второй дождётся первого и ничего не
+        сделает. Возвращает номера применённых миграций.
+        """
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                self.pool.begin_exclusive(cur)
+                applied = migrate(cur, self.pool.migrations)
+                self._ensure_default_data(cur)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+        if applied:
+            for problem in self.check_query_plans():
+                print(f"Warning: full table scan in {problem}")
+        return applied
+
+    def check_query_plans(self):
+        """Горячие запросы, которые читают таблицу целиком (пустой список - всё по индексам)"""
+        if self.pool.dialect != "sqlite":
+            # EXPLAIN QUERY PLAN есть только в SQLite
+            return []
+        with self._cursor() as cur:
+            return full_scans(cur, _hot_queries())
+
+    @contextmanager
+    def _cursor(self, tags=None):
+        """Курсор на соединении из пула; commit при успешном выходе.
+
+        tags - теги изменённых данных (список можно дополнять внутри блока):
+        их версии растут в этой же транзакции, после commit вызывается notify_change.
+        """
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                yield cur
+                if tags:
+                    cur.executemany(_BUMP_VERSION, _bump_params(tags))
+                conn.commit()
+            finally:
+                cur.close()
+        for tag in tags or ():
+            notify_change(tag)
+
+    def _ensure_default_data(self, cur):
         # Проверяем тестового пользователя
         default_email = "admin@example.com"
         default_password = "TestPass123!"
         default_name = "Admin"
 
-        self.cur.execute("SELECT id FROM users WHERE email = ?", (default_email,))
-        if not self.cur.fetchone():
-            salt = secrets.token_hex(16)
-            password_hash = _hash_password(default_password, salt)
-            self.cur.execute("""INSERT INTO users (name, email, password_hash, salt, created_at) 
-                              VALUES (?, ?, ?, ?, ?)""",
-                             (default_name, default_email, password_hash, salt,
-                              datetime.datetime.utcnow().isoformat()))
-            self.conn.commit()
+        cur.execute("SELECT id FROM users WHERE email = ?", (default_email,))
+        if not cur.fetchone():
+            password_hash = password_hasher.hash(default_password)
+            cur.execute("""INSERT INTO users (name, email, password_hash, salt, created_at) 
+                          VALUES (?, ?, ?, ?, ?)""",
+                        (default_name, default_email, password_hash, "",
+                         datetime.datetime.utcnow().isoformat()))
 
         # Проверяем наличие советов
-        self.cur.execute("SELECT COUNT(*) FROM password_tips")
-        if self.cur.fetchone()[0] == 0:
+        cur.execute("SELECT COUNT(*) FROM password_tips")
+        if cur.fetchone()[0] == 0:
             tips = [
                 ("Как создать надежный пароль",
                  "Используйте комбинацию букв, цифр и специальных символов. Минимальная длина - 12 символов.",
@@ -83,136 +581,894 @@ class Database:
                  "Не используйте имена, даты рождения, номера телефонов в паролях.",
                  "basic")
             ]
-            self.cur.executemany("""INSERT INTO password_tips (title, content, category) 
-                                  VALUES (?, ?, ?)""", tips)
-            self.conn.commit()
+            cur.executemany("""INSERT INTO password_tips (title, content, category) 
+                              VALUES (?, ?, ?)""", tips)
+
+        # Вопросы тренажёра
+        cur.execute("SELECT COUNT(*) FROM trainer_questions")
+        if cur.fetchone()[0] == 0:
+            cur.executemany("INSERT INTO trainer_questions (question, options, correct) VALUES (?, ?, ?)",
+                            [(q, json.dumps(options, ensure_ascii=False), correct)
+                             for q, options, correct in DEFAULT_TRAINER_QUESTIONS])
 
     # === Пользователи ===
     def create_user(self, name, email, password):
         try:
-            salt = secrets.token_hex(16)
-            password_hash = _hash_password(password, salt)
-            created_at = datetime.datetime.utcnow().isoformat()
-
-            self.cur.execute("""INSERT INTO users (name, email, password_hash, salt, created_at) 
-                              VALUES (?, ?, ?, ?, ?)""",
-                             (name, email, password_hash, salt, created_at))
-            self.conn.commit()
-            return True
+            # Соль хранится внутри хэша (bcrypt/scrypt), колонка salt нужна только старым строкам
+            password_hash = password_hasher.hash(password)
+            tags = []
+            with self._cursor(tags) as cur:
+                cur.execute(_CREATE_USER, (name, email, password_hash, "", _now()))
+                rows = cur.fetchall()
+                if rows:
+                    tags.append(f"user:{rows[0][0]}")
+            return bool(rows)
         except sqlite3.IntegrityError:
             return False
 
     def get_user_by_email(self, email):
-        self.cur.execute("SELECT * FROM users WHERE email = ?", (email,))
-        row = self.cur.fetchone()
+        with self._cursor() as cur:
+            cur.execute(_USER_BY_EMAIL_SQL, (email,))
+            row = cur.fetchone()
         if row:
             return dict(row)
         return None
 
     def get_user_by_id(self, user_id):
-        self.cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-        row = self.cur.fetchone()
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+        with self._cursor() as cur:
+            cur.execute(_USER_BY_ID_SQL, (user_id,))
+            row = cur.fetchone()
         if row:
-            return dict(row)
+            user = dict(row)
+            user_cache.set(user_id, user)
+            return user
         return None
 
-    def verify_user(self, email, password):
+    def verify_user(self, email, password, rehash=True):
         user = self.get_user_by_email(email)
         if not user:
+            # Та же работа хэшера, что и для существующего email (см. PasswordHasher.dummy_hash)
+            return password_hasher.verify_dummy(password) or None
+        if not password_hasher.verify(password, user["password_hash"], user["salt"]):
             return None
-        salt = user["salt"]
-        if _hash_password(password, salt) == user["password_hash"]:
-            return user
-        return None
+        if rehash and password_hasher.needs_rehash(user["password_hash"]):
+            self._update_password_hash(user, password_hasher.hash(password))
+        return user
+
+    def rehash_password(self, user_id, old_hash, password_hash):
+        """Запись нового хэша (задача rehash_password): только если хэш в базе не сменился"""
+        with self._cursor([f"user:{user_id}"]) as cur:
+            cur.execute(_REHASH, (password_hash, user_id, old_hash))
+            updated = bool(cur.fetchall())
+        return updated
+
+    def _update_password_hash(self, user, password_hash):
+        """Прозрачный перехэш при входе (старый SHA-256 или другая стоимость)"""
+        with self._cursor([f"user:{user['id']}"]) as cur:
+            cur.execute(_UPDATE_HASH, (password_hash, user["id"]))
+        user["password_hash"] = password_hash
+        user["salt"] = ""
 
     # === Сохраненные пароли ===
     def save_password(self, user_id, password, strength_score):
         try:
             # Для демо сохраняем пароль как есть (в реальном приложении нужно хэшировать!)
-            created_at = datetime.datetime.utcnow().isoformat()
-
-            self.cur.execute("""INSERT INTO saved_passwords 
-                              (user_id, password_hash, strength_score, created_at)
-                              VALUES (?, ?, ?, ?)""",
-                             (user_id, password, strength_score, created_at))
-            self.conn.commit()
+            created_at = _now()
+            with self._cursor([f"saved:{user_id}"]) as cur:
+                cur.execute(_INSERT_SAVED, (user_id, password, strength_score, created_at))
+                self._update_strength_stats(cur, user_id, [(strength_score, created_at)])
             return True
         except Exception as e:
             print(f"Error saving password: {e}")
             return False
 
-    def get_saved_passwords(self, user_id, limit=None):
+    def get_saved_passwords(self, user_id, limit=None, cursor=None):
         try:
-            query = """SELECT id, password_hash, strength_score, created_at 
-                      FROM saved_passwords 
-                      WHERE user_id = ? 
-                      ORDER BY created_at DESC"""
-
-            if limit:
-                query += " LIMIT ?"
-                self.cur.execute(query, (user_id, limit))
-            else:
-                self.cur.execute(query, (user_id,))
-
-            rows = self.cur.fetchall()
+            query, params = _saved_passwords_sql(user_id, limit, cursor)
+            with self._cursor() as cur:
+                cur.execute(query, params)
+                rows = cur.fetchall()
             return [dict(row) for row in rows]
         except Exception as e:
             print(f"Error getting saved passwords: {e}")
             return []
 
+    def get_saved_passwords_page(self, user_id, limit=PAGE_SIZE, cursor=None):
+        """Страница сохранённых паролей и курсор следующей (None - страниц больше нет)"""
+        query, params = _saved_passwords_sql(user_id, limit + 1, cursor)
+        with self._cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+        return _page(rows, limit)
+
+    def iter_saved_passwords(self, user_id, batch_size=EXPORT_BATCH):
+        """Все сохранённые пароли пачками, соединение не держится между пачками"""
+        cursor = None
+        while True:
+            page = self.get_saved_passwords_page(user_id, batch_size, cursor)
+            yield from page["passwords"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+    # === Массовый импорт / экспорт ===
+    def existing_emails(self, emails):
+        if not emails:
+            return set()
+        with self._cursor() as cur:
+            cur.execute(*_existing_emails_sql(emails))
+            return {row[0] for row in cur.fetchall()}
+
+    def insert_users_many(self, rows):
+        """Пачка (name, email, password_hash, salt, created_at) одной транзакцией.
+
+        Возвращает множество email, которые уже были в базе и не вставлены.
+        """
+        if not rows:
+            return set()
+        with self._cursor() as cur:
+            cur.execute(*_existing_emails_sql([row[1] for row in rows]))
+            existing = {row[0] for row in cur.fetchall()}
+            cur.executemany(_INSERT_USER, [row for row in rows if row[1] not in existing])
+        return existing
+
+    def insert_saved_passwords_many(self, user_id, rows):
+        """Пачка (password, strength_score, created_at) одной транзакцией"""
+        if not rows:
+            return 0
+        with self._cursor([f"saved:{user_id}"]) as cur:
+            cur.executemany(_INSERT_SAVED, [(user_id, *row) for row in rows])
+            self._update_strength_stats(cur, user_id, [(score, created_at) for _, score, created_at in rows])
+        return len(rows)
+
+    def _users_batch(self, after_id, batch_size):
+        with self._cursor() as cur:
+            cur.execute(*_users_batch_sql(after_id, batch_size))
+            return [dict(row) for row in cur.fetchall()]
+
+    def iter_users(self, batch_size=EXPORT_BATCH):
+        after_id = 0
+        while True:
+            rows = self._users_batch(after_id, batch_size)
+            yield from rows
+            if len(rows) < batch_size:
+                break
+            after_id = rows[-1]["id"]
+
     def delete_saved_password(self, password_id, user_id):
         try:
-            self.cur.execute("""DELETE FROM saved_passwords 
-                              WHERE id = ? AND user_id = ?""",
-                             (password_id, user_id))
-            self.conn.commit()
-            return self.cur.rowcount > 0
+            tags = []
+            with self._cursor(tags) as cur:
+                cur.execute(_DELETE_SAVED, (password_id, user_id))
+                rows = [(row[0], row[1]) for row in cur.fetchall()]
+                if rows:
+                    self._update_strength_stats(cur, user_id, rows, sign=-1)
+                    tags.append(f"saved:{user_id}")
+            return bool(rows)
         except Exception as e:
             print(f"Error deleting password: {e}")
             return False
 
+    # === Прогресс ===
+    def get_progress(self, user_id):
+        with self._cursor() as cur:
+            cur.execute(_PROGRESS_SQL, (user_id,))
+            row = cur.fetchone()
+        return _progress_from_row(row) if row else None
+
+    def save_progress_many(self, batch):
+        """Пакетная запись прогресса {user_id: изменения} одной транзакцией"""
+        with self._cursor(_trainer_tags(batch)) as cur:
+            cur.executemany(_PROGRESS_UPSERT, _progress_params(batch))
+
+    # === Статистика ===
+    def _update_strength_stats(self, cur, user_id, rows, sign=1):
+        """Агрегаты оценок в транзакции изменения saved_passwords: rows - (оценка, created_at).
+        Сводка сайта - в шард пользователя (stats.site_shard), а не в одну общую строку"""
+        histogram, daily = strength_deltas(user_id, rows, sign)
+        if histogram:
+            cur.executemany(_HISTOGRAM_UPSERT, histogram)
+        if daily:
+            cur.executemany(_DAILY_UPSERT, daily)
+
+    def get_stats(self, user_id, days=STATS_TREND_DAYS):
+        """Сводка по агрегатам (stats.summarize); user_id = stats.SITE_STATS - по всему сайту"""
+        since = trend_since(days)
+        histogram_sql, trend_sql = _strength_stats_sql(user_id)
+        with self._cursor() as cur:
+            cur.execute(histogram_sql, (user_id,))
+            histogram = cur.fetchall()
+            cur.execute(trend_sql, (user_id, since))
+            daily = cur.fetchall()
+            cur.execute(_TRAINER_TREND_SQL, (user_id, since))
+            trainer = cur.fetchall()
+        return summarize(histogram, daily, trainer, days)
+
+    # === Тренажёр ===
+    def get_trainer_questions(self):
+        """Активные вопросы с правильными ответами - для пула в памяти (trainer.QuestionPool)"""
+        with self._cursor() as cur:
+            cur.execute(_TRAINER_QUESTIONS_SQL)
+            return [_question_from_row(row) for row in cur.fetchall()]
+
+    def insert_trainer_attempts(self, rows):
+        """Пачка завершённых попыток (trainer.attempt_row) и агрегаты trainer_daily одной транзакцией"""
+        if not rows:
+            return 0
+        with self._cursor(_attempt_tags(rows)) as cur:
+            cur.executemany(_INSERT_ATTEMPT, rows)
+            cur.executemany(_TRAINER_UPSERT, trainer_results(rows))
+        return len(rows)
+
+    def get_trainer_attempts(self, user_id, limit=20):
+        with self._cursor() as cur:
+            cur.execute(*_trainer_attempts_sql(user_id, limit))
+            return [_attempt_from_row(row) for row in cur.fetchall()]
+
+    def create_trainer_session(self, session_id, user_id, state, expired_before):
+        """Новая попытка пользователя вместо прежней; заодно чистим брошенные попытки"""
+        with self._cursor() as cur:
+            cur.execute(_DELETE_USER_TRAINER_SESSIONS, (user_id,))
+            cur.execute(_DELETE_EXPIRED_TRAINER_SESSIONS, (expired_before,))
+            cur.execute(_INSERT_TRAINER_SESSION, (session_id, user_id, state, time.time()))
+
+    def finish_trainer_session(self, session_id, user_id, expired_before):
+        """Сдача попытки: удаляем её и возвращаем state (JSON-строку); None - её нет или уже сдана"""
+        with self._cursor() as cur:
+            cur.execute(_FINISH_TRAINER_SESSION, (session_id, user_id, expired_before))
+            rows = cur.fetchall()
+        return rows[0][0] if rows else None
+
+    # === Фоновые задачи ===
+    def enqueue_job_task(self, name, payload, run_after):
+        """Долговечная задача (payload - JSON-строка); возвращает её id"""
+        with self._cursor() as cur:
+            cur.execute(_INSERT_JOB_TASK, (name, payload, run_after, _now()))
+            return cur.fetchall()[0][0]
+
+    def claim_job_tasks(self, limit, now, lease_until):
+        with self._cursor() as cur:
+            cur.execute(_CLAIM_JOB_TASKS, _claim_params(limit, now, lease_until))
+            return [dict(row) for row in cur.fetchall()]
+
+    def complete_job_task(self, task_id):
+        with self._cursor() as cur:
+            cur.execute(_COMPLETE_JOB_TASK, (task_id,))
+
+    def fail_job_task(self, task_id, error, run_after=None):
+        """Ошибка задачи: повтор после run_after или окончательный статус failed (run_after=None)"""
+        with self._cursor() as cur:
+            cur.execute(*_fail_job_sql(task_id, error, run_after))
+
+    def release_job_tasks(self, task_ids):
+        """Вернуть захваченные, но не начатые задачи (остановка, переполненная очередь)"""
+        with self._cursor() as cur:
+            cur.executemany(_RELEASE_JOB_TASK, [(task_id,) for task_id in task_ids])
+
+    def job_task_counts(self):
+        with self._cursor() as cur:
+            cur.execute(_JOB_TASK_COUNTS_SQL)
+            return {row[0]: row[1] for row in cur.fetchall()}
+
+    def insert_audit_event(self, user_id, event, ip=None, detail=None):
+        with self._cursor() as cur:
+            cur.execute(_INSERT_AUDIT, _audit_params(user_id, event, ip, detail))
+
+    def update_strength_scores(self, user_id, changes):
+        """Новые оценки сохранённых паролей: changes - (id, старая оценка, новая, created_at).
+
+        Строка меняется, только если оценка в базе всё ещё старая (пароль не
+        удалён и не переоценён параллельно); агрегаты статистики правятся
+        только по изменённым строкам. Возвращает число изменённых.
+        """
+        updated = []
+        tags = []
+        with self._cursor(tags) as cur:
+            for password_id, old, new, created_at in changes:
+                cur.execute(_UPDATE_SCORE, (new, password_id, user_id, old))
+                if cur.fetchall():
+                    updated.append((old, new, created_at))
+            if updated:
+                removed, added = _score_deltas(updated)
+                self._update_strength_stats(cur, user_id, removed, sign=-1)
+                self._update_strength_stats(cur, user_id, added)
+                tags.append(f"saved:{user_id}")
+        return len(updated)
+
+    # === Кэш страниц ===
+    def get_cache_versions(self, tags):
+        """{тег: версия} для render_cache; тегов, которые ещё не менялись, в ответе нет"""
+        if not tags:
+            return {}
+        with self._cursor() as cur:
+            cur.execute(*_cache_versions_sql(tags))
+            return {row[0]: row[1] for row in cur.fetchall()}
+
     # === Советы по паролям ===
     def search_tips(self, query=None, category=None, limit=20):
         try:
-            conditions = []
-            params = []
+            query_sql, params = self._search_tips_sql(query, category, limit)
+            with self._cursor() as cur:
+                cur.execute(query_sql, params)
+                rows = cur.fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            print(f"Error searching tips: {e}")
+            return []
+
+    def add_tip(self, title, content, category=None):
+        with self._cursor(["tips"]) as cur:
+            cur.execute(_INSERT_TIP, (title, content, category))
+            tip_id = cur.fetchall()[0][0]
+        return tip_id
+
+    def update_tip(self, tip_id, title, content, category=None):
+        tags = []
+        with self._cursor(tags) as cur:
+            cur.execute(_UPDATE_TIP, (title, content, category, tip_id))
+            changed = cur.rowcount > 0
+            if changed:
+                tags.append("tips")
+        return changed
+
+    def delete_tip(self, tip_id):
+        tags = []
+        with self._cursor(tags) as cur:
+            cur.execute(_DELETE_TIP, (tip_id,))
+            changed = cur.rowcount > 0
+            if changed:
+                tags.append("tips")
+        return changed
+
+    def get_tip_categories(self):
+        try:
+            with self._cursor() as cur:
+                cur.execute(_TIP_CATEGORIES_SQL)
+                rows = cur.fetchall()
+            return [row[0] for row in rows]
+        except Exception as e:
+            print(f"Error getting categories: {e}")
+            return []
+
+    def list_users(self):
+        with self._cursor() as cur:
+            cur.execute(_LIST_USERS_SQL)
+            return [dict(r) for r in cur.fetchall()]
+
+    def ping(self):
+        """Время обращения к базе (SELECT 1) в миллисекундах"""
+        start = time.perf_counter()
+        with self._cursor() as cur:
+            cur.execute("SELECT 1")
+            cur.fetchone()
+        return round((time.perf_counter() - start) * 1000, 3)
+
+    def close(self):
+        self.pool.close()
+
+
+class AsyncConnectionPool:
+    """Асинхронный пул соединений aiosqlite (без занятия потоков threadpool)"""
+
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._sem = None
+        # Метрики пула
+        self.checkouts = 0
+        self.in_use = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.path, timeout=self.timeout)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.create_function("ru_stem", 1, stem_text, deterministic=True)
+        return conn
+
+    async def acquire(self):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.size)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeout(f"No free connection in {self.timeout}s (pool size {self.size})")
+        try:
+            conn = self._idle.pop() if self._idle else await self._connect()
+        except Exception:
+            self._sem.release()
+            raise
+
+        waited = time.perf_counter() - start
+        self.checkouts += 1
+        self.in_use += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        return conn
+
+    async def release(self, conn):
+        if conn.in_transaction:
+            await conn.rollback()
+        self.in_use -= 1
+        self._idle.append(conn)
+        self._sem.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "idle": len(self._idle),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_total_ms": round(self.wait_total * 1000, 3),
+            "wait_avg_ms": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+    async def close(self):
+        while self._idle:
+            await self._idle.pop().close()
+
+
+class AsyncDatabase:
+    """Асинхронный аналог Database для обработчиков FastAPI.
+
+    Таблицы и начальные данные создаёт синхронный Database, здесь только запросы.
+    Тексты запросов и разбор строк общие с Database (константы и функции
+    модуля): новый запрос добавляется туда, а не в метод одного из классов.
+    """
+
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE):
+        self.path = path
+        self.pool = AsyncConnectionPool(self.path, size=pool_size)
+
+    @asynccontextmanager
+    async def _cursor(self, tags=None):
+        """Курсор на соединении из пула; commit при успешном выходе (tags - как в Database._cursor)"""
+        async with self.pool.connection() as conn:
+            cur = await conn.cursor()
+            try:
+                yield cur
+                if tags:
+                    await cur.executemany(_BUMP_VERSION, _bump_params(tags))
+                await conn.commit()
+            finally:
+                await cur.close()
+        for tag in tags or ():
+            notify_change(tag)
+
+    # === Пользователи ===
+    async def create_user(self, name, email, password):
+        try:
+            password_hash = await password_hasher.hash_async(password)
+            tags = []
+            async with self._cursor(tags) as cur:
+                await cur.execute(_CREATE_USER, (name, email, password_hash, "", _now()))
+                rows = await cur.fetchall()
+                if rows:
+                    tags.append(f"user:{rows[0][0]}")
+            return bool(rows)
+        except sqlite3.IntegrityError:
+            return False
+
+    async def get_user_by_email(self, email):
+        async with self._cursor() as cur:
+            await cur.execute(_USER_BY_EMAIL_SQL, (email,))
+            row = await cur.fetchone()
+        if row:
+            return dict(row)
+        return None
+
+    async def get_user_by_id(self, user_id):
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+        async with self._cursor() as cur:
+            await cur.execute(_USER_BY_ID_SQL, (user_id,))
+            row = await cur.fetchone()
+        if row:
+            user = dict(row)
+            user_cache.set(user_id, user)
+            return user
+        return None
+
+    async def verify_user(self, email, password, rehash=True):
+        user = await self.get_user_by_email(email)
+        if not user:
+            # Та же работа хэшера, что и для существующего email (см. PasswordHasher.dummy_hash)
+            return await password_hasher.verify_dummy_async(password) or None
+        if not await password_hasher.verify_async(password, user["password_hash"], user["salt"]):
+            return None
+        if rehash and password_hasher.needs_rehash(user["password_hash"]):
+            await self._update_password_hash(user, await password_hasher.hash_async(password))
+        return user
+
+    async def rehash_password(self, user_id, old_hash, password_hash):
+        """Запись нового хэша (задача rehash_password): только если хэш в базе не сменился"""
+        async with self._cursor([f"user:{user_id}"]) as cur:
+            await cur.execute(_REHASH, (password_hash, user_id, old_hash))
+            updated = bool(await cur.fetchall())
+        return updated
+
+    async def _update_password_hash(self, user, password_hash):
+        """Прозрачный перехэш при входе (старый SHA-256 или другая стоимость)"""
+        async with self._cursor([f"user:{user['id']}"]) as cur:
+            await cur.execute(_UPDATE_HASH, (password_hash, user["id"]))
+        user["password_hash"] = password_hash
+        user["salt"] = ""
+
+    # === Сохраненные пароли ===
+    async def save_password(self, user_id, password, strength_score):
+        try:
+            created_at = _now()
+            async with self._cursor([f"saved:{user_id}"]) as cur:
+                await cur.execute(_INSERT_SAVED, (user_id, password, strength_score, created_at))
+                await self._update_strength_stats(cur, user_id, [(strength_score, created_at)])
+            return True
+        except Exception as e:
+            print(f"Error saving password: {e}")
+            return False
+
+    async def get_saved_passwords(self, user_id, limit=None, cursor=None):
+        try:
+            query, params = _saved_passwords_sql(user_id, limit, cursor)
+            async with self._cursor() as cur:
+                await cur.execute(query, params)
+                rows = await cur.fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            print(f"Error getting saved passwords: {e}")
+            return []
+
+    async def get_saved_passwords_page(self, user_id, limit=PAGE_SIZE, cursor=None):
+        """Страница сохранённых паролей и курсор следующей (None - страниц больше нет)"""
+        query, params = _saved_passwords_sql(user_id, limit + 1, cursor)
+        async with self._cursor() as cur:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+        return _page(rows, limit)
+
+    async def iter_saved_passwords(self, user_id, batch_size=EXPORT_BATCH):
+        """Все сохранённые пароли пачками, соединение не держится между пачками"""
+        cursor = None
+        while True:
+            page = await self.get_saved_passwords_page(user_id, batch_size, cursor)
+            for row in page["passwords"]:
+                yield row
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+    # === Массовый импорт / экспорт ===
+    async def existing_emails(self, emails):
+        if not emails:
+            return set()
+        async with self._cursor() as cur:
+            await cur.execute(*_existing_emails_sql(emails))
+            return {row[0] for row in await cur.fetchall()}
+
+    async def insert_users_many(self, rows):
+        """Пачка (name, email, password_hash, salt, created_at) одной транзакцией.
+
+        Возвращает множество email, которые уже были в базе и не вставлены.
+        """
+        if not rows:
+            return set()
+        async with self._cursor() as cur:
+            await cur.execute(*_existing_emails_sql([row[1] for row in rows]))
+            existing = {row[0] for row in await cur.fetchall()}
+            await cur.executemany(_INSERT_USER, [row for row in rows if row[1] not in existing])
+        return existing
+
+    async def insert_saved_passwords_many(self, user_id, rows):
+        """Пачка (password, strength_score, created_at) одной транзакцией"""
+        if not rows:
+            return 0
+        async with self._cursor([f"saved:{user_id}"]) as cur:
+            await cur.executemany(_INSERT_SAVED, [(user_id, *row) for row in rows])
+            await self._update_strength_stats(cur, user_id, [(score, created_at) for _, score, created_at in rows])
+        return len(rows)
+
+    async def iter_users(self, batch_size=EXPORT_BATCH):
+        after_id = 0
+        while True:
+            async with self._cursor() as cur:
+                await cur.execute(*_users_batch_sql(after_id, batch_size))
+                rows = [dict(row) for row in await cur.fetchall()]
+            for row in rows:
+                yield row
+            if len(rows) < batch_size:
+                break
+            after_id = rows[-1]["id"]
+
+    async def delete_saved_password(self, password_id, user_id):
+        try:
+            tags = []
+            async with self._cursor(tags) as cur:
+                await cur.execute(_DELETE_SAVED, (password_id, user_id))
+                rows = [(row[0], row[1]) for row in await cur.fetchall()]
+                if rows:
+                    await self._update_strength_stats(cur, user_id, rows, sign=-1)
+                    tags.append(f"saved:{user_id}")
+            return bool(rows)
+        except Exception as e:
+            print(f"Error deleting password: {e}")
+            return False
+
+    # === Прогресс ===
+    async def get_progress(self, user_id):
+        async with self._cursor() as cur:
+            await cur.execute(_PROGRESS_SQL, (user_id,))
+            row = await cur.fetchone()
+        return _progress_from_row(row) if row else None
+
+    async def save_progress_many(self, batch):
+        """Пакетная запись прогресса {user_id: изменения} одной транзакцией"""
+        async with self._cursor(_trainer_tags(batch)) as cur:
+            await cur.executemany(_PROGRESS_UPSERT, _progress_params(batch))
+
+    # === Статистика ===
+    async def _update_strength_stats(self, cur, user_id, rows, sign=1):
+        """Агрегаты оценок в транзакции изменения saved_passwords: rows - (оценка, created_at).
+        Сводка сайта - в шард пользователя (stats.site_shard), а не в одну общую строку"""
+        histogram, daily = strength_deltas(user_id, rows, sign)
+        if histogram:
+            await cur.executemany(_HISTOGRAM_UPSERT, histogram)
+        if daily:
+            await cur.executemany(_DAILY_UPSERT, daily)
+
+    async def get_stats(self, user_id, days=STATS_TREND_DAYS):
+        """Сводка по агрегатам (stats.summarize); user_id = stats.SITE_STATS - по всему сайту"""
+        since = trend_since(days)
+        histogram_sql, trend_sql = _strength_stats_sql(user_id)
+        async with self._cursor() as cur:
+            await cur.execute(histogram_sql, (user_id,))
+            histogram = await cur.fetchall()
+            await cur.execute(trend_sql, (user_id, since))
+            daily = await cur.fetchall()
+            await cur.execute(_TRAINER_TREND_SQL, (user_id, since))
+            trainer = await cur.fetchall()
+        return summarize(histogram, daily, trainer, days)
+
+    # === Тренажёр ===
+    async def get_trainer_questions(self):
+        """Активные вопросы с правильными ответами - для пула в памяти (trainer.QuestionPool)"""
+        async with self._cursor() as cur:
+            await cur.execute(_TRAINER_QUESTIONS_SQL)
+            return [_question_from_row(row) for row in await cur.fetchall()]
+
+    async def insert_trainer_attempts(self, rows):
+        """Пачка завершённых попыток (trainer.attempt_row) и агрегаты trainer_daily одной транзакцией"""
+        if not rows:
+            return 0
+        async with self._cursor(_attempt_tags(rows)) as cur:
+            await cur.executemany(_INSERT_ATTEMPT, rows)
+            await cur.executemany(_TRAINER_UPSERT, trainer_results(rows))
+        return len(rows)
 
-            if query:
-                conditions.append("(title LIKE ? OR content LIKE ?)")
-                params.extend([f"%{query}%", f"%{query}%"])
+    async def get_trainer_attempts(self, user_id, limit=20):
+        async with self._cursor() as cur:
+            await cur.execute(*_trainer_attempts_sql(user_id, limit))
+            return [_attempt_from_row(row) for row in await cur.fetchall()]
 
-            if category:
-                conditions.append("category = ?")
-                params.append(category)
+    async def create_trainer_session(self, session_id, user_id, state, expired_before):
+        """Новая попытка пользователя вместо прежней; заодно чистим брошенные попытки"""
+        async with self._cursor() as cur:
+            await cur.execute(_DELETE_USER_TRAINER_SESSIONS, (user_id,))
+            await cur.execute(_DELETE_EXPIRED_TRAINER_SESSIONS, (expired_before,))
+            await cur.execute(_INSERT_TRAINER_SESSION, (session_id, user_id, state, time.time()))
 
-            where_clause = " AND ".join(conditions) if conditions else "1=1"
-            params.append(limit)
+    async def finish_trainer_session(self, session_id, user_id, expired_before):
+        """Сдача попытки: удаляем её и возвращаем state (JSON-строку); None - её нет или уже сдана"""
+        async with self._cursor() as cur:
+            await cur.execute(_FINISH_TRAINER_SESSION, (session_id, user_id, expired_before))
+            rows = await cur.fetchall()
+        return rows[0][0] if rows else None
 
-            query_sql = f"""SELECT id, title, content, category 
-                           FROM password_tips 
-                           WHERE {where_clause}
-                           ORDER BY id DESC 
-                           LIMIT ?"""
+    # === Фоновые задачи ===
+    async def enqueue_job_task(self, name, payload, run_after):
+        """Долговечная задача (payload - JSON-строка); возвращает её id"""
+        async with self._cursor() as cur:
+            await cur.execute(_INSERT_JOB_TASK, (name, payload, run_after, _now()))
+            return (await cur.fetchall())[0][0]
 
-            self.cur.execute(query_sql, params)
-            rows = self.cur.fetchall()
+    async def claim_job_tasks(self, limit, now, lease_until):
+        async with self._cursor() as cur:
+            await cur.execute(_CLAIM_JOB_TASKS, _claim_params(limit, now, lease_until))
+            return [dict(row) for row in await cur.fetchall()]
+
+    async def complete_job_task(self, task_id):
+        async with self._cursor() as cur:
+            await cur.execute(_COMPLETE_JOB_TASK, (task_id,))
+
+    async def fail_job_task(self, task_id, error, run_after=None):
+        """Ошибка задачи: повтор после run_after или окончательный статус failed (run_after=None)"""
+        async with self._cursor() as cur:
+            await cur.execute(*_fail_job_sql(task_id, error, run_after))
+
+    async def release_job_tasks(self, task_ids):
+        """Вернуть захваченные, но не начатые задачи (остановка, переполненная очередь)"""
+        async with self._cursor() as cur:
+            await cur.executemany(_RELEASE_JOB_TASK, [(task_id,) for task_id in task_ids])
+
+    async def job_task_counts(self):
+        async with self._cursor() as cur:
+            await cur.execute(_JOB_TASK_COUNTS_SQL)
+            return {row[0]: row[1] for row in await cur.fetchall()}
+
+    async def insert_audit_event(self, user_id, event, ip=None, detail=None):
+        async with self._cursor() as cur:
+            await cur.execute(_INSERT_AUDIT, _audit_params(user_id, event, ip, detail))
+
+    async def update_strength_scores(self, user_id, changes):
+        """Новые оценки сохранённых паролей: changes - (id, старая оценка, новая, created_at).
+
+        Строка меняется, только если оценка в базе всё ещё старая (пароль не
+        удалён и не переоценён параллельно); агрегаты статистики правятся
+        только по изменённым строкам. Возвращает число изменённых.
+        """
+        updated = []
+        tags = []
+        async with self._cursor(tags) as cur:
+            for password_id, old, new, created_at in changes:
+                await cur.execute(_UPDATE_SCORE, (new, password_id, user_id, old))
+                if await cur.fetchall():
+                    updated.append((old, new, created_at))
+            if updated:
+                removed, added = _score_deltas(updated)
+                await self._update_strength_stats(cur, user_id, removed, sign=-1)
+                await self._update_strength_stats(cur, user_id, added)
+                tags.append(f"saved:{user_id}")
+        return len(updated)
+
+    # === Кэш страниц ===
+    async def get_cache_versions(self, tags):
+        """{тег: версия} для render_cache; тегов, которые ещё не менялись, в ответе нет"""
+        if not tags:
+            return {}
+        async with self._cursor() as cur:
+            await cur.execute(*_cache_versions_sql(tags))
+            return {row[0]: row[1] for row in await cur.fetchall()}
+
+    # === Советы по паролям ===
+    async def search_tips(self, query=None, category=None, limit=20):
+        try:
+            query_sql, params = _search_tips_sql(query, category, limit)
+            async with self._cursor() as cur:
+                await cur.execute(query_sql, params)
+                rows = await cur.fetchall()
             return [dict(row) for row in rows]
         except Exception as e:
             print(f"Error searching tips: {e}")
             return []
 
-    def get_tip_categories(self):
+    async def add_tip(self, title, content, category=None):
+        async with self._cursor(["tips"]) as cur:
+            await cur.execute(_INSERT_TIP, (title, content, category))
+            tip_id = (await cur.fetchall())[0][0]
+        return tip_id
+
+    async def update_tip(self, tip_id, title, content, category=None):
+        tags = []
+        async with self._cursor(tags) as cur:
+            await cur.execute(_UPDATE_TIP, (title, content, category, tip_id))
+            changed = cur.rowcount > 0
+            if changed:
+                tags.append("tips")
+        return changed
+
+    async def delete_tip(self, tip_id):
+        tags = []
+        async with self._cursor(tags) as cur:
+            await cur.execute(_DELETE_TIP, (tip_id,))
+            changed = cur.rowcount > 0
+            if changed:
+                tags.append("tips")
+        return changed
+
+    async def get_tip_categories(self):
         try:
-            self.cur.execute("SELECT DISTINCT category FROM password_tips WHERE category IS NOT NULL")
-            rows = self.cur.fetchall()
+            async with self._cursor() as cur:
+                await cur.execute(_TIP_CATEGORIES_SQL)
+                rows = await cur.fetchall()
             return [row[0] for row in rows]
         except Exception as e:
             print(f"Error getting categories: {e}")
             return []
 
-    def list_users(self):
-        self.cur.execute("SELECT id, name, email, created_at FROM users ORDER BY id DESC")
-        return [dict(r) for r in self.cur.fetchall()]
+    async def list_users(self):
+        async with self._cursor() as cur:
+            await cur.execute(_LIST_USERS_SQL)
+            return [dict(r) for r in await cur.fetchall()]
+
+    async def ping(self):
+        """Время обращения к базе (SELECT 1) в миллисекундах"""
+        start = time.perf_counter()
+        async with self._cursor() as cur:
+            await cur.execute("SELECT 1")
+            await cur.fetchone()
+        return round((time.perf_counter() - start) * 1000, 3)
+
+    async def close(self):
+        await self.pool.close()
+
+
+class ThreadedAsyncDatabase:
+    """Интерфейс AsyncDatabase поверх синхронного Database: каждый вызов в пуле потоков.
+
+    Используется для backend-ов без асинхронного драйвера (PostgreSQL через
+    SQLAlchemy); время запросов пишется синхронным слоем.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.pool = database.pool
+
+    def __getattr__(self, name):
+        method = getattr(self.database, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    async def iter_saved_passwords(self, user_id, batch_size=EXPORT_BATCH):
+        cursor = None
+        while True:
+            page = await self.get_saved_passwords_page(user_id, batch_size, cursor)
+            for row in page["passwords"]:
+                yield row
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+    async def iter_users(self, batch_size=EXPORT_BATCH):
+        # Пачками по ключу, как в синхронном слое: таблица целиком в память не читается
+        after_id = 0
+        while True:
+            rows = await asyncio.to_thread(self.database._users_batch, after_id, batch_size)
+            for row in rows:
+                yield row
+            if len(rows) < batch_size:
+                break
+            after_id = rows[-1]["id"]
+
+
+# Только у синхронного Database: схема создаётся до старта приложения
+_SYNC_ONLY = {"setup", "check_query_plans"}
+
+
+def _public_methods(cls):
+    return {name for name, value in vars(cls).items() if callable(value) and not name.startswith("_")}
+
+
+_missing = _public_methods(Database) - _public_methods(AsyncDatabase) - _SYNC_ONLY
+if _missing:
+    raise TypeError(f"AsyncDatabase is missing Database methods: {', '.join(sorted(_missing))}")
 
+# Время каждого метода пишется в db_query_duration_seconds{layer, method}
+instrument_queries(Database, "sync")
+instrument_queries(AsyncDatabase, "async")
 
-db = Database()
\ No newline at end of file
+db = Database()
+# aiosqlite работает только с SQLite; для PostgreSQL асинхронный слой - потоки поверх db
+adb = AsyncDatabase(db.path) if db.pool.dialect == "sqlite" else ThreadedAsyncDatabase(db)
@@ -0,0 +1,214 @@
+"""Генерация паролей и парольных фраз на сервере (POST /api/generate).
+
+Случайные байты берутся из secrets.token_bytes блоками на всю пачку, а не по
+вызову на символ. В символы алфавита их переводит таблица bytes.translate
+(в C, без цикла в Python). Байты из хвоста 256 % len(alphabet) выбрасываются,
+поэтому символы равновероятны. Кандидат, не прошедший strength.password_errors
+(те же правила, что при регистрации), отбрасывается целиком. Недостающие
+классы не дописываются, и распределение остаётся равномерным по всем
+подходящим паролям.
+
+Парольная фраза (diceware) - слова из WORDLIST (EFF large wordlist, 7776 слов,
+CC BY 3.0, eff.org) с заглавной буквы через разделитель и цифра в конце:
+так фраза тоже проходит правила регистрации.
+
+Запуск (для скриптов заведения учётных записей):
+    python generator.py -n 100000 --length 16 > passwords.txt
+    python generator.py -n 10 --kind passphrase --words 6
+"""
+import os, sys, math, array, secrets, argparse, functools
+
+from strength import SPECIALS, MIN_LENGTH, password_errors
+
+WORDLIST = os.environ.get("WORDLIST", os.path.join(os.path.dirname(__file__), "wordlist.txt"))
+GENERATE_MAX = int(os.environ.get("GENERATE_MAX", "100000"))
+MAX_LENGTH = 128
+MAX_WORDS = 20
+# Символы, которые легко спутать при вводе с бумаги или экрана
+AMBIGUOUS = "0O1lI|"
+
+UPPER = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+LOWER = "abcdefghijklmnopqrstuvwxyz"
+DIGITS = "0123456789"
+
+
+# === Случайность ===
+@functools.lru_cache(maxsize=64)
+def _translate_table(alphabet):
+    """(таблица байт -> символ, выбрасываемые байты, доля принятых байт)"""
+    size = len(alphabet)
+    limit = 256 - 256 % size
+    table = bytes(ord(alphabet[b % size]) if b < limit else 0 for b in range(256))
+    return table, bytes(range(limit, 256)), limit / 256
+
+
+def random_chars(alphabet, count):
+    """count равновероятных символов ASCII-алфавита (не больше 256 символов)"""
+    table, rejected, accept = _translate_table(alphabet)
+    chunks, have = [], 0
+    while have < count:
+        # С небольшим запасом на выброшенные байты - обычно хватает одного вызова
+        raw = secrets.token_bytes(int((count - have) / accept) + 64)
+        chunk = raw.translate(table, rejected)
+        chunks.append(chunk)
+        have += len(chunk)
+    return b"".join(chunks)[:count].decode("ascii")
+
+
+def random_indexes(size, count):
+    """count равновероятных чисел 0..size-1 (size до 65536) из 16-битных блоков"""
+    limit = 65536 - 65536 % size
+    result = []
+    while len(result) < count:
+        need = count - len(result)
+        values = array.array("H", secrets.token_bytes(2 * (int(need * 65536 / limit) + 16)))
+        result.extend(v % size for v in values if v < limit)
+    return result[:count]
+
+
+@functools.lru_cache(maxsize=4)
+def load_wordlist(path=WORDLIST):
+    with open(path, encoding="utf-8") as f:
+        words = tuple(dict.fromkeys(line.strip() for line in f if line.strip()))
+    if len(words) < 2:
+        raise ValueError(f"Wordlist is too short: {path}")
+    return words
+
+
+# === Политики ===
+def alphabet_for(specials=SPECIALS, exclude_ambiguous=False):
+    if not specials or any(c not in SPECIALS for c in specials):
+        raise ValueError(f"specials must be a non-empty subset of {SPECIALS}")
+    alphabet = "".join(dict.fromkeys(UPPER + LOWER + DIGITS + specials))
+    if exclude_ambiguous:
+        alphabet = "".join(c for c in alphabet if c not in AMBIGUOUS)
+    return alphabet
+
+
+def parse_policy(data):
+    """JSON запроса -> (kind, count, параметры generate_*); ошибки - ValueError"""
+    kind = data.get("kind", "password")
+    count = data.get("count", 1)
+    if not isinstance(count, int) or not 1 <= count <= GENERATE_MAX:
+        raise ValueError(f"count must be 1-{GENERATE_MAX}")
+    if kind == "password":
+        length = data.get("length", 16)
+        if not isinstance(length, int) or not MIN_LENGTH <= length <= MAX_LENGTH:
+            raise ValueError(f"length must be {MIN_LENGTH}-{MAX_LENGTH}")
+        options = {
+            "length": length,
+            "specials": str(data.get("specials", SPECIALS)),
+            "exclude_ambiguous": bool(data.get("exclude_ambiguous", False)),
+        }
+    elif kind == "passphrase":
+        words = data.get("words", 6)
+        if not isinstance(words, int) or not 3 <= words <= MAX_WORDS:
+            raise ValueError(f"words must be 3-{MAX_WORDS}")
+        separator = str(data.get("separator", "-"))
+        if len(separator) > 3:
+            raise ValueError("separator is too long")
+        options = {"words": words, "separator": separator}
+    else:
+        raise ValueError("kind must be 'password' or 'passphrase'")
+    return kind, count, options
+
+
+# === Генерация ===
+def _check_policy(sample):
+    """Пример результата политики, в котором есть всё, что она может дать.
+
+    Если даже он не проходит правила регистрации, не пройдёт ни один кандидат -
+    отдаём нарушенные правила как ValueError, а не перебираем бесконечно.
+    """
+    errors = password_errors(sample)
+    if errors:
+        raise ValueError("; ".join(errors))
+
+
+def _collect(make_batch, count):
+    """Пачки кандидатов, пока не наберётся count прошедших правила регистрации"""
+    result = []
+    while len(result) < count:
+        need = count - len(result)
+        for candidate in make_batch(need + need // 2 + 16):
+            if not password_errors(candidate):
+                result.append(candidate)
+                if len(result) == count:
+                    break
+    return result
+
+
+def generate_passwords(count, length=16, specials=SPECIALS, exclude_ambiguous=False):
+    alphabet = alphabet_for(specials, exclude_ambiguous)
+    # По символу каждого класса, который есть в алфавите, и добивка до length
+    classes = [next(c for c in alphabet if c in chars) for chars in (UPPER, LOWER, DIGITS, SPECIALS)
+               if any(c in chars for c in alphabet)]
+    _check_policy("".join(classes).ljust(length, alphabet[0])[:length])
+
+    def batch(n):
+        chars = random_chars(alphabet, n * length)
+        return [chars[i:i + length] for i in range(0, len(chars), length)]
+
+    return _collect(batch, count)
+
+
+def generate_passphrases(count, words=6, separator="-", wordlist=WORDLIST):
+    vocabulary = load_wordlist(wordlist)
+    # Спецсимвол в фразе может дать только разделитель (слова из букв)
+    _check_policy(separator.join(["Word"] * words) + "7")
+
+    def batch(n):
+        indexes = random_indexes(len(vocabulary), n * words)
+        digits = random_chars(DIGITS, n)
+        return [separator.join(vocabulary[j].capitalize() for j in indexes[i * words:(i + 1) * words]) + digits[i]
+                for i in range(n)]
+
+    return _collect(batch, count)
+
+
+def entropy_bits(kind, options, wordlist=WORDLIST):
+    """Оценка энтропии одного результата (без поправки на отброшенных кандидатов)"""
+    if kind == "passphrase":
+        return round(options["words"] * math.log2(len(load_wordlist(wordlist))) + math.log2(10), 1)
+    alphabet = alphabet_for(options["specials"], options["exclude_ambiguous"])
+    return round(options["length"] * math.log2(len(alphabet)), 1)
+
+
+def generate(kind, count, options):
+    if kind == "passphrase":
+        return generate_passphrases(count, **options)
+    return generate_passwords(count, **options)
+
+
+# === CLI ===
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--count", type=int, default=1)
+    parser.add_argument("--kind", choices=("password", "passphrase"), default="password")
+    parser.add_argument("--length", type=int, default=16)
+    parser.add_argument("--specials", default=SPECIALS)
+    parser.add_argument("--exclude-ambiguous", action="store_true")
+    parser.add_argument("--words", type=int, default=6)
+    parser.add_argument("--separator", default="-")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    data = {"kind": args.kind, "count": args.count}
+    if args.kind == "password":
+        data.update(length=args.length, specials=args.specials, exclude_ambiguous=args.exclude_ambiguous)
+    else:
+        data.update(words=args.words, separator=args.separator)
+    try:
+        kind, count, options = parse_policy(data)
+        results = generate(kind, count, options)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    sys.stdout.write("\n".join(results) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
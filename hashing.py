@@ -0,0 +1,184 @@
+import os, hashlib, hmac, secrets, base64, asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "bcrypt")
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+SCRYPT_N = int(os.environ.get("SCRYPT_N", str(2 ** 15)))
+SCRYPT_R = int(os.environ.get("SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("SCRYPT_P", "1"))
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", str(os.cpu_count() or 1)))
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+# === Алгоритмы ===
+class BcryptHasher:
+    name = "bcrypt"
+
+    def __init__(self, rounds=BCRYPT_ROUNDS):
+        self.rounds = rounds
+
+    def identify(self, encoded):
+        return encoded.startswith(("$2b$", "$2a$", "$2y$"))
+
+    def _secret(self, password):
+        # bcrypt учитывает только первые 72 байта пароля
+        return password.encode("utf-8")[:72]
+
+    def hash(self, password):
+        return bcrypt.hashpw(self._secret(password), bcrypt.gensalt(self.rounds)).decode("ascii")
+
+    def verify(self, password, encoded, salt=None):
+        return bcrypt.checkpw(self._secret(password), encoded.encode("ascii"))
+
+    def needs_rehash(self, encoded):
+        return int(encoded.split("$")[2]) != self.rounds
+
+
+class ScryptHasher:
+    name = "scrypt"
+
+    def __init__(self, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def identify(self, encoded):
+        return encoded.startswith("scrypt$")
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+    def hash(self, password):
+        salt = secrets.token_bytes(16)
+        key = self._derive(password, salt, self.n, self.r, self.p)
+        return f"scrypt${self.n}${self.r}${self.p}${_b64(salt)}${_b64(key)}"
+
+    def verify(self, password, encoded, salt=None):
+        _, n, r, p, salt_b64, key_b64 = encoded.split("$")
+        key = self._derive(password, _unb64(salt_b64), int(n), int(r), int(p))
+        return hmac.compare_digest(key, _unb64(key_b64))
+
+    def needs_rehash(self, encoded):
+        _, n, r, p, _, _ = encoded.split("$")
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+
+class LegacySha256Hasher:
+    """Старые строки users: sha256(salt + password) с отдельной колонкой salt. Только проверка."""
+    name = "sha256"
+
+    def identify(self, encoded):
+        return len(encoded) == 64 and all(c in "0123456789abcdef" for c in encoded)
+
+    def hash(self, password):
+        raise NotImplementedError("SHA-256 hashes are verify-only")
+
+    def verify(self, password, encoded, salt=None):
+        digest = hashlib.sha256(((salt or "") + password).encode("utf-8")).hexdigest()
+        return hmac.compare_digest(digest, encoded)
+
+    def needs_rehash(self, encoded):
+        return True
+
+
+HASHERS = {"bcrypt": BcryptHasher, "scrypt": ScryptHasher}
+
+
+# === Менеджер хэширования ===
+class PasswordHasher:
+    """Хэширует новым алгоритмом, проверяет любым известным.
+
+    Тяжёлые вызовы выполняются в отдельном пуле потоков (bcrypt и scrypt
+    отпускают GIL), чтобы не блокировать цикл событий и threadpool FastAPI.
+    """
+
+    def __init__(self, hasher=None, workers=HASH_WORKERS):
+        self.hasher = hasher or HASHERS[PASSWORD_HASHER]()
+        self.known = [self.hasher, BcryptHasher(), ScryptHasher(), LegacySha256Hasher()]
+        self.workers = workers
+        self._executor = None
+        self._dummy_hash = None
+
+    def _find(self, encoded):
+        for hasher in self.known:
+            if hasher.identify(encoded):
+                return hasher
+        return None
+
+    def hash(self, password):
+        return self.hasher.hash(password)
+
+    def verify(self, password, encoded, salt=None):
+        hasher = self._find(encoded)
+        if hasher is None:
+            return False
+        try:
+            return hasher.verify(password, encoded, salt)
+        except ValueError:
+            return False
+
+    @property
+    def dummy_hash(self):
+        """Хэш случайного пароля текущим алгоритмом и стоимостью.
+
+        Проверка по нему при входе с неизвестным email занимает столько же,
+        сколько с известным: по времени ответа нельзя узнать, есть ли аккаунт.
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash(secrets.token_urlsafe(16))
+        return self._dummy_hash
+
+    def verify_dummy(self, password):
+        self.verify(password, self.dummy_hash)
+        return False
+
+    async def verify_dummy_async(self, password):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.verify_dummy, password)
+
+    def is_known(self, encoded):
+        """Хэш в формате, который мы умеем проверять (для импорта готовых хэшей)"""
+        return self._find(encoded) is not None
+
+    def needs_rehash(self, encoded):
+        hasher = self._find(encoded)
+        return hasher is None or hasher.name != self.hasher.name or hasher.needs_rehash(encoded)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hasher")
+        return self._executor
+
+    async def hash_async(self, password):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.hash, password)
+
+    def hash_many(self, passwords):
+        """Пачка хэшей параллельно на всех потоках пула (массовый импорт), порядок сохраняется"""
+        # Пул потоков, а не процессов: bcrypt и hashlib.scrypt считают хэш без GIL,
+        # так что потоки загружают все ядра так же, как процессы, но без запуска
+        # интерпретаторов и передачи паролей между процессами
+        return list(self.executor.map(self.hash, passwords))
+
+    async def verify_async(self, password, encoded, salt=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.verify, password, encoded, salt)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
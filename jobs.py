@@ -0,0 +1,343 @@
+"""Фоновые задачи: очередь в памяти с пулом воркеров и долговечная таблица job_tasks.
+
+Работа, без которой можно ответить на запрос (запись аудита, запись нового
+хэша пароля при входе, переоценка сохранённых паролей), уходит в JobQueue:
+
+    job_queue.submit_nowait("audit", {...})      # в память, без ожидания
+    await job_queue.submit("audit", {...})       # ждёт места в очереди не дольше timeout
+    await job_queue.enqueue("rescore_saved_passwords", {"user_id": 1})  # строка в job_tasks
+
+Очередь в памяти ограничена JOB_QUEUE_SIZE: при переполнении submit_nowait
+возвращает False, submit - JobQueueFull, запрос не ждёт бесконечно. Такие
+задачи теряются при падении процесса - для аудита и перехэша это допустимо.
+
+Долговечные задачи хранятся в job_tasks (SQLite или PostgreSQL) и переживают
+перезапуск. Опрос забирает готовые строки на JOB_LEASE секунд (аренда):
+задачу, чей воркер упал, после истечения аренды заберёт любой процесс.
+Пока задач нет, пауза между опросами растёт вдвое от JOB_POLL_INTERVAL до
+JOB_POLL_MAX_INTERVAL, чтобы простаивающий процесс не писал в базу каждую
+секунду. Задачу, поставленную этим же процессом, enqueue отдаёт опросу сразу;
+поставленную другим процессом (или отложенную) забирают не позже чем через
+JOB_POLL_MAX_INTERVAL. Ошибка - повтор с экспоненциальной задержкой от
+JOB_RETRY_DELAY, после JOB_MAX_ATTEMPTS попыток статус failed. Payload таких
+задач - JSON, поэтому секретов (паролей) в них нет.
+
+При остановке очередь перестаёт принимать задачи и до JOB_DRAIN_TIMEOUT секунд
+дорабатывает уже принятые; захваченные, но не начатые долговечные задачи
+возвращаются в pending.
+
+Метрики: job_wait_seconds (от постановки до начала), job_duration_seconds,
+jobs_total{name,status} и коллектор job_queue (глубина очереди, занятые воркеры).
+"""
+import os, json, time, asyncio
+
+from metrics import registry, Counter, Histogram
+from strength import score_passwords
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "1000"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", "5"))
+JOB_LEASE = float(os.environ.get("JOB_LEASE", "300"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+JOB_POLL_MAX_INTERVAL = float(os.environ.get("JOB_POLL_MAX_INTERVAL", "30"))
+JOB_DRAIN_TIMEOUT = float(os.environ.get("JOB_DRAIN_TIMEOUT", "10"))
+# Сохранённые пароли переоцениваются и обновляются пачками
+RESCORE_BATCH = int(os.environ.get("RESCORE_BATCH", "500"))
+
+job_wait = registry.register(Histogram(
+    "job_wait_seconds", "Time from job submission to start", ("name",)))
+job_duration = registry.register(Histogram(
+    "job_duration_seconds", "Job run time", ("name",)))
+jobs_total = registry.register(Counter(
+    "jobs_total", "Finished jobs by result", ("name", "status")))
+
+
+class JobQueueFull(Exception):
+    """Очередь заполнена или останавливается"""
+
+
+class Job:
+    __slots__ = ("name", "payload", "task_id", "attempts", "enqueued_at")
+
+    def __init__(self, name, payload, task_id=None, attempts=1, enqueued_at=None):
+        self.name = name
+        self.payload = payload
+        # id строки job_tasks; None - задача только в памяти
+        self.task_id = task_id
+        self.attempts = attempts
+        self.enqueued_at = time.time() if enqueued_at is None else enqueued_at
+
+
+def retry_delay(attempts):
+    return JOB_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+# === Очередь ===
+class JobQueue:
+    def __init__(self, adb, handlers=None, workers=JOB_WORKERS, maxsize=JOB_QUEUE_SIZE):
+        self.adb = adb
+        self.handlers = dict(HANDLERS if handlers is None else handlers)
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue = None
+        self._tasks = []
+        self._poller = None
+        self._wakeup = None
+        self._draining = False
+        # Захваченные из job_tasks, но ещё не завершённые
+        self._claimed = set()
+        # Метрики
+        self.busy = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.polls = 0
+        self.poll_interval = JOB_POLL_INTERVAL
+        # Захвачены из job_tasks, но не влезли в очередь
+        self.released = 0
+
+    def start(self):
+        self._queue = asyncio.Queue(self.maxsize)
+        self._wakeup = asyncio.Event()
+        self._draining = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self, timeout=JOB_DRAIN_TIMEOUT):
+        """Перестаём принимать задачи, дорабатываем очередь не дольше timeout"""
+        if self._queue is None:
+            return
+        self._draining = True
+        # Флаг, а не только cancel: wait_for может проглотить отмену, если событие
+        # сработало одновременно с ней, и опрос продолжился бы после остановки
+        self._wakeup.set()
+        self._poller.cancel()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Error draining job queue: {self._queue.qsize()} jobs left after {timeout}s")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(self._poller, *self._tasks, return_exceptions=True)
+        if self._claimed:
+            try:
+                await self.adb.release_job_tasks(sorted(self._claimed))
+            except Exception as e:
+                print(f"Error releasing job tasks: {e}")
+            self._claimed.clear()
+        self._queue = None
+        self._tasks = []
+
+    def submit_nowait(self, name, payload=None):
+        """Задача в память; False, если очередь заполнена или останавливается"""
+        if self._queue is None or self._draining:
+            self.rejected += 1
+            return False
+        try:
+            self._queue.put_nowait(Job(name, payload))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        return True
+
+    async def submit(self, name, payload=None, timeout=1.0):
+        """Задача в память с ожиданием места в очереди (обратное давление на вызывающего)"""
+        if self._queue is None or self._draining:
+            self.rejected += 1
+            raise JobQueueFull("Job queue is not accepting jobs")
+        try:
+            await asyncio.wait_for(self._queue.put(Job(name, payload)), timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise JobQueueFull(f"Job queue is full ({self.maxsize})") from None
+        self.submitted += 1
+
+    async def enqueue(self, name, payload=None, delay=0):
+        """Долговечная задача в job_tasks; выполнит её любой процесс. Возвращает id"""
+        if name not in self.handlers:
+            raise ValueError(f"Unknown job: {name}")
+        task_id = await self.adb.enqueue_job_task(name, json.dumps(payload), time.time() + delay)
+        if self._wakeup is not None and not delay:
+            self._wakeup.set()
+        return task_id
+
+    # === Воркеры ===
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self.busy += 1
+            try:
+                await self._run(job)
+            finally:
+                self.busy -= 1
+                self._queue.task_done()
+
+    async def _run(self, job):
+        handler = self.handlers.get(job.name)
+        started = time.time()
+        job_wait.observe(max(started - job.enqueued_at, 0.0), job.name)
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job: {job.name}")
+            await handler(self, job.payload)
+        except Exception as e:
+            job_duration.observe(time.time() - started, job.name)
+            await self._failed(job, f"{type(e).__name__}: {e}")
+            return
+        job_duration.observe(time.time() - started, job.name)
+        jobs_total.inc(job.name, "ok")
+        self.completed += 1
+        if job.task_id is not None:
+            try:
+                await self.adb.complete_job_task(job.task_id)
+            except Exception as e:
+                # Аренда истечёт, и задача выполнится повторно - обработчики это допускают
+                print(f"Error completing job {job.task_id}: {e}")
+            self._claimed.discard(job.task_id)
+
+    async def _failed(self, job, error):
+        print(f"Error in job {job.name}: {error}")
+        final = job.attempts >= JOB_MAX_ATTEMPTS
+        jobs_total.inc(job.name, "failed" if final else "retry")
+        if final:
+            self.failed += 1
+        else:
+            self.retried += 1
+        delay = retry_delay(job.attempts)
+        if job.task_id is not None:
+            try:
+                await self.adb.fail_job_task(job.task_id, error, None if final else time.time() + delay)
+            except Exception as e:
+                print(f"Error failing job {job.task_id}: {e}")
+            self._claimed.discard(job.task_id)
+        elif not final:
+            # Задача только в памяти: повтор тем же процессом, при остановке теряется
+            job.attempts += 1
+            asyncio.get_running_loop().call_later(delay, self._retry, job)
+
+    def _retry(self, job):
+        if self._queue is None or self._draining:
+            return
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+
+    # === Долговечные задачи ===
+    async def _poll(self):
+        interval = JOB_POLL_INTERVAL
+        while not self._draining:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+                # Задачу поставили здесь же - дальше опрашиваем часто
+                interval = JOB_POLL_INTERVAL
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._draining:
+                return
+            self.polls += 1
+            # Берём не больше, чем влезет в очередь: остальное заберут другие процессы
+            free = self.maxsize - self._queue.qsize()
+            if free <= 0:
+                continue
+            now = time.time()
+            try:
+                rows = await self.adb.claim_job_tasks(min(free, self.workers * 4), now, now + JOB_LEASE)
+            except Exception as e:
+                print(f"Error claiming job tasks: {e}")
+                interval = min(interval * 2, JOB_POLL_MAX_INTERVAL)
+                continue
+            interval = JOB_POLL_INTERVAL if rows else min(interval * 2, JOB_POLL_MAX_INTERVAL)
+            self.poll_interval = interval
+            # Пока шёл запрос, очередь могли занять задачи из обработчиков (submit_nowait):
+            # то, что не влезло, возвращаем в pending, а не держим до конца аренды
+            unqueued = []
+            for row in rows:
+                try:
+                    self._queue.put_nowait(Job(row["name"], json.loads(row["payload"]), row["id"], row["attempts"]))
+                except asyncio.QueueFull:
+                    unqueued.append(row["id"])
+                    continue
+                self._claimed.add(row["id"])
+            if unqueued:
+                self.released += len(unqueued)
+                try:
+                    await self.adb.release_job_tasks(unqueued)
+                except Exception as e:
+                    # Их заберут после истечения аренды
+                    print(f"Error releasing job tasks: {e}")
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "capacity": self.maxsize,
+            "workers": self.workers,
+            "busy": self.busy,
+            "claimed": len(self._claimed),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "polls": self.polls,
+            "released": self.released,
+            "poll_interval": self.poll_interval,
+        }
+
+
+# === Обработчики ===
+async def audit(jobs, payload):
+    """Запись в audit_log: {"event", "user_id", "ip", "detail"}"""
+    await jobs.adb.insert_audit_event(payload.get("user_id"), payload["event"], payload.get("ip"),
+                                      payload.get("detail"))
+
+
+async def rehash_password(jobs, payload):
+    """Запись хэша, посчитанного при входе: {"user_id", "old_hash", "password_hash"}.
+
+    Пароля в задаче нет: хэш считает обработчик входа, пока пароль у него.
+    """
+    await jobs.adb.rehash_password(payload["user_id"], payload["old_hash"], payload["password_hash"])
+
+
+async def rescore_saved_passwords(jobs, payload):
+    """Переоценка сохранённых паролей после изменения правил strength.py.
+
+    {"user_id": 1} - пароли одного пользователя; {} - по долговечной задаче
+    на каждого пользователя. Повторный запуск безопасен: меняются только
+    оценки, которые отличаются от новых.
+    """
+    user_id = (payload or {}).get("user_id")
+    if user_id is None:
+        async for user in jobs.adb.iter_users():
+            await jobs.enqueue("rescore_saved_passwords", {"user_id": user["id"]})
+        return
+
+    batch = []
+
+    async def rescore():
+        scores = await asyncio.to_thread(score_passwords, [row["password_hash"] for row in batch])
+        changes = [(row["id"], row["strength_score"], result["score"], row["created_at"])
+                   for row, result in zip(batch, scores) if result["score"] != row["strength_score"]]
+        if changes:
+            await jobs.adb.update_strength_scores(user_id, changes)
+        batch.clear()
+
+    async for row in jobs.adb.iter_saved_passwords(user_id, batch_size=RESCORE_BATCH):
+        batch.append(row)
+        if len(batch) >= RESCORE_BATCH:
+            await rescore()
+    if batch:
+        await rescore()
+
+
+HANDLERS = {
+    "audit": audit,
+    "rehash_password": rehash_password,
+    "rescore_saved_passwords": rescore_saved_passwords,
+}
@@ -1,34 +1,208 @@
 from fastapi import FastAPI, Request, Form, status, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import (HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse,
+                               PlainTextResponse, Response)
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
-import os, secrets, json, datetime
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import os, io, time, secrets, json, datetime, tempfile
 from typing import Optional
 
-from database import db
+from database import db, adb, user_cache, change_listeners, PAGE_SIZE
+from hashing import password_hasher
+from strength import score_password, score_passwords, password_errors
+from breach import open_index
+from progress import ProgressBuffer, clean_progress
+from metrics import MetricsMiddleware, registry
+from render_cache import RenderCache, RENDER_CACHE_VERSIONS, build_id
+from assets import PrecompressedStaticFiles
+from ratelimit import LoginLimiter
+from stats import SITE_STATS, trend_since
+from jobs import JobQueue
+from trainer import QuestionPool, AttemptBuffer, TrainerError, begin_attempt, submit_attempt, attempt_row, pass_score
+import bulk
+import generator
+
+
+progress_buffer = ProgressBuffer(adb)
+trainer_pool = QuestionPool()
+attempt_buffer = AttemptBuffer(adb)
+job_queue = JobQueue(adb)
+login_limiter = LoginLimiter()
 
-app = FastAPI()
-app.add_middleware(SessionMiddleware, secret_key=secrets.token_hex(16))
 
 BASE_DIR = os.path.dirname(__file__)
+# Хэшированные и сжатые копии собираются командой "python assets.py build";
+# устаревшая сборка пересобирается здесь, до расчёта номера сборки для ETag
+static_files = PrecompressedStaticFiles(directory=os.path.join(BASE_DIR, "static"))
+# Несколько воркеров - версии тегов из общей таблицы (см. render_cache.py);
+# тогда номер сборки одинаков у всех воркеров и меняется вместе с шаблонами и
+# статикой, а в режиме memory ETag меняются и при каждом перезапуске
+render_cache = RenderCache(
+    load_versions=adb.get_cache_versions if RENDER_CACHE_VERSIONS == "db" else None,
+    build=build_id(os.path.join(BASE_DIR, "templates"), os.path.join(BASE_DIR, "static", "dist", "manifest.json")))
+change_listeners.append(render_cache.invalidate)
+# Схему и начальные данные создаёт run.py до запуска воркеров; при обычном
+# "uvicorn main:app" это делает lifespan (повторный вызов ничего не меняет)
+DB_SETUP = os.environ.get("DB_SETUP", "1") == "1"
+SESSION_SECRET_FILE = os.environ.get("SESSION_SECRET_FILE", os.path.join(BASE_DIR, ".session_secret"))
+
+
+def session_secret():
+    """Общий для всех воркеров и перезапусков ключ подписи сессий.
+
+    SESSION_SECRET из окружения, иначе файл SESSION_SECRET_FILE, который
+    создаётся при первом запуске (O_EXCL - при гонке воркеров выигрывает один).
+    """
+    secret = os.environ.get("SESSION_SECRET")
+    if secret:
+        return secret
+    try:
+        fd = os.open(SESSION_SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Файл мог быть только что создан другим воркером и ещё не записан
+        for _ in range(50):
+            with open(SESSION_SECRET_FILE, encoding="ascii") as f:
+                secret = f.read().strip()
+            if secret:
+                return secret
+            time.sleep(0.01)
+        raise RuntimeError(f"Empty session secret file: {SESSION_SECRET_FILE}")
+    secret = secrets.token_hex(32)
+    with os.fdopen(fd, "w", encoding="ascii") as f:
+        f.write(secret)
+    return secret
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_SETUP:
+        await run_in_threadpool(db.setup)
+    await trainer_pool.refresh(adb, force=True)
+    # Хэш-заглушку для входа с неизвестным email считаем заранее, а не на первом таком входе
+    await run_in_threadpool(lambda: password_hasher.dummy_hash)
+    progress_buffer.start()
+    attempt_buffer.start()
+    job_queue.start()
+    yield
+    # Сначала дорабатываем фоновые задачи и дописываем буферы, потом закрываем соединения
+    await job_queue.stop()
+    await attempt_buffer.stop()
+    await progress_buffer.stop()
+    await adb.close()
+    password_hasher.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(SessionMiddleware, secret_key=session_secret())
+app.add_middleware(MetricsMiddleware)
+
+registry.add_collector("db_pool", "Async connection pool stats", adb.pool.stats)
+if db.pool is not adb.pool:
+    registry.add_collector("sync_db_pool", "Sync connection pool stats (bulk import)", db.pool.stats)
+registry.add_collector("user_cache", "User cache stats", user_cache.stats)
+registry.add_collector("progress_buffer", "Progress write-behind buffer stats", progress_buffer.stats)
+registry.add_collector("render_cache", "Rendered page cache stats", render_cache.stats)
+registry.add_collector("login_limiter", "Login rate limiter stats", login_limiter.stats)
+registry.add_collector("trainer", "Trainer question pool and attempt buffer stats",
+                       lambda: {**trainer_pool.stats(), **attempt_buffer.stats()})
+registry.add_collector("job_queue", "Background job queue stats", job_queue.stats)
+
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
-app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
+# Скомпилированные шаблоны Jinja кэширует сама; без auto_reload не проверяет mtime файлов
+templates.env.auto_reload = os.environ.get("TEMPLATE_AUTO_RELOAD", "0") == "1"
+templates.env.globals["static_url"] = static_files.static_url
+app.mount("/static", static_files, name="static")
+
+# Кто может импортировать и выгружать пользователей через /api/admin/*
+ADMIN_EMAILS = {e.strip() for e in os.environ.get("ADMIN_EMAILS", "admin@example.com").split(",") if e.strip()}
+# Тело импорта до этого размера держим в памяти, больше - во временном файле
+UPLOAD_SPOOL_SIZE = 8 * 1024 * 1024
+
+# Индекс утёкших паролей (mmap, общий для всех воркеров); без файла проверка отключена
+breach_index = open_index()
 
 
 # === Вспомогательные функции ===
-def get_current_user(request: Request):
-    """Получаем текущего пользователя из сессии"""
+async def get_current_user(request: Request):
+    """Получаем текущего пользователя из сессии (по user_id через кэш)"""
     user = None
+    user_id = request.session.get("user_id")
     email = request.session.get("user_email")
-    if email:
-        user = db.get_user_by_email(email)
+    if user_id:
+        user = await adb.get_user_by_id(user_id)
+    elif email:
+        user = await adb.get_user_by_email(email)
+    return user
+
+
+def audit(request: Request, event, user_id=None, **detail):
+    """Событие в audit_log через очередь задач - ответ не ждёт записи"""
+    job_queue.submit_nowait("audit", {"event": event, "user_id": user_id, "detail": detail or None,
+                                      "ip": request.client.host if request.client else None})
+
+
+async def require_admin(request: Request):
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if user["email"] not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Forbidden")
     return user
 
 
-def require_auth(request: Request):
+async def read_upload(request: Request):
+    """Тело запроса как текстовый поток строк (без загрузки целиком в память)"""
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    return io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+
+
+def export_response(rows, fmt, fields, filename):
+    """Потоковая выгрузка в CSV или NDJSON, строки отдаются по мере чтения"""
+    async def lines():
+        yield bulk.header(fmt, fields)
+        async for row in rows:
+            yield bulk.format_row(row, fmt, fields)
+
+    return StreamingResponse(lines(), media_type=bulk.media_type(fmt),
+                             headers={"Content-Disposition": f"attachment; filename={filename}.{fmt}"})
+
+
+def is_breached(password):
+    """Есть ли пароль в локальной базе утечек"""
+    return breach_index is not None and password in breach_index
+
+
+async def render_page(request: Request, name, context=None, params=(), tags=()):
+    """Рендер шаблона через кэш страниц.
+
+    params - всё, что шаблон читает из контекста (id пользователя, запрос поиска),
+    tags - данные, при изменении которых страницу надо перерендерить.
+    context может быть async-функцией: она вызывается только при промахе кэша.
+    """
+    key = await render_cache.key(name, params, tags)
+    etag = render_cache.etag(key)
+    entry = render_cache.get(key)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if render_cache.is_fresh(request.headers, etag, entry):
+        render_cache.not_modified += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if entry is None:
+        if callable(context):
+            context = await context()
+        response = templates.TemplateResponse(name, {"request": request, **(context or {})})
+        entry = render_cache.store(key, response.body)
+    headers["Last-Modified"] = entry[1]
+    return HTMLResponse(entry[0], headers=headers)
+
+
+async def require_auth(request: Request):
     """Декоратор для проверки авторизации"""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
@@ -36,102 +210,124 @@ def require_auth(request: Request):
 
 # === Основные страницы ===
 @app.get("/", response_class=HTMLResponse)
-def index(request: Request):
-    user = get_current_user(request)
-    return templates.TemplateResponse("index.html", {"request": request, "user": user})
+async def index(request: Request):
+    return await render_page(request, "index.html")
 
 
 @app.get("/navigation", response_class=HTMLResponse)
-def navigation_page(request: Request):
-    user = get_current_user(request)
+async def navigation_page(request: Request):
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
-    return templates.TemplateResponse("navigation.html", {"request": request, "user": user})
+    return await render_page(request, "navigation.html", {"user": user})
 
 
 @app.get("/register", response_class=HTMLResponse)
-def register_get(request: Request):
-    if get_current_user(request):
+async def register_get(request: Request):
+    if await get_current_user(request):
         return RedirectResponse(url="/navigation", status_code=status.HTTP_302_FOUND)
     return templates.TemplateResponse("register.html", {"request": request, "errors": None, "data": {}})
 
 
 @app.get("/login", response_class=HTMLResponse)
-def login_get(request: Request):
-    if get_current_user(request):
+async def login_get(request: Request):
+    if await get_current_user(request):
         return RedirectResponse(url="/navigation", status_code=status.HTTP_302_FOUND)
     return templates.TemplateResponse("login.html", {"request": request, "errors": None, "data": {}})
 
 
 @app.post("/login", response_class=HTMLResponse)
-def login_post(request: Request, email: str = Form(...), password: str = Form(...)):
-    if get_current_user(request):
+async def login_post(request: Request, email: str = Form(...), password: str = Form(...)):
+    if await get_current_user(request):
         return RedirectResponse(url="/navigation", status_code=status.HTTP_302_FOUND)
     errors = []
-    user = db.verify_user(email, password)
+    # Лимит проверяем до verify_user: перебор не должен доходить до базы и хэширования
+    ip = request.client.host if request.client else None
+    retry_after = await login_limiter.attempt_async(ip, email)
+    if retry_after > 0:
+        seconds = int(retry_after) + 1
+        errors.append(f"Слишком много попыток входа. Попробуйте снова через {seconds} сек.")
+        return templates.TemplateResponse("login.html",
+                                          {"request": request, "errors": errors, "data": {"email": email}},
+                                          status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                          headers={"Retry-After": str(seconds)})
+
+    # Новый хэш для старого считаем здесь, пока пароль под рукой; в базу его пишет фоновая задача
+    user = await adb.verify_user(email, password, rehash=False)
     if not user:
+        await login_limiter.failure_async(ip, email)
+        audit(request, "login_failed", email=email)
         errors.append("Неверный email или пароль")
         return templates.TemplateResponse("login.html",
                                           {"request": request, "errors": errors, "data": {"email": email}})
+    await login_limiter.success_async(ip, email)
+    if password_hasher.needs_rehash(user["password_hash"]):
+        job_queue.submit_nowait("rehash_password", {"user_id": user["id"], "old_hash": user["password_hash"],
+                                                    "password_hash": await password_hasher.hash_async(password)})
+    audit(request, "login", user["id"])
     request.session["user_email"] = user["email"]
     request.session["user_id"] = user["id"]
     return RedirectResponse(url="/navigation", status_code=status.HTTP_302_FOUND)
 
 
 @app.get("/logout")
-def logout(request: Request):
+async def logout(request: Request):
+    if request.session.get("user_id"):
+        audit(request, "logout", request.session["user_id"])
     request.session.clear()
     return RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
 
 
 @app.get("/trainer", response_class=HTMLResponse)
-def trainer(request: Request):
-    user = get_current_user(request)
+async def trainer(request: Request):
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
-    return templates.TemplateResponse("trainer.html", {"request": request, "user": user})
+    return await render_page(request, "trainer.html", {"user": user})
 
 
 @app.get("/check-password", response_class=HTMLResponse)
-def check_password(request: Request):
-    user = get_current_user(request)
+async def check_password(request: Request):
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
-    return templates.TemplateResponse("check_password.html", {"request": request, "user": user})
+    return await render_page(request, "check_password.html", {"user": user})
 
 
 @app.get("/profile", response_class=HTMLResponse)
-def profile(request: Request):
-    user = get_current_user(request)
+async def profile(request: Request):
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
 
-    # Получаем сохраненные пароли для профиля
-    saved_passwords = []
-    try:
-        saved_passwords = db.get_saved_passwords(user["id"], limit=5)
-    except Exception as e:
-        print(f"Error loading saved passwords: {e}")
+    async def context():
+        # Получаем сохраненные пароли для профиля
+        saved_passwords = []
+        stats = None
+        try:
+            saved_passwords = await adb.get_saved_passwords(user["id"], limit=5)
+            stats = await adb.get_stats(user["id"])
+        except Exception as e:
+            print(f"Error loading profile data: {e}")
+        return {"user": user, "saved_passwords": saved_passwords, "stats": stats}
 
-    return templates.TemplateResponse("profile.html", {
-        "request": request,
-        "user": user,
-        "saved_passwords": saved_passwords
-    })
+    # Окно динамики сдвигается раз в сутки - его начало входит в ключ кэша
+    return await render_page(request, "profile.html", context, params=(user["id"], trend_since()),
+                             tags=(f"user:{user['id']}", f"saved:{user['id']}", f"trainer:{user['id']}"))
 
 
 @app.get("/info", response_class=HTMLResponse)
-def info(request: Request):
-    user = get_current_user(request)
+async def info(request: Request):
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
-    return templates.TemplateResponse("info.html", {"request": request, "user": user})
+    return await render_page(request, "info.html", {"user": user})
 
 
 @app.post("/register", response_class=HTMLResponse)
-def register_post(request: Request, name: str = Form(...), email: str = Form(...),
+async def register_post(request: Request, name: str = Form(...), email: str = Form(...),
                   password: str = Form(...), password2: str = Form(...)):
-    if get_current_user(request):
+    if await get_current_user(request):
         return RedirectResponse(url="/navigation", status_code=status.HTTP_302_FOUND)
 
     errors = []
@@ -141,17 +337,8 @@ def register_post(request: Request, name: str = Form(...), email: str = Form(...
     if password != password2:
         errors.append("Пароли не совпадают")
 
-    # Кастомные правила пароля
-    if len(password) < 8:
-        errors.append("Пароль должен быть минимум 8 символов")
-    if not any(c.isupper() for c in password):
-        errors.append("Пароль должен содержать хотя бы одну заглавную букву")
-    if not any(c.islower() for c in password):
-        errors.append("Пароль должен содержать хотя бы одну строчную букву")
-    if not any(c.isdigit() for c in password):
-        errors.append("Пароль должен содержать хотя бы одну цифру")
-    if not any(c in "!@#$%^&*()_+-=[]{}|;:,.<>?" for c in password):
-        errors.append("Пароль должен содержать хотя бы один специальный символ (!@#$%^&*()_+-=[]{}|;:,.<>?)")
+    # Кастомные правила пароля (им же проверяются пароли /api/generate)
+    errors.extend(password_errors(password))
 
     # Проверка email
     if "@" not in email or "." not in email:
@@ -162,81 +349,68 @@ def register_post(request: Request, name: str = Form(...), email: str = Form(...
                                           {"request": request, "errors": errors, "data": data})
 
     # Создание пользователя
-    ok = db.create_user(name, email, password)
+    ok = await adb.create_user(name, email, password)
     if not ok:
         errors.append("Пользователь с таким email уже существует")
         return templates.TemplateResponse("register.html",
                                           {"request": request, "errors": errors, "data": data})
 
     request.session["user_email"] = email
-    user = db.get_user_by_email(email)
+    user = await adb.get_user_by_email(email)
     request.session["user_id"] = user["id"]
+    audit(request, "register", user["id"])
     return RedirectResponse(url="/navigation", status_code=status.HTTP_302_FOUND)
 
 
 # === НОВЫЕ СТРАНИЦЫ ===
 @app.get("/search", response_class=HTMLResponse)
-def search_page(request: Request, q: Optional[str] = None, category: Optional[str] = None):
-    user = get_current_user(request)
+async def search_page(request: Request, q: Optional[str] = None, category: Optional[str] = None):
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
 
-    tips = []
-    categories = []
-
-    try:
-        tips = db.search_tips(query=q, category=category)
-        categories = db.get_tip_categories()
-    except Exception as e:
-        print(f"Error loading search data: {e}")
+    async def context():
+        tips = []
+        categories = []
+        try:
+            tips = await adb.search_tips(query=q, category=category)
+            categories = await adb.get_tip_categories()
+        except Exception as e:
+            print(f"Error loading search data: {e}")
+        return {"user": user, "tips": tips, "query": q, "category": category, "categories": categories}
 
-    return templates.TemplateResponse("search.html", {
-        "request": request,
-        "user": user,
-        "tips": tips,
-        "query": q,
-        "category": category,
-        "categories": categories
-    })
+    return await render_page(request, "search.html", context, params=(q, category), tags=("tips",))
 
 
 @app.get("/favorites", response_class=HTMLResponse)
-def favorites_page(request: Request):
-    user = get_current_user(request)
+async def favorites_page(request: Request):
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
 
-    saved_passwords = []
-    try:
-        saved_passwords = db.get_saved_passwords(user["id"])
-    except Exception as e:
-        print(f"Error loading favorites: {e}")
+    async def context():
+        saved_passwords = []
+        try:
+            # Остальные страницы страница подгружает через /api/saved-passwords
+            saved_passwords = await adb.get_saved_passwords(user["id"], limit=PAGE_SIZE)
+        except Exception as e:
+            print(f"Error loading favorites: {e}")
+        return {"user": user, "saved_passwords": saved_passwords}
 
-    return templates.TemplateResponse("favorites.html", {
-        "request": request,
-        "user": user,
-        "saved_passwords": saved_passwords
-    })
+    return await render_page(request, "favorites.html", context, params=(user["id"],),
+                             tags=(f"saved:{user['id']}",))
 
 
 # === API ДЛЯ СОХРАНЕНИЯ ПРОГРЕССА И ПАРОЛЕЙ ===
 @app.get("/api/progress")
-def get_progress_api(request: Request):
+async def get_progress_api(request: Request):
     """Получаем прогресс пользователя"""
     try:
-        user = get_current_user(request)
+        user = await get_current_user(request)
         if not user:
             raise HTTPException(status_code=401, detail="Not authenticated")
 
-        # Для упрощения пока возвращаем только статусы из localStorage
-        # В реальном приложении нужно хранить в базе данных
-        return {
-            "info_viewed": False,
-            "trainer_score": 0,
-            "trainer_passed": False,
-            "password_checked": False,
-            "last_activity": None
-        }
+        return await progress_buffer.get(user["id"])
     except Exception as e:
         print(f"Error in get_progress_api: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -246,15 +420,15 @@ def get_progress_api(request: Request):
 async def update_progress_api(request: Request):
     """Обновляем прогресс пользователя"""
     try:
-        user = get_current_user(request)
+        user = await get_current_user(request)
         if not user:
             raise HTTPException(status_code=401, detail="Not authenticated")
 
         body = await request.body()
         data = json.loads(body.decode())
 
-        # В реальном приложении сохраняем в базу данных
-        print(f"Progress updated for user {user['id']}: {data}")
+        # Запись в базу отложенная и пакетная (см. progress.py)
+        progress_buffer.update(user["id"], clean_progress(data))
 
         return {"success": True}
     except Exception as e:
@@ -266,64 +440,268 @@ async def update_progress_api(request: Request):
 async def save_password_api(request: Request):
     """Сохраняем проверенный пароль"""
     try:
-        user = get_current_user(request)
+        user = await get_current_user(request)
         if not user:
             raise HTTPException(status_code=401, detail="Not authenticated")
 
         body = await request.body()
         data = json.loads(body.decode())
 
-        success = db.save_password(
+        # Оценку считаем на сервере, поле score от клиента не используется
+        strength = score_password(data["password"])
+        success = await adb.save_password(
             user_id=user["id"],
             password=data["password"],
-            strength_score=data["score"]
+            strength_score=strength["score"]
         )
+        if success:
+            audit(request, "password_saved", user["id"])
 
-        return {"success": success}
+        return {"success": success, "score": strength["score"], "breached": is_breached(data["password"])}
     except Exception as e:
         print(f"Error in save_password_api: {e}")
         return {"success": False, "error": str(e)}
 
 
-@app.get("/api/saved-passwords")
-def get_saved_passwords_api(request: Request):
-    """Получаем сохраненные пароли"""
+@app.post("/api/check-breach")
+async def check_breach_api(request: Request):
+    """Проверяем пароль по базе утечек"""
+    try:
+        user = await get_current_user(request)
+        if not user:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+
+        body = await request.body()
+        data = json.loads(body.decode())
+
+        return {"breached": is_breached(data["password"]), "available": breach_index is not None}
+    except Exception as e:
+        print(f"Error in check_breach_api: {e}")
+        return {"breached": False, "error": str(e)}
+
+
+@app.post("/api/strength")
+async def strength_api(request: Request):
+    """Пакетная оценка надёжности: {"passwords": [...]} -> {"results": [...]}"""
     try:
-        user = get_current_user(request)
+        user = await get_current_user(request)
         if not user:
             raise HTTPException(status_code=401, detail="Not authenticated")
 
-        passwords = db.get_saved_passwords(user["id"])
-        return {"passwords": passwords}
+        body = await request.body()
+        data = json.loads(body.decode())
+        passwords = data["passwords"]
+        if not isinstance(passwords, list) or not all(isinstance(p, str) for p in passwords):
+            raise ValueError("passwords must be a list of strings")
+
+        # Большие пакеты считаем вне цикла событий
+        results = await run_in_threadpool(score_passwords, passwords)
+        return {"results": results}
+    except Exception as e:
+        print(f"Error in strength_api: {e}")
+        return {"results": [], "error": str(e)}
+
+
+@app.post("/api/generate")
+async def generate_api(request: Request):
+    """Пароли или парольные фразы по политике (см. generator.parse_policy).
+
+    {"count": 10, "kind": "password", "length": 16, "specials": "!@#", "exclude_ambiguous": true}
+    {"count": 10, "kind": "passphrase", "words": 6, "separator": "-"}
+    Каждый результат проходит правила регистрации; политика, которая их не
+    допускает, - ошибка 400 с текстом нарушенного правила.
+    """
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        data = json.loads((await request.body()).decode() or "{}")
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        kind, count, options = generator.parse_policy(data)
+        # 100 тысяч паролей - заметная работа, вне цикла событий
+        passwords = await run_in_threadpool(generator.generate, kind, count, options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"kind": kind, "entropy_bits": generator.entropy_bits(kind, options), "passwords": passwords}
+
+
+@app.get("/api/saved-passwords")
+async def get_saved_passwords_api(request: Request, limit: int = PAGE_SIZE, cursor: Optional[str] = None):
+    """Получаем страницу сохраненных паролей (keyset-пагинация по next_cursor)"""
+    user = await require_auth(request)
+    try:
+        limit = max(1, min(limit, 500))
+        return await adb.get_saved_passwords_page(user["id"], limit=limit, cursor=cursor)
+    except ValueError as e:
+        # Испорченный курсор - ошибка клиента, а не пустая последняя страница
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error in get_saved_passwords_api: {e}")
-        return {"passwords": []}
+        return {"passwords": [], "next_cursor": None}
+
+
+@app.get("/api/saved-passwords/export")
+async def export_saved_passwords_api(request: Request, format: str = "ndjson"):
+    """Выгрузка всех сохраненных паролей в NDJSON (или CSV с ?format=csv)"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    audit(request, "saved_passwords_exported", user["id"])
+    return export_response(adb.iter_saved_passwords(user["id"]), bulk.detect_format(format),
+                           bulk.SAVED_FIELDS, "saved-passwords")
+
+
+@app.post("/api/saved-passwords/import")
+async def import_saved_passwords_api(request: Request, format: Optional[str] = None):
+    """Массовая загрузка сохраненных паролей из CSV/NDJSON в теле запроса.
+
+    Формат - ?format=csv|ndjson или Content-Type (text/csv). Ответ - отчёт
+    с числом загруженных строк и ошибками по номерам строк.
+    """
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    fmt = bulk.detect_format(format, request.headers.get("content-type"))
+    lines = await read_upload(request)
+    try:
+        report = await run_in_threadpool(bulk.import_saved_passwords, db, user["id"],
+                                         bulk.read_rows(lines, fmt))
+    finally:
+        lines.close()
+    audit(request, "saved_passwords_imported", user["id"], imported=report.imported, failed=report.failed)
+    return report.to_dict()
+
+
+@app.post("/api/admin/users/import")
+async def import_users_api(request: Request, format: Optional[str] = None):
+    """Массовое создание пользователей (перенос базы): CSV/NDJSON с name, email и password или password_hash"""
+    admin = await require_admin(request)
+    fmt = bulk.detect_format(format, request.headers.get("content-type"))
+    lines = await read_upload(request)
+    try:
+        report = await run_in_threadpool(bulk.import_users, db, bulk.read_rows(lines, fmt))
+    finally:
+        lines.close()
+    audit(request, "users_imported", admin["id"], imported=report.imported, failed=report.failed)
+    return report.to_dict()
+
+
+@app.get("/api/admin/users/export")
+async def export_users_api(request: Request, format: str = "ndjson"):
+    """Выгрузка пользователей с хэшами паролей в формате, который принимает импорт"""
+    admin = await require_admin(request)
+    audit(request, "users_exported", admin["id"])
+    return export_response(adb.iter_users(), bulk.detect_format(format), bulk.USER_FIELDS, "users")
+
+
+@app.get("/api/stats")
+async def stats_api(request: Request):
+    """Статистика пользователя: средняя и медианная оценка, распределение, динамика, тренажёр"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await adb.get_stats(user["id"])
+
+
+@app.get("/api/admin/stats")
+async def site_stats_api(request: Request):
+    """Та же статистика по всем пользователям сайта"""
+    await require_admin(request)
+    return await adb.get_stats(SITE_STATS)
+
+
+@app.get("/api/admin/jobs")
+async def jobs_api(request: Request):
+    """Очередь этого процесса и задачи в job_tasks по статусам"""
+    await require_admin(request)
+    return {"queue": job_queue.stats(), "tasks": await adb.job_task_counts()}
+
+
+@app.post("/api/admin/jobs/rescore")
+async def rescore_api(request: Request):
+    """Переоценка сохранённых паролей по текущим правилам: {"user_id": 1} или {} - у всех"""
+    admin = await require_admin(request)
+    try:
+        data = json.loads((await request.body()).decode() or "{}")
+        user_id = data.get("user_id")
+        user_id = None if user_id is None else int(user_id)
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="user_id must be an integer")
+    task_id = await job_queue.enqueue("rescore_saved_passwords", {"user_id": user_id} if user_id is not None else {})
+    audit(request, "rescore_started", admin["id"], target=user_id)
+    return {"task_id": task_id}
 
 
 @app.delete("/api/saved-passwords/{password_id}")
-def delete_saved_password_api(request: Request, password_id: int):
+async def delete_saved_password_api(request: Request, password_id: int):
     """Удаляем сохраненный пароль"""
     try:
-        user = get_current_user(request)
+        user = await get_current_user(request)
         if not user:
             raise HTTPException(status_code=401, detail="Not authenticated")
 
-        success = db.delete_saved_password(password_id, user["id"])
+        success = await adb.delete_saved_password(password_id, user["id"])
+        if success:
+            audit(request, "password_deleted", user["id"], password_id=password_id)
         return {"success": success}
     except Exception as e:
         print(f"Error in delete_saved_password_api: {e}")
         return {"success": False, "error": str(e)}
 
 
+@app.post("/api/trainer/start")
+async def trainer_start_api(request: Request):
+    """Новая попытка тренажёра: случайный набор вопросов без правильных ответов"""
+    user = await require_auth(request)
+    await trainer_pool.refresh(adb)
+    try:
+        attempt_id, questions = await begin_attempt(adb, trainer_pool, user["id"])
+    except TrainerError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    # Состояние попытки - в trainer_sessions, в cookie только её id
+    request.session["trainer"] = attempt_id
+    return {"questions": questions, "total": len(questions), "pass_score": pass_score(len(questions))}
+
+
+@app.post("/api/trainer/submit")
+async def trainer_submit_api(request: Request):
+    """Сдача попытки: {"answers": [1, 0, ...]} по порядку вопросов; проверяется на сервере"""
+    user = await require_auth(request)
+    try:
+        data = json.loads((await request.body()).decode())
+        answers = [int(answer) for answer in data["answers"]]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="answers are required")
+
+    # Попытка одноразовая: после сдачи её нет ни в базе, ни в cookie
+    attempt_id = request.session.pop("trainer", None)
+    try:
+        state, result = await submit_attempt(adb, trainer_pool, user["id"], attempt_id, answers)
+    except TrainerError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    attempt_buffer.add(attempt_row(user["id"], state, result))
+    progress_buffer.update(user["id"], {"trainer_score": result["score"], "trainer_passed": result["passed"]})
+    return result
+
+
+@app.get("/api/trainer/attempts")
+async def trainer_attempts_api(request: Request, limit: int = 20):
+    """Последние завершённые попытки с вопросами и ответами (записываются с задержкой до секунд)"""
+    user = await require_auth(request)
+    return {"attempts": await adb.get_trainer_attempts(user["id"], max(1, min(limit, 100)))}
+
+
 @app.get("/api/tips")
-def search_tips_api(request: Request, q: Optional[str] = None, category: Optional[str] = None):
+async def search_tips_api(request: Request, q: Optional[str] = None, category: Optional[str] = None):
     """Поиск советов"""
     try:
-        user = get_current_user(request)
+        user = await get_current_user(request)
         if not user:
             raise HTTPException(status_code=401, detail="Not authenticated")
 
-        tips = db.search_tips(query=q, category=category, limit=50)
+        tips = await adb.search_tips(query=q, category=category, limit=50)
         return {"tips": tips}
     except Exception as e:
         print(f"Error in search_tips_api: {e}")
@@ -332,18 +710,44 @@ def search_tips_api(request: Request, q: Optional[str] = None, category: Optiona
 
 # === ДОПОЛНИТЕЛЬНЫЕ УТИЛИТЫ ===
 @app.get("/api/version")
-def get_version():
+async def get_version():
     """Возвращает версию приложения"""
     return {"version": "1.0.0", "timestamp": datetime.datetime.now().isoformat()}
 
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """Проверка работоспособности сервера"""
-    return {"status": "ok", "time": datetime.datetime.now().isoformat()}
+    try:
+        db_latency_ms = await adb.ping()
+        db_status = "ok"
+    except Exception as e:
+        print(f"Error in health_check: {e}")
+        db_latency_ms = None
+        db_status = "error"
+
+    return {
+        "status": "ok" if db_status == "ok" else "degraded",
+        "time": datetime.datetime.now().isoformat(),
+        "db": {"status": db_status, "latency_ms": db_latency_ms},
+        "db_pool": adb.pool.stats(),
+        # Синхронный пул: массовый импорт и bulk.py (для PostgreSQL - тот же пул)
+        "sync_db_pool": db.pool.stats(),
+        "user_cache": user_cache.stats(),
+        "progress_buffer": progress_buffer.stats(),
+        "job_queue": job_queue.stats()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
-    import uvicorn
+    # Режим разработки; боевой запуск с несколькими воркерами - python run.py --workers N
+    import sys
+    from run import main as run_main
 
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    sys.exit(run_main(["--reload"] + sys.argv[1:]))
@@ -0,0 +1,207 @@
+"""Метрики приложения в текстовом формате Prometheus.
+
+MetricsMiddleware считает латентность, коды ответов и запросы в работе по
+шаблону маршрута (/api/saved-passwords/{password_id}, а не по конкретному
+URL). instrument_queries оборачивает методы Database/AsyncDatabase и
+пишет время каждого вызова под именем метода.
+"""
+import time, threading, functools, inspect
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *labels, value=1):
+        self.inc(*labels, value=-value)
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    lines.append(f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, name, help, stats):
+        """Gauge из словаря stats() (пул соединений, кэш и т.п.): name{key="..."}"""
+        self._collectors.append((name, help, stats))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help, stats in self._collectors:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f'{name}{{key="{key}"}} {float(value)}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests being processed"))
+db_latency = registry.register(Histogram(
+    "db_query_duration_seconds", "Database call latency by method", ("layer", "method"), QUERY_BUCKETS))
+db_errors = registry.register(Counter(
+    "db_query_errors_total", "Database calls that raised", ("layer", "method")))
+
+
+# === HTTP ===
+def _route_name(scope):
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    if scope["path"].startswith("/static/"):
+        return "/static"
+    # Ограничиваем число меток: все несовпавшие пути в одну
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: не буферизует ответ, поэтому работает и со StreamingResponse"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            route = _route_name(scope)
+            http_latency.observe(elapsed, scope["method"], route)
+            http_requests.inc(scope["method"], route, status["code"])
+
+
+# === База данных ===
+def _timed(func, layer):
+    name = func.__name__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                db_errors.inc(layer, name)
+                raise
+            finally:
+                db_latency.observe(time.perf_counter() - start, layer, name)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            db_errors.inc(layer, name)
+            raise
+        finally:
+            db_latency.observe(time.perf_counter() - start, layer, name)
+    return wrapper
+
+
+def instrument_queries(cls, layer):
+    """Оборачиваем публичные методы класса базы таймером (генераторы не трогаем)"""
+    for name, func in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(func):
+            continue
+        if inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func):
+            continue
+        setattr(cls, name, _timed(func, layer))
+    return cls
@@ -0,0 +1,443 @@
+"""Версионные миграции схемы (SQLite и PostgreSQL).
+
+Миграция - функция от курсора с номером версии. Применённые версии
+записываются в таблицу schema_migrations, migrate() выполняет только новые.
+Первые миграции повторяют прежний _ensure_tables с IF NOT EXISTS, поэтому
+базы, созданные до появления миграций, проходят их без изменений.
+
+Запуск:
+    python migrations.py status     # текущая версия и ожидающие миграции
+    python migrations.py migrate    # применить
+    python migrations.py check      # EXPLAIN QUERY PLAN горячих запросов
+"""
+import re, sys, datetime
+
+
+# === Миграции ===
+def _initial_schema(cur):
+    cur.execute("""CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        salt TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS saved_passwords (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        password_hash TEXT NOT NULL,
+        strength_score INTEGER,
+        created_at TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )""")
+    # Прогресс обучения (раньше жил только в localStorage)
+    cur.execute("""CREATE TABLE IF NOT EXISTS user_progress (
+        user_id INTEGER PRIMARY KEY,
+        info_viewed INTEGER,
+        trainer_score INTEGER,
+        trainer_passed INTEGER,
+        password_checked INTEGER,
+        last_activity TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS password_tips (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        category TEXT
+    )""")
+
+
+def _tips_fulltext(cur):
+    # Полнотекстовый индекс советов (основы слов), синхронизируется триггерами
+    cur.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS password_tips_fts
+                   USING fts5(title, content, tokenize = 'unicode61')""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS password_tips_ai AFTER INSERT ON password_tips BEGIN
+        INSERT INTO password_tips_fts (rowid, title, content)
+        VALUES (new.id, ru_stem(new.title), ru_stem(new.content));
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS password_tips_ad AFTER DELETE ON password_tips BEGIN
+        DELETE FROM password_tips_fts WHERE rowid = old.id;
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS password_tips_au AFTER UPDATE ON password_tips BEGIN
+        DELETE FROM password_tips_fts WHERE rowid = old.id;
+        INSERT INTO password_tips_fts (rowid, title, content)
+        VALUES (new.id, ru_stem(new.title), ru_stem(new.content));
+    END""")
+    # Советы, добавленные до появления индекса
+    cur.execute("""INSERT INTO password_tips_fts (rowid, title, content)
+                   SELECT id, ru_stem(title), ru_stem(content) FROM password_tips
+                   WHERE id NOT IN (SELECT rowid FROM password_tips_fts)""")
+
+
+def _hot_query_indexes(cur):
+    # Страницы сохранённых паролей: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_saved_passwords_user_created
+                   ON saved_passwords (user_id, created_at, id)""")
+    # Фильтр советов по категории и список категорий (покрывающий индекс)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_password_tips_category ON password_tips (category)")
+
+
+def _stats_aggregates(cur):
+    # Статистика (database.get_stats) ведётся приращениями при записи, а не
+    # пересчётом: гистограмма оценок, оценки по дням и результаты тренажёра
+    # по дням. user_id = 0 - сводка по всему сайту. SQL общий для обоих диалектов.
+    cur.execute("""CREATE TABLE IF NOT EXISTS strength_histogram (
+        user_id BIGINT NOT NULL,
+        score INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, score)
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS strength_daily (
+        user_id BIGINT NOT NULL,
+        day TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        score_sum INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day)
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS trainer_daily (
+        user_id BIGINT NOT NULL,
+        day TEXT NOT NULL,
+        results INTEGER NOT NULL,
+        passed INTEGER NOT NULL,
+        score_sum INTEGER NOT NULL,
+        best_score INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day)
+    )""")
+    # Начальные значения из уже сохранённых данных
+    scored = "FROM saved_passwords WHERE strength_score IS NOT NULL"
+    cur.execute(f"""INSERT INTO strength_histogram (user_id, score, count)
+                    SELECT user_id, strength_score, COUNT(*) {scored} GROUP BY user_id, strength_score
+                    UNION ALL
+                    SELECT 0, strength_score, COUNT(*) {scored} GROUP BY strength_score""")
+    dated = f"{scored} AND created_at IS NOT NULL"
+    cur.execute(f"""INSERT INTO strength_daily (user_id, day, count, score_sum)
+                    SELECT user_id, substr(created_at, 1, 10), COUNT(*), SUM(strength_score) {dated}
+                    GROUP BY user_id, substr(created_at, 1, 10)
+                    UNION ALL
+                    SELECT 0, substr(created_at, 1, 10), COUNT(*), SUM(strength_score) {dated}
+                    GROUP BY substr(created_at, 1, 10)""")
+    # От тренажёра до сих пор хранился только последний результат
+    finished = """FROM user_progress
+                  WHERE trainer_score > 0 AND last_activity IS NOT NULL"""
+    passed = "CASE WHEN trainer_passed THEN 1 ELSE 0 END"
+    cur.execute(f"""INSERT INTO trainer_daily (user_id, day, results, passed, score_sum, best_score)
+                    SELECT user_id, substr(last_activity, 1, 10), 1, {passed}, trainer_score, trainer_score
+                    {finished}
+                    UNION ALL
+                    SELECT 0, substr(last_activity, 1, 10), COUNT(*), SUM({passed}), SUM(trainer_score), MAX(trainer_score)
+                    {finished} GROUP BY substr(last_activity, 1, 10)""")
+
+
+def _trainer(cur):
+    # Вопросы тренажёра (раньше жили в script.js) и журнал попыток с ответами
+    cur.execute("""CREATE TABLE IF NOT EXISTS trainer_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        question TEXT NOT NULL,
+        options TEXT NOT NULL,
+        correct INTEGER NOT NULL,
+        active INTEGER NOT NULL DEFAULT 1
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS trainer_attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        question_ids TEXT NOT NULL,
+        answers TEXT NOT NULL,
+        score INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        passed INTEGER NOT NULL,
+        started_at TEXT NOT NULL,
+        finished_at TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )""")
+    _trainer_indexes(cur)
+
+
+def _trainer_indexes(cur):
+    # История попыток: WHERE user_id = ? ORDER BY finished_at DESC, id DESC
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_trainer_attempts_user_finished
+                   ON trainer_attempts (user_id, finished_at, id)""")
+
+
+def _jobs(cur):
+    # Долговечные фоновые задачи (jobs.py): аренда lease_until вместо блокировок,
+    # задачу упавшего процесса заберёт другой после её истечения. Время - секунды epoch.
+    cur.execute("""CREATE TABLE IF NOT EXISTS job_tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        run_after REAL NOT NULL,
+        lease_until REAL,
+        error TEXT,
+        created_at TEXT NOT NULL
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS audit_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        user_id INTEGER,
+        event TEXT NOT NULL,
+        ip TEXT,
+        detail TEXT
+    )""")
+    _jobs_indexes(cur)
+
+
+def _jobs_indexes(cur):
+    # Выборка готовых к запуску задач: WHERE status = ? AND run_after <= ?
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_tasks_status_run_after ON job_tasks (status, run_after)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_user_created ON audit_log (user_id, created_at)")
+
+
+def _cache_versions(cur):
+    # Версии тегов кэша страниц (render_cache.py): общие для всех воркеров и процессов.
+    # Одинаковый SQL для обоих диалектов
+    cur.execute("""CREATE TABLE IF NOT EXISTS cache_versions (
+        tag TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    )""")
+
+
+def _trainer_daily_from_attempts(cur):
+    # trainer_daily теперь считается по trainer_attempts, а не по прогрессу: за дни,
+    # когда попытки уже записывались, пересчитываем агрегаты из самих попыток.
+    # Одинаковый SQL для обоих диалектов (passed - INTEGER в SQLite, BOOLEAN в PostgreSQL)
+    since = "(SELECT MIN(substr(finished_at, 1, 10)) FROM trainer_attempts)"
+    cur.execute(f"DELETE FROM trainer_daily WHERE day >= {since}")
+    passed = "CASE WHEN passed THEN 1 ELSE 0 END"
+    cur.execute(f"""INSERT INTO trainer_daily (user_id, day, results, passed, score_sum, best_score)
+                    SELECT user_id, substr(finished_at, 1, 10), COUNT(*), SUM({passed}), SUM(score), MAX(score)
+                    FROM trainer_attempts GROUP BY user_id, substr(finished_at, 1, 10)
+                    UNION ALL
+                    SELECT 0, substr(finished_at, 1, 10), COUNT(*), SUM({passed}), SUM(score), MAX(score)
+                    FROM trainer_attempts GROUP BY substr(finished_at, 1, 10)""")
+
+
+def _trainer_sessions(cur):
+    # Незавершённые попытки тренажёра (trainer.py): в cookie сессии только id попытки.
+    # created_at - секунды epoch, по нему удаляются брошенные попытки
+    cur.execute("""CREATE TABLE IF NOT EXISTS trainer_sessions (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )""")
+    _trainer_sessions_indexes(cur)
+
+
+def _trainer_sessions_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trainer_sessions_user ON trainer_sessions (user_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trainer_sessions_created ON trainer_sessions (created_at)")
+
+
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "full-text index for tips", _tips_fulltext),
+    (3, "indexes for hot queries", _hot_query_indexes),
+    (4, "statistics aggregates", _stats_aggregates),
+    (5, "trainer questions and attempts", _trainer),
+    (6, "background jobs and audit log", _jobs),
+    (7, "render cache tag versions", _cache_versions),
+    (8, "trainer statistics from attempts", _trainer_daily_from_attempts),
+    (9, "trainer attempt sessions", _trainer_sessions),
+]
+
+
+# === PostgreSQL (storage.PostgresPool) ===
+# Номера версий совпадают с SQLite: одна и та же схема в синтаксисе диалекта
+def _pg_initial_schema(cur):
+    cur.execute("""CREATE TABLE IF NOT EXISTS users (
+        id BIGSERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        salt TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS saved_passwords (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        password_hash TEXT NOT NULL,
+        strength_score INTEGER,
+        created_at TEXT
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS user_progress (
+        user_id BIGINT PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+        info_viewed BOOLEAN,
+        trainer_score INTEGER,
+        trainer_passed BOOLEAN,
+        password_checked BOOLEAN,
+        last_activity TEXT
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS password_tips (
+        id BIGSERIAL PRIMARY KEY,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        category TEXT
+    )""")
+
+
+def _pg_tips_fulltext(cur):
+    # Вместо FTS5 и триггеров - вычисляемая колонка tsvector и GIN-индекс
+    cur.execute("""ALTER TABLE password_tips ADD COLUMN IF NOT EXISTS search tsvector
+                   GENERATED ALWAYS AS (setweight(to_tsvector('russian', title), 'A') ||
+                                        setweight(to_tsvector('russian', content), 'B')) STORED""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_password_tips_search ON password_tips USING GIN (search)")
+
+
+def _pg_trainer(cur):
+    cur.execute("""CREATE TABLE IF NOT EXISTS trainer_questions (
+        id BIGSERIAL PRIMARY KEY,
+        question TEXT NOT NULL,
+        options TEXT NOT NULL,
+        correct INTEGER NOT NULL,
+        active BOOLEAN NOT NULL DEFAULT TRUE
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS trainer_attempts (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        question_ids TEXT NOT NULL,
+        answers TEXT NOT NULL,
+        score INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        passed BOOLEAN NOT NULL,
+        started_at TEXT NOT NULL,
+        finished_at TEXT NOT NULL
+    )""")
+    _trainer_indexes(cur)
+
+
+def _pg_jobs(cur):
+    cur.execute("""CREATE TABLE IF NOT EXISTS job_tasks (
+        id BIGSERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        run_after DOUBLE PRECISION NOT NULL,
+        lease_until DOUBLE PRECISION,
+        error TEXT,
+        created_at TEXT NOT NULL
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS audit_log (
+        id BIGSERIAL PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        user_id BIGINT,
+        event TEXT NOT NULL,
+        ip TEXT,
+        detail TEXT
+    )""")
+    _jobs_indexes(cur)
+
+
+def _pg_trainer_sessions(cur):
+    cur.execute("""CREATE TABLE IF NOT EXISTS trainer_sessions (
+        id TEXT PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        state TEXT NOT NULL,
+        created_at DOUBLE PRECISION NOT NULL
+    )""")
+    _trainer_sessions_indexes(cur)
+
+
+PG_MIGRATIONS = [
+    (1, "initial schema", _pg_initial_schema),
+    (2, "full-text index for tips", _pg_tips_fulltext),
+    (3, "indexes for hot queries", _hot_query_indexes),
+    (4, "statistics aggregates", _stats_aggregates),
+    (5, "trainer questions and attempts", _pg_trainer),
+    (6, "background jobs and audit log", _pg_jobs),
+    (7, "render cache tag versions", _cache_versions),
+    (8, "trainer statistics from attempts", _trainer_daily_from_attempts),
+    (9, "trainer attempt sessions", _pg_trainer_sessions),
+]
+
+
+# === Запуск ===
+def _ensure_version_table(cur):
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )""")
+
+
+def schema_version(cur):
+    _ensure_version_table(cur)
+    cur.execute("SELECT MAX(version) FROM schema_migrations")
+    return cur.fetchone()[0] or 0
+
+
+def pending(cur, migrations=MIGRATIONS):
+    version = schema_version(cur)
+    return [(v, name) for v, name, _ in migrations if v > version]
+
+
+def migrate(cur, migrations=MIGRATIONS):
+    """Применяем новые миграции в текущей транзакции, возвращаем их номера.
+
+    Транзакцию (BEGIN IMMEDIATE) и commit делает вызывающий - Database.setup().
+    """
+    version = schema_version(cur)
+    applied = []
+    for v, name, apply in migrations:
+        if v <= version:
+            continue
+        apply(cur)
+        cur.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                    (v, name, datetime.datetime.utcnow().isoformat()))
+        applied.append(v)
+    return applied
+
+
+# === Проверка планов запросов ===
+# "SCAN t" без индекса - полный проход по таблице. Проход по индексу
+# ("USING COVERING INDEX") и по FTS ("VIRTUAL TABLE") допустимы.
+_FULL_SCAN_RE = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+def explain(cur, sql, params=()):
+    cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [row[3] for row in cur.fetchall()]
+
+
+def full_scans(cur, queries):
+    """{имя: (sql, params)} -> список "имя: строка плана" для запросов с полным сканированием"""
+    problems = []
+    for name, (sql, params) in queries.items():
+        for detail in explain(cur, sql, params):
+            if _FULL_SCAN_RE.match(detail):
+                problems.append(f"{name}: {detail}")
+    return problems
+
+
+def main(argv):
+    command = argv[0] if argv else "status"
+    from database import db
+
+    if command == "migrate":
+        applied = db.setup()
+        print(f"Applied: {applied}" if applied else "Schema is up to date")
+        return 0
+
+    if command == "status":
+        with db._cursor() as cur:
+            print(f"Schema version: {schema_version(cur)} (latest {db.pool.migrations[-1][0]})")
+            for v, name in pending(cur, db.pool.migrations):
+                print(f"  pending {v}: {name}")
+        return 0
+    if command == "check":
+        problems = db.check_query_plans()
+        for line in problems:
+            print(f"Full scan in {line}")
+        print("OK" if not problems else f"{len(problems)} full scan(s)")
+        return 1 if problems else 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
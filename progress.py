@@ -0,0 +1,124 @@
+"""Буфер прогресса пользователей с отложенной записью (write-behind).
+
+Фронтенд шлёт /api/progress на каждое действие. Обновления копятся в памяти
+и сливаются по пользователю, а в SQLite уходят одной транзакцией раз в
+PROGRESS_FLUSH_INTERVAL секунд, при PROGRESS_FLUSH_SIZE ожидающих
+пользователях или при остановке приложения.
+"""
+import os, asyncio, datetime
+
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("PROGRESS_FLUSH_INTERVAL", "2"))
+PROGRESS_FLUSH_SIZE = int(os.environ.get("PROGRESS_FLUSH_SIZE", "500"))
+
+PROGRESS_FIELDS = {
+    "info_viewed": bool,
+    "trainer_score": int,
+    "trainer_passed": bool,
+    "password_checked": bool,
+}
+DEFAULT_PROGRESS = {
+    "info_viewed": False,
+    "trainer_score": 0,
+    "trainer_passed": False,
+    "password_checked": False,
+    "last_activity": None,
+}
+
+
+# Результат тренажёра выставляет сервер (trainer.py), клиент может его только сбросить
+SERVER_FIELDS = {"trainer_score", "trainer_passed"}
+
+
+def clean_progress(data):
+    """Оставляем только известные поля и приводим типы"""
+    patch = {}
+    for key, cast in PROGRESS_FIELDS.items():
+        if key in data and data[key] is not None:
+            value = cast(data[key])
+            if key in SERVER_FIELDS and value:
+                continue
+            patch[key] = value
+    return patch
+
+
+class ProgressBuffer:
+    def __init__(self, adb, interval=PROGRESS_FLUSH_INTERVAL, max_pending=PROGRESS_FLUSH_SIZE):
+        self.adb = adb
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._task = None
+        self._wakeup = None
+        self._flush_lock = None
+        # Метрики
+        self.updates = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливаем фоновую запись и сбрасываем всё, что осталось в буфере"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def update(self, user_id, patch):
+        current = self._pending.setdefault(user_id, {})
+        current.update(patch)
+        current["last_activity"] = datetime.datetime.utcnow().isoformat()
+        self.updates += 1
+        if len(self._pending) >= self.max_pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def get(self, user_id):
+        """Прогресс из базы с наложенными ещё не записанными изменениями"""
+        progress = dict(DEFAULT_PROGRESS)
+        row = await self.adb.get_progress(user_id)
+        if row:
+            progress.update(row)
+        progress.update(self._pending.get(user_id, {}))
+        return progress
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+        lock = self._flush_lock or asyncio.Lock()
+        async with lock:
+            batch, self._pending = self._pending, {}
+            try:
+                await self.adb.save_progress_many(batch)
+            except Exception as e:
+                print(f"Error flushing progress: {e}")
+                # Возвращаем несохранённое, не затирая более свежие обновления
+                for user_id, patch in batch.items():
+                    self._pending[user_id] = {**patch, **self._pending.get(user_id, {})}
+                return 0
+            self.flushes += 1
+            self.rows_written += len(batch)
+            return len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self):
+        return {
+            "pending_users": len(self._pending),
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
@@ -0,0 +1,251 @@
+"""Ограничение частоты попыток входа (token bucket + нарастающая блокировка).
+
+У каждого ключа ("ip:<адрес>", "email:<адрес>") своё ведро жетонов: попытка
+забирает жетон, жетоны восполняются с постоянной скоростью. Неудачные входы
+сверх LOGIN_FREE_FAILURES блокируют ключ на время, удваивающееся с каждой
+следующей ошибкой (до LOGIN_BACKOFF_MAX). Успешный вход снимает блокировку
+с email, но не с IP.
+
+Состояние хранится в MemoryStore (в процессе) или в SqliteStore - общем
+файле для всех воркеров на одной машине (RATE_LIMIT_STORE=sqlite). За прокси
+адрес клиента должен подставлять uvicorn (--proxy-headers).
+"""
+import os, time, sqlite3, asyncio, threading
+from collections import OrderedDict
+
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_DB = os.environ.get("RATE_LIMIT_DB", os.path.join(os.path.dirname(__file__), "ratelimit.db"))
+RATE_LIMIT_KEYS = int(os.environ.get("RATE_LIMIT_KEYS", "100000"))
+
+# Попыток входа: ёмкость ведра и за сколько секунд оно наполняется целиком
+LOGIN_IP_BURST = int(os.environ.get("LOGIN_IP_BURST", "20"))
+LOGIN_IP_PERIOD = float(os.environ.get("LOGIN_IP_PERIOD", "60"))
+LOGIN_EMAIL_BURST = int(os.environ.get("LOGIN_EMAIL_BURST", "5"))
+LOGIN_EMAIL_PERIOD = float(os.environ.get("LOGIN_EMAIL_PERIOD", "300"))
+LOGIN_FREE_FAILURES = int(os.environ.get("LOGIN_FREE_FAILURES", "3"))
+LOGIN_BACKOFF_BASE = float(os.environ.get("LOGIN_BACKOFF_BASE", "1"))
+LOGIN_BACKOFF_MAX = float(os.environ.get("LOGIN_BACKOFF_MAX", "900"))
+# Ключ без обращений дольше этого забывается: ведро к тому времени полное,
+# блокировка (не дольше LOGIN_BACKOFF_MAX) истекла
+STATE_TTL = max(LOGIN_IP_PERIOD, LOGIN_EMAIL_PERIOD, LOGIN_BACKOFF_MAX)
+
+
+def _new_state(capacity, now):
+    return {"tokens": float(capacity), "ts": now, "failures": 0, "blocked_until": 0.0}
+
+
+# === Хранилища ===
+class MemoryStore:
+    """Состояния ключей в OrderedDict в порядке последнего обращения.
+
+    TTL у всех одинаковый, поэтому этот порядок совпадает с порядком истечения:
+    просроченные ключи всегда в начале и вытесняются за O(1) на операцию.
+    """
+    blocking = False
+
+    def __init__(self, ttl=STATE_TTL, maxsize=RATE_LIMIT_KEYS):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def update(self, key, fn, now):
+        """Атомарно: state = fn(state или None) -> (новое состояние, результат)"""
+        with self._lock:
+            self._evict(now)
+            entry = self._data.pop(key, None)
+            state, result = fn(entry[1] if entry else None)
+            self._data[key] = (now + self.ttl, state)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return result
+
+    def _evict(self, now):
+        while self._data:
+            key, (expires, _) = next(iter(self._data.items()))
+            if expires > now:
+                break
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteStore:
+    """Общее для воркеров хранилище: одна строка на ключ, изменение в BEGIN IMMEDIATE"""
+    blocking = True
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path=RATE_LIMIT_DB, ttl=STATE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._ops = 0
+        self.evictions = 0
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                ts REAL NOT NULL,
+                failures INTEGER NOT NULL,
+                blocked_until REAL NOT NULL,
+                expires REAL NOT NULL
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limits_expires ON rate_limits (expires)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def update(self, key, fn, now):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, ts, failures, blocked_until FROM rate_limits "
+                               "WHERE key = ? AND expires > ?", (key, now)).fetchone()
+            state = dict(zip(("tokens", "ts", "failures", "blocked_until"), row)) if row else None
+            state, result = fn(state)
+            conn.execute("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?, ?)",
+                         (key, state["tokens"], state["ts"], state["failures"], state["blocked_until"],
+                          now + self.ttl))
+            self._ops += 1
+            if self._ops % self.CLEANUP_EVERY == 0:
+                self.evictions += conn.execute("DELETE FROM rate_limits WHERE expires <= ?", (now,)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+
+# === Ограничитель ===
+class Rule:
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period  # жетонов в секунду
+
+
+class LoginLimiter:
+    def __init__(self, store=None, rules=None, free_failures=LOGIN_FREE_FAILURES,
+                 backoff_base=LOGIN_BACKOFF_BASE, backoff_max=LOGIN_BACKOFF_MAX):
+        if store is None:
+            store = SqliteStore() if RATE_LIMIT_STORE == "sqlite" else MemoryStore()
+        self.store = store
+        self.rules = rules or {
+            "ip": Rule(LOGIN_IP_BURST, LOGIN_IP_PERIOD),
+            "email": Rule(LOGIN_EMAIL_BURST, LOGIN_EMAIL_PERIOD),
+        }
+        self.free_failures = free_failures
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Метрики
+        self.allowed = 0
+        self.denied = 0
+        self.blocks = 0
+
+    @staticmethod
+    def _keys(ip, email):
+        keys = []
+        if ip:
+            keys.append(("ip", f"ip:{ip}"))
+        if email:
+            keys.append(("email", f"email:{email.strip().lower()}"))
+        return keys
+
+    def _refill(self, state, rule, now):
+        if state is None:
+            return _new_state(rule.capacity, now)
+        state["tokens"] = min(rule.capacity, state["tokens"] + (now - state["ts"]) * rule.rate)
+        state["ts"] = now
+        return state
+
+    def attempt(self, ip, email):
+        """Сколько секунд ждать до следующей попытки; 0 - попытку можно делать"""
+        now = time.time()
+        retry_after = 0.0
+        for kind, key in self._keys(ip, email):
+            rule = self.rules[kind]
+
+            def take(state):
+                state = self._refill(state, rule, now)
+                if state["blocked_until"] > now:
+                    return state, state["blocked_until"] - now
+                if state["tokens"] < 1:
+                    return state, (1 - state["tokens"]) / rule.rate
+                state["tokens"] -= 1
+                return state, 0.0
+
+            retry_after = max(retry_after, self.store.update(key, take, now))
+        if retry_after > 0:
+            self.denied += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    def failure(self, ip, email):
+        """Неудачный вход: после free_failures ошибок ключ блокируется на base * 2^n секунд"""
+        now = time.time()
+        for kind, key in self._keys(ip, email):
+            rule = self.rules[kind]
+
+            def fail(state):
+                state = self._refill(state, rule, now)
+                state["failures"] += 1
+                over = state["failures"] - self.free_failures
+                if over >= 0:
+                    delay = min(self.backoff_base * 2 ** min(over, 32), self.backoff_max)
+                    state["blocked_until"] = now + delay
+                    self.blocks += 1
+                return state, None
+
+            self.store.update(key, fail, now)
+
+    def success(self, ip, email):
+        """Успешный вход сбрасывает ошибки email; IP не сбрасываем - иначе
+        один известный пароль снимал бы блокировку с перебора по другим адресам"""
+        now = time.time()
+        for kind, key in self._keys(None, email):
+            rule = self.rules[kind]
+
+            def reset(state):
+                state = self._refill(state, rule, now)
+                state["failures"] = 0
+                state["blocked_until"] = 0.0
+                return state, None
+
+            self.store.update(key, reset, now)
+
+    # SQLite-хранилище блокирует поток - из обработчиков вызываем через пул потоков
+    async def _call(self, method, *args):
+        if self.store.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def attempt_async(self, ip, email):
+        return await self._call(self.attempt, ip, email)
+
+    async def failure_async(self, ip, email):
+        return await self._call(self.failure, ip, email)
+
+    async def success_async(self, ip, email):
+        return await self._call(self.success, ip, email)
+
+    def stats(self):
+        return {
+            "keys": len(self.store),
+            "allowed": self.allowed,
+            "denied": self.denied,
+            "blocks": self.blocks,
+            "evictions": self.store.evictions,
+        }
@@ -0,0 +1,113 @@
+"""Кэш отрендеренных страниц с ETag / Last-Modified.
+
+Ключ страницы - имя шаблона, значимые параметры (пользователь, запрос
+поиска) и текущие версии тегов данных, от которых она зависит ("tips",
+"saved:<user_id>", "user:<user_id>"). Инвалидация - это увеличение версии
+тега: старые записи перестают совпадать с ключом и вытесняются по LRU/TTL.
+
+ETag считается из ключа без рендеринга, поэтому повторный визит с
+If-None-Match получает 304, даже не заглядывая в кэш. В ETag входит и
+номер сборки (build_id): хэш шаблонов и манифеста статики. Он одинаков у
+всех воркеров и меняется только вместе с файлами, которые влияют на HTML.
+Так можно только с версиями из cache_versions, которые переживают
+перезапуск. Счётчики в памяти после перезапуска снова начинаются с нуля, и
+ETag, выданный до него, совпал бы с ключом уже изменившейся страницы,
+поэтому в режиме memory к номеру сборки добавляется случайная метка запуска.
+
+Отрендеренные страницы у каждого процесса свои, а версии тегов берутся
+из RENDER_CACHE_VERSIONS:
+    memory - счётчики в памяти процесса, их увеличивает notify_change. Годится
+             только для одного процесса: изменение, сделанное другим воркером,
+             здесь не видно до истечения RENDER_CACHE_TTL.
+    db     - таблица cache_versions. Database увеличивает версию в той же
+             транзакции, что и сами данные, поэтому все воркеры видят изменение
+             сразу. Цена - один SELECT по первичному ключу на страницу с тегами.
+run.py включает db, если воркеров больше одного.
+"""
+import os, time, hashlib, secrets, threading
+from email.utils import formatdate, parsedate_to_datetime
+
+from cache import TTLCache
+
+RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", "2000"))
+RENDER_CACHE_TTL = float(os.environ.get("RENDER_CACHE_TTL", "300"))
+RENDER_CACHE_VERSIONS = os.environ.get("RENDER_CACHE_VERSIONS", "memory")
+# Явный номер сборки (например, git rev из CI) вместо хэша файлов
+RENDER_BUILD = os.environ.get("RENDER_BUILD", "")
+
+
+def build_id(*paths):
+    """Хэш содержимого файлов и каталогов (рекурсивно, в порядке имён)"""
+    if RENDER_BUILD:
+        return RENDER_BUILD
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        elif os.path.isfile(path):
+            files = [path]
+        else:
+            continue
+        for name in files:
+            digest.update(os.path.relpath(name, path).encode("utf-8") + b"\0")
+            with open(name, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class RenderCache:
+    def __init__(self, maxsize=RENDER_CACHE_SIZE, ttl=RENDER_CACHE_TTL, load_versions=None, build=""):
+        self.pages = TTLCache(maxsize=maxsize, ttl=ttl)
+        # async (теги) -> {тег: версия} из общей таблицы; None - счётчики в памяти
+        self.load_versions = load_versions
+        self._versions = {}
+        self._lock = threading.Lock()
+        # Новые шаблоны или статика - новые ETag, старые 304 не отдаются;
+        # счётчики в памяти обнуляются при перезапуске - ETag тоже новые
+        self._build = build if load_versions is not None else f"{build}:{secrets.token_hex(8)}"
+        self.not_modified = 0
+
+    def invalidate(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    async def key(self, template, params=(), tags=()):
+        if self.load_versions is not None and tags:
+            loaded = await self.load_versions(tags)
+            versions = tuple(loaded.get(tag, 0) for tag in tags)
+        else:
+            with self._lock:
+                versions = tuple(self._versions.get(tag, 0) for tag in tags)
+        return template, tuple(params), tuple(tags), versions
+
+    def etag(self, key):
+        digest = hashlib.sha1(repr((self._build, key)).encode("utf-8")).hexdigest()[:20]
+        return f'W/"{digest}"'
+
+    def get(self, key):
+        """(body, last_modified) или None"""
+        return self.pages.get(key)
+
+    def store(self, key, body):
+        entry = (body, formatdate(time.time(), usegmt=True))
+        self.pages.set(key, entry)
+        return entry
+
+    def is_fresh(self, headers, etag, entry):
+        """Можно ли ответить 304 на условный запрос"""
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            return etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since and entry is not None:
+            try:
+                return parsedate_to_datetime(entry[1]) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def stats(self):
+        stats = self.pages.stats()
+        stats["not_modified"] = self.not_modified
+        stats["shared_versions"] = self.load_versions is not None
+        return stats
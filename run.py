@@ -0,0 +1,61 @@
+"""Запуск приложения.
+
+    python run.py --workers 4          # боевой режим, воркеров по числу ядер: --workers auto
+    python run.py --init-db            # только создать таблицы и начальные данные
+    python run.py --reload             # разработка (то же, что python main.py)
+
+Таблицы и начальные данные создаются здесь один раз, до запуска воркеров,
+а не при импорте database. Ключ сессий общий для всех воркеров: SESSION_SECRET
+из окружения или файл .session_secret (см. main.session_secret).
+
+Состояние в памяти у каждого воркера своё: кэш страниц и пользователей
+живут до своего TTL. При нескольких воркерах по умолчанию лимиты входа
+хранятся в общем SQLite (RATE_LIMIT_STORE=sqlite), а версии кэша страниц -
+в таблице cache_versions (RENDER_CACHE_VERSIONS=db).
+"""
+import os, sys, argparse
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", default=os.environ.get("WEB_CONCURRENCY", "1"),
+                        help="number of worker processes or 'auto' (one per CPU)")
+    parser.add_argument("--reload", action="store_true", help="development mode, single process")
+    parser.add_argument("--init-db", action="store_true", help="create tables and seed data, then exit")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    workers = (os.cpu_count() or 1) if args.workers == "auto" else int(args.workers)
+    if args.reload and workers > 1:
+        print("--reload runs a single process, ignoring --workers", file=sys.stderr)
+        workers = 1
+
+    from database import db
+    db.setup()
+    db.close()
+    # Устаревшую сборку статики пересобираем один раз, а не в каждом воркере
+    import assets
+    assets.load_manifest()
+    if args.init_db:
+        print(f"Database ready: {db.path}")
+        return 0
+
+    # Переменные окружения наследуют процессы воркеров
+    os.environ["DB_SETUP"] = "0"
+    if workers > 1:
+        os.environ.setdefault("RATE_LIMIT_STORE", "sqlite")
+        os.environ.setdefault("RENDER_CACHE_VERSIONS", "db")
+
+    import uvicorn
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers, reload=args.reload,
+                log_level=args.log_level, proxy_headers=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
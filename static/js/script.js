@@ -1,6 +1,15 @@
 document.addEventListener('DOMContentLoaded', function(){
     console.log("DOM Content Loaded - Password Checker");
 
+    // Send progress changes to the server (batched there, see progress.py)
+    function syncProgress(patch){
+        fetch('/api/progress', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(patch)
+        }).catch(error => console.error('Error syncing progress:', error));
+    }
+
     // Acknowledge info
     const ackBtn = document.getElementById('acknowledgeBtn');
     if(ackBtn){
@@ -12,6 +21,7 @@ document.addEventListener('DOMContentLoaded', function(){
         }
         ackBtn.addEventListener('click', function(){
             localStorage.setItem('infoViewed','true');
+            syncProgress({info_viewed: true});
             ackBtn.textContent='Ознакомлено ✓';
             ackBtn.disabled=true;
             ackBtn.style.background='#00C851';
@@ -45,6 +55,7 @@ document.addEventListener('DOMContentLoaded', function(){
             console.log("Checking password:", password);
             const result = updatePasswordStrength(password);
             showNotification('Пароль проверен. Оценка: ' + result.score + '%', 'info');
+            checkPasswordBreach(password);
 
             // Automatically suggest saving good passwords
             if (result.score >= 80) {
@@ -97,15 +108,15 @@ document.addEventListener('DOMContentLoaded', function(){
             if(score <= 2){
                 prog.style.background = 'var(--red)';
                 if(pwdLabel) pwdLabel.textContent='Слабый пароль';
-                localStorage.setItem('passwordChecked','false');
+                setPasswordChecked(false);
             } else if(score === 3){
                 prog.style.background = '#f1c40f';
                 if(pwdLabel) pwdLabel.textContent='Средний пароль';
-                localStorage.setItem('passwordChecked','false');
+                setPasswordChecked(false);
             } else {
                 prog.style.background = 'var(--green)';
                 if(pwdLabel) pwdLabel.textContent='Надёжный пароль';
-                localStorage.setItem('passwordChecked','true');
+                setPasswordChecked(true);
             }
         }
 
@@ -115,6 +126,32 @@ document.addEventListener('DOMContentLoaded', function(){
         return {score: pct, requirements: requirements};
     }
 
+    // Check password against the server-side breach index
+    async function checkPasswordBreach(password){
+        try {
+            const response = await fetch('/api/check-breach', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({password: password})
+            });
+            const result = await response.json();
+            if(result.breached){
+                showNotification('Этот пароль найден в базе утечек! Не используйте его.', 'error');
+            }
+        } catch (error) {
+            console.error('Error checking breach:', error);
+        }
+    }
+
+    // Only sync when the status actually changes, not on every keystroke
+    function setPasswordChecked(value){
+        const v = value ? 'true' : 'false';
+        if(localStorage.getItem('passwordChecked') !== v){
+            localStorage.setItem('passwordChecked', v);
+            syncProgress({password_checked: value});
+        }
+    }
+
     // Password requirements display
     function updatePasswordRequirements(requirements){
         console.log("updatePasswordRequirements called with:", requirements);
@@ -139,66 +176,93 @@ document.addEventListener('DOMContentLoaded', function(){
         }
     }
 
-    // Trainer (mini-game): one question at a time, random order
+    // Trainer (mini-game): questions come from the server, answers are graded there (see trainer.py)
     const quizEl = document.getElementById('quiz-container');
     if(quizEl){
         console.log("Found quiz container");
-        const pool = [
-            {q:'Выберите самый надёжный пароль', opts:['123456','qwerty','M#9k!2zL@7pT'], correct:2},
-            {q:'Выберите самый лёгкий пароль', opts:['P@ssw0rd123','admin','S!lverM00n!'], correct:1},
-            {q:'Какой пароль самый надёжный?', opts:['1q2w3e','K@9b*L3!nV','password'], correct:1},
-            {q:'Выберите ненадёжный пароль', opts:['LetMeIn','H#2rL!xT7z','Dr@gon$5'], correct:0},
-            {q:'Выберите надёжный пароль', opts:['Qwerty','123456789','B$7k@L9#tM'], correct:2},
-            {q:'Какой пароль слабый?', opts:['G@laxy$4P','sunshine','N0va!xT#3'], correct:1},
-            {q:'Выберите надёжный пароль', opts:['Football1','Z@p!rK#7qP','111111'], correct:1},
-            {q:'Какой пароль небезопасный?', opts:['AaBbCc','Strong#Pass9!','MyCat123'], correct:0},
-            {q:'Выберите сильный пароль', opts:['X#9tR$8v!','welcome','Password1'], correct:0},
-            {q:'Выберите слабый пароль', opts:['R@nd0mP@ss','monkey','Star$5Sky'], correct:1}
-        ];
-
-        let questions = [...pool].sort(()=>Math.random()-0.5);
-        let idx = 0;
-        let score = 0;
         const qText = document.getElementById('question');
         const answers = document.getElementById('answers');
         const feedback = document.getElementById('feedback');
         const nextBtn = document.getElementById('nextBtn');
         const resultEl = document.getElementById('result');
+        let questions = [];
+        let chosen = [];
+        let idx = 0;
 
-        function showQuestion(){
-            if(idx >= questions.length){
-                // Game completed
-                resultEl.textContent = 'Итог: ' + score + ' / ' + questions.length;
-                resultEl.style.fontWeight = 'bold';
-                resultEl.style.fontSize = '1.2em';
-
-                if(score >= 8){
-                    resultEl.style.color = 'var(--green)';
-                    resultEl.innerHTML += ' 🎉 Отлично!';
-                } else if(score >= 5){
-                    resultEl.style.color = '#f1c40f';
-                    resultEl.innerHTML += ' 👍 Хорошо';
-                } else {
-                    resultEl.style.color = 'var(--red)';
-                    resultEl.innerHTML += ' 😔 Попробуйте ещё раз';
-                }
+        async function postJSON(url, data){
+            const response = await fetch(url, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify(data)
+            });
+            if(!response.ok){
+                throw new Error('HTTP ' + response.status);
+            }
+            return response.json();
+        }
 
-                localStorage.setItem('trainerPassed', score >= 8 ? 'true' : 'false');
-                localStorage.setItem('trainerScore', score);
-                answers.innerHTML='';
-                qText.textContent='Тренажёр завершён';
-                nextBtn.style.display='none';
+        function showReview(result){
+            // Correct answers are only revealed once the whole attempt is submitted
+            qText.textContent='Тренажёр завершён';
+            answers.innerHTML='';
+            feedback.textContent='';
+            questions.forEach((q,i)=>{
+                const item = document.createElement('p');
+                const mark = result.correct[i] ? '✓ ' : '✗ ';
+                item.textContent = mark + (i+1) + '. ' + q.question + ' — ' + q.options[result.correct_answers[i]];
+                item.style.color = result.correct[i] ? 'var(--green)' : 'var(--red)';
+                answers.appendChild(item);
+            });
+        }
+
+        function showResult(result){
+            resultEl.textContent = 'Итог: ' + result.score + ' / ' + result.total;
+            resultEl.style.fontWeight = 'bold';
+            resultEl.style.fontSize = '1.2em';
+
+            if(result.passed){
+                resultEl.style.color = 'var(--green)';
+                resultEl.innerHTML += ' 🎉 Отлично!';
+            } else if(result.score >= result.total / 2){
+                resultEl.style.color = '#f1c40f';
+                resultEl.innerHTML += ' 👍 Хорошо';
+            } else {
+                resultEl.style.color = 'var(--red)';
+                resultEl.innerHTML += ' 😔 Попробуйте ещё раз';
+            }
+
+            // Result is already saved on the server, localStorage only feeds the profile statuses
+            localStorage.setItem('trainerPassed', result.passed ? 'true' : 'false');
+            localStorage.setItem('trainerScore', result.score);
+            nextBtn.style.display='none';
+        }
+
+        async function submitAttempt(){
+            qText.textContent='Проверяем ответы...';
+            answers.innerHTML='';
+            feedback.textContent='';
+            let result;
+            try {
+                result = await postJSON('/api/trainer/submit', {answers: chosen});
+            } catch (error) {
+                console.error('Error submitting answers:', error);
+                feedback.textContent='Не удалось отправить ответы, начните заново';
+                feedback.style.color='var(--red)';
                 return;
             }
+            showReview(result);
+            showResult(result);
+        }
 
+        function showQuestion(){
             const cur = questions[idx];
-            qText.textContent = (idx+1) + '. ' + cur.q;
+            qText.textContent = (idx+1) + '. ' + cur.question;
             answers.innerHTML='';
             feedback.textContent='';
             feedback.style.color='';
             nextBtn.style.display='none';
 
-            cur.opts.forEach((opt,i)=>{
+            cur.options.forEach((opt,i)=>{
                 const b = document.createElement('button');
                 b.className='btn secondary';
                 b.textContent = opt;
@@ -208,31 +272,17 @@ document.addEventListener('DOMContentLoaded', function(){
                 b.style.padding = '10px';
 
                 b.addEventListener('click', ()=>{
-                    const isCorrect = i === cur.correct;
-
-                    if(isCorrect){
-                        feedback.textContent='Верно! ✅';
-                        feedback.style.color='var(--green)';
-                        b.style.background = 'var(--green)';
-                        b.style.color = 'white';
-                        score++;
-                    } else {
-                        feedback.textContent='Неверно! ❌';
-                        feedback.style.color='var(--red)';
-                        b.style.background = 'var(--red)';
-                        b.style.color = 'white';
-
-                        // Highlight correct answer
-                        const correctBtn = answers.children[cur.correct];
-                        correctBtn.style.background = 'var(--green)';
-                        correctBtn.style.color = 'white';
-                    }
-
+                    // Answers stay in the page until the attempt is submitted, one request for the whole set
                     Array.from(answers.querySelectorAll('button')).forEach(x=>{
                         x.disabled=true;
                         x.style.cursor='not-allowed';
                     });
-
+                    b.style.background = 'var(--orange)';
+                    b.style.color = 'white';
+                    chosen[idx] = i;
+                    feedback.textContent='Ответ принят';
+                    feedback.style.color='';
+                    nextBtn.textContent = idx + 1 < questions.length ? 'Следующий вопрос' : 'Завершить';
                     nextBtn.style.display='block';
                 });
                 answers.appendChild(b);
@@ -241,10 +291,23 @@ document.addEventListener('DOMContentLoaded', function(){
 
         nextBtn.addEventListener('click', ()=>{
             idx++;
-            showQuestion();
+            if(idx < questions.length){
+                showQuestion();
+            } else {
+                nextBtn.style.display='none';
+                submitAttempt();
+            }
         });
 
-        showQuestion();
+        postJSON('/api/trainer/start', {}).then(data=>{
+            questions = data.questions;
+            chosen = [];
+            idx = 0;
+            showQuestion();
+        }).catch(error=>{
+            console.error('Error starting trainer:', error);
+            qText.textContent = 'Не удалось загрузить вопросы тренажёра';
+        });
     }
 
     // Profile statuses with enhanced display
@@ -272,8 +335,27 @@ document.addEventListener('DOMContentLoaded', function(){
         }
     }
 
+    // Load progress saved on the server into localStorage
+    async function loadServerProgress(){
+        try {
+            const response = await fetch('/api/progress');
+            if(!response.ok) return;
+            const progress = await response.json();
+            localStorage.setItem('infoViewed', progress.info_viewed ? 'true' : 'false');
+            localStorage.setItem('trainerPassed', progress.trainer_passed ? 'true' : 'false');
+            localStorage.setItem('trainerScore', progress.trainer_score || 0);
+            localStorage.setItem('passwordChecked', progress.password_checked ? 'true' : 'false');
+            updateProfileStatuses();
+        } catch (error) {
+            console.error('Error loading progress:', error);
+        }
+    }
+
     // Initialize profile statuses
     updateProfileStatuses();
+    if(document.getElementById('ackStatus') || document.getElementById('trainerStatus')){
+        loadServerProgress();
+    }
 
     // Notification system
     function showNotification(message, type = 'info') {
@@ -373,9 +455,9 @@ document.addEventListener('DOMContentLoaded', function(){
     const generatePwdBtn = document.getElementById('generatePwdBtn');
     if(generatePwdBtn && pwdInput){
         console.log("Found generate password button");
-        generatePwdBtn.addEventListener('click', function(){
+        generatePwdBtn.addEventListener('click', async function(){
             console.log("Generate password clicked");
-            const generatedPassword = generateStrongPassword();
+            const generatedPassword = await generateStrongPassword();
             pwdInput.value = generatedPassword;
             updatePasswordStrength(generatedPassword);
             updateSaveButton(generatedPassword);
@@ -383,7 +465,25 @@ document.addEventListener('DOMContentLoaded', function(){
         });
     }
 
-    function generateStrongPassword(){
+    // Generated on the server from a CSPRNG (see generator.py); local generation is only a fallback
+    async function generateStrongPassword(){
+        try {
+            const response = await fetch('/api/generate', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({count: 1, kind: 'password', length: 16})
+            });
+            if(response.ok){
+                const data = await response.json();
+                return data.passwords[0];
+            }
+        } catch (error) {
+            console.error('Error generating password:', error);
+        }
+        return generateLocalPassword();
+    }
+
+    function generateLocalPassword(){
         const chars = {
             upper: 'ABCDEFGHIJKLMNOPQRSTUVWXYZ',
             lower: 'abcdefghijklmnopqrstuvwxyz',
@@ -420,6 +520,7 @@ document.addEventListener('DOMContentLoaded', function(){
                 localStorage.removeItem('passwordChecked');
                 localStorage.removeItem('passwordGameProgress');
                 localStorage.removeItem('passwordGameCompleted');
+                syncProgress({info_viewed: false, trainer_score: 0, trainer_passed: false, password_checked: false});
                 updateProfileStatuses();
                 showNotification('Прогресс сброшен', 'info');
             }
@@ -501,7 +602,8 @@ document.addEventListener('DOMContentLoaded', function(){
 
             const result = await response.json();
             if (result.success) {
-                showNotification('Пароль сохранен в избранное!', 'success');
+                showNotification(result.breached ? 'Пароль сохранен, но он найден в базе утечек!' : 'Пароль сохранен в избранное!',
+                                 result.breached ? 'warning' : 'success');
 
                 // Suggest going to favorites
                 setTimeout(() => {
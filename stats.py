@@ -0,0 +1,141 @@
+"""Статистика сохранённых паролей и тренажёра для профиля и /api/stats.
+
+Сводка строится из агрегатов, которые Database обновляет приращениями в
+той же транзакции, что и сами данные (таблицы strength_histogram,
+strength_daily, trainer_daily), поэтому чтение не зависит от числа
+сохранённых паролей. Оценка - целое число 0-100, гистограмма хранит каждое
+значение, и медиана по ней точная.
+
+Сводка по сайту - те же таблицы с user_id <= SITE_STATS. Приращения оценок
+пишутся не в одну общую строку, а в одну из STATS_SITE_SHARDS строк-шардов
+(user_id от -1 до -STATS_SITE_SHARDS, по id пользователя): иначе каждое
+сохранение пароля на сайте ждало бы блокировку одной строки. При чтении шарды
+суммируются вместе со строкой SITE_STATS (начальные значения из миграции).
+Сводку тренажёра пишет пачками AttemptBuffer, ей шарды не нужны.
+"""
+import os, datetime
+from collections import Counter
+
+from strength import STRONG_SCORE, MEDIUM_SCORE
+
+STATS_TREND_DAYS = int(os.environ.get("STATS_TREND_DAYS", "30"))
+# user_id сводки по всему сайту (id пользователей начинаются с 1)
+SITE_STATS = 0
+STATS_SITE_SHARDS = int(os.environ.get("STATS_SITE_SHARDS", "16"))
+
+
+def level(score):
+    if score >= STRONG_SCORE:
+        return "strong"
+    if score >= MEDIUM_SCORE:
+        return "medium"
+    return "weak"
+
+
+def trend_since(days=STATS_TREND_DAYS):
+    """Первый день окна динамики (как в strength_daily.day - YYYY-MM-DD)"""
+    return (datetime.datetime.utcnow().date() - datetime.timedelta(days=days - 1)).isoformat()
+
+
+# === Приращения ===
+def site_shard(user_id):
+    """Строка сводки по сайту, в которую пишет пользователь (см. docstring модуля)"""
+    return SITE_STATS - 1 - user_id % STATS_SITE_SHARDS
+
+
+def strength_deltas(user_id, rows, sign=1):
+    """Сохранённые (sign=1) или удалённые (sign=-1) пароли -> параметры UPSERT.
+
+    rows - пары (strength_score, created_at). Возвращает строки для
+    strength_histogram (user_id, score, count) и strength_daily
+    (user_id, day, count, score_sum) - для пользователя и для его шарда сайта.
+    Отсортированы по ключу: параллельные транзакции берут блокировки строк
+    в одном порядке.
+    """
+    histogram = Counter()
+    daily = Counter()
+    daily_sum = Counter()
+    owners = (user_id, site_shard(user_id))
+    for score, created_at in rows:
+        if score is None:
+            continue
+        for owner in owners:
+            histogram[owner, score] += sign
+            if created_at:
+                daily[owner, created_at[:10]] += sign
+                daily_sum[owner, created_at[:10]] += sign * score
+    return ([(owner, score, count) for (owner, score), count in sorted(histogram.items())],
+            [(owner, day, count, daily_sum[owner, day]) for (owner, day), count in sorted(daily.items())])
+
+
+def trainer_results(rows):
+    """Завершённые попытки (trainer.attempt_row) -> строки trainer_daily
+    (user_id, day, results, passed, score_sum, best_score).
+
+    Каждая попытка - отдельный результат, в том числе нулевой; день - по
+    finished_at. Попытки одного дня сложены в одну строку.
+    """
+    daily = {}
+    for row in rows:
+        user_id, score, passed, finished_at = row[0], row[3], row[5], row[7]
+        for owner in (user_id, SITE_STATS):
+            key = owner, finished_at[:10]
+            results, passed_sum, score_sum, best = daily.get(key, (0, 0, 0, score))
+            daily[key] = (results + 1, passed_sum + (1 if passed else 0), score_sum + score, max(best, score))
+    return [(owner, day, *values) for (owner, day), values in sorted(daily.items())]
+
+
+# === Сводка ===
+def median(histogram):
+    """Медиана по гистограмме [(оценка, число)], отсортированной по оценке"""
+    total = sum(count for _, count in histogram)
+    if not total:
+        return None
+    # Позиции средних элементов (для чётного числа - два)
+    middle = {(total - 1) // 2, total // 2}
+    values, seen = [], 0
+    for score, count in histogram:
+        for position in sorted(middle):
+            if seen <= position < seen + count:
+                values.append(score)
+        seen += count
+    return sum(values) / len(values)
+
+
+def _average(total, count):
+    return round(total / count, 1) if count else None
+
+
+def summarize(histogram, daily, trainer, days=STATS_TREND_DAYS):
+    """Строки агрегатов -> сводка для шаблона и API.
+
+    histogram - (score, count) по возрастанию оценки, daily - (day, count,
+    score_sum), trainer - (day, results, passed, score_sum, best_score), оба
+    по возрастанию дня и только за окно динамики.
+    """
+    histogram = [(row[0], row[1]) for row in histogram if row[1] > 0]
+    total = sum(count for _, count in histogram)
+    distribution = {"weak": 0, "medium": 0, "strong": 0}
+    for score, count in histogram:
+        distribution[level(score)] += count
+
+    trend = [{"day": row[0], "count": row[1], "average_score": _average(row[2], row[1])}
+             for row in daily if row[1] > 0]
+    history = [{"day": row[0], "results": row[1], "passed": row[2],
+                "average_score": _average(row[3], row[1]), "best_score": row[4]}
+               for row in trainer]
+    return {
+        "passwords": total,
+        "average_score": _average(sum(score * count for score, count in histogram), total),
+        "median_score": median(histogram),
+        "distribution": distribution,
+        "histogram": [{"score": score, "count": count} for score, count in histogram],
+        "days": days,
+        "trend": trend,
+        "trainer": {
+            "results": sum(h["results"] for h in history),
+            "passed": sum(h["passed"] for h in history),
+            "best_score": max((h["best_score"] for h in history), default=None),
+            "history": history,
+        },
+    }
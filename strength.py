@@ -0,0 +1,159 @@
+"""Серверная оценка надёжности паролей.
+
+Шкала совпадает с клиентской (calculatePasswordScore в script.js): 20 баллов
+за каждое из пяти требований. Сверху накладываются штрафы за клавиатурные и
+алфавитные последовательности, повторы и словарные пароли, а итог
+ограничивается оценкой энтропии.
+
+password_errors - обязательные правила пароля при регистрации.
+"""
+import math, re
+
+SPECIALS = "!@#$%^&*()_+-=[]{}|;:,.<>?"
+MIN_LENGTH = 8
+MAX_BATCH = 100000
+
+KEYBOARD_ROWS = [
+    "`1234567890-=", "qwertyuiop[]", "asdfghjkl;'", "zxcvbnm,./",
+    "ёйцукенгшщзхъ", "фывапролджэ", "ячсмитьбю",
+]
+ALPHABETS = ["abcdefghijklmnopqrstuvwxyz", "абвгдеёжзийклмнопрстуфхцчшщъыьэюя", "0123456789"]
+COMMON_PASSWORDS = {
+    "password", "passw0rd", "qwerty", "123456", "12345678", "123456789", "111111", "admin",
+    "letmein", "welcome", "monkey", "dragon", "football", "sunshine", "iloveyou", "master",
+    "login", "princess", "abc123", "starwars", "пароль", "йцукен",
+}
+SEQUENCE_MIN = 3
+# Границы уровней: надёжный, средний, ниже - слабый
+STRONG_SCORE = 80
+MEDIUM_SCORE = 60
+
+_REPEAT_RE = re.compile(r"(.)\1{2,}")
+_LEET = str.maketrans("@0134$5!7", "aoieassit")
+
+
+def _build_sequences():
+    """Все подстроки длины SEQUENCE_MIN из рядов клавиатуры и алфавитов (в обе стороны)"""
+    sequences = set()
+    for line in KEYBOARD_ROWS + ALPHABETS:
+        for text in (line, line[::-1]):
+            for i in range(len(text) - SEQUENCE_MIN + 1):
+                sequences.add(text[i:i + SEQUENCE_MIN])
+    return frozenset(sequences)
+
+
+_SEQUENCES = _build_sequences()
+
+
+def _charset_size(classes, password):
+    size = 0
+    if classes["lower"]:
+        size += 26
+    if classes["upper"]:
+        size += 26
+    if classes["digit"]:
+        size += 10
+    if classes["special"]:
+        size += len(SPECIALS)
+    if any(ord(c) > 127 for c in password):
+        size += 33
+    return size
+
+
+def _find_patterns(lowered):
+    patterns = []
+    seq_chars = 0
+    i = 0
+    while i <= len(lowered) - SEQUENCE_MIN:
+        if lowered[i:i + SEQUENCE_MIN] in _SEQUENCES:
+            j = i + SEQUENCE_MIN
+            while j < len(lowered) and lowered[j - SEQUENCE_MIN + 1:j + 1] in _SEQUENCES:
+                j += 1
+            patterns.append("sequence")
+            seq_chars += j - i
+            i = j
+        else:
+            i += 1
+    for match in _REPEAT_RE.finditer(lowered):
+        patterns.append("repeat")
+        seq_chars += len(match.group(0))
+    base = lowered.rstrip("0123456789!").translate(_LEET)
+    if lowered in COMMON_PASSWORDS or base in COMMON_PASSWORDS:
+        patterns.append("common")
+    return patterns, seq_chars
+
+
+def password_errors(password):
+    """Правила пароля при регистрации (и для сгенерированных): список нарушений, пустой - подходит"""
+    errors = []
+    if len(password) < MIN_LENGTH:
+        errors.append(f"Пароль должен быть минимум {MIN_LENGTH} символов")
+    if not any(c.isupper() for c in password):
+        errors.append("Пароль должен содержать хотя бы одну заглавную букву")
+    if not any(c.islower() for c in password):
+        errors.append("Пароль должен содержать хотя бы одну строчную букву")
+    if not any(c.isdigit() for c in password):
+        errors.append("Пароль должен содержать хотя бы одну цифру")
+    if not any(c in SPECIALS for c in password):
+        errors.append(f"Пароль должен содержать хотя бы один специальный символ ({SPECIALS})")
+    return errors
+
+
+def score_password(password):
+    """Оценка одного пароля: score 0-100, энтропия в битах, классы символов и найденные шаблоны"""
+    classes = {
+        "length": len(password) >= 8,
+        "upper": False,
+        "lower": False,
+        "digit": False,
+        "special": False,
+    }
+    for c in password:
+        if c.isupper():
+            classes["upper"] = True
+        elif c.islower():
+            classes["lower"] = True
+        elif c.isdigit():
+            classes["digit"] = True
+        else:
+            classes["special"] = True
+
+    lowered = password.lower()
+    patterns, pattern_chars = _find_patterns(lowered)
+
+    # Символы внутри последовательностей почти не добавляют энтропии
+    effective_len = max(len(password) - pattern_chars, 0) + pattern_chars * 0.25
+    charset = _charset_size(classes, password)
+    entropy = effective_len * math.log2(charset) if charset > 1 else 0.0
+
+    score = sum(20 for ok in classes.values() if ok)
+    score -= 10 * len(set(patterns) - {"common"})
+    if "common" in patterns or entropy < 28:
+        score = min(score, 20)
+    elif entropy < 36:
+        score = min(score, 40)
+    elif entropy < 60:
+        score = min(score, 80)
+    score = max(score, 0)
+
+    if score >= STRONG_SCORE:
+        label = "Надёжный пароль"
+    elif score >= MEDIUM_SCORE:
+        label = "Средний пароль"
+    else:
+        label = "Слабый пароль"
+
+    return {
+        "score": score,
+        "label": label,
+        "entropy": round(entropy, 1),
+        "classes": classes,
+        "patterns": sorted(set(patterns)),
+    }
+
+
+def score_passwords(passwords):
+    """Пакетная оценка - один проход по списку без повторной подготовки таблиц"""
+    if len(passwords) > MAX_BATCH:
+        raise ValueError(f"Too many passwords in one batch (max {MAX_BATCH})")
+    return [score_password(p) for p in passwords]
@@ -0,0 +1,104 @@
+"""Подготовка текста советов для полнотекстового поиска (FTS5).
+
+В индекс password_tips_fts кладётся текст, прошедший через stem_text:
+слова в нижнем регистре, ё -> е, у русских слов срезаны окончания
+(упрощённый стеммер в духе Snowball). Запрос проходит ту же обработку,
+поэтому "пароли", "паролей" и "пароль" находят друг друга.
+"""
+import re
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_RUSSIAN_RE = re.compile(r"^[а-я]+$")
+_VOWELS = "аеиоуыэюя"
+
+# Группы окончаний по алгоритму Snowball для русского языка.
+# Окончания из *_AFTER_A допускаются только после "а" или "я".
+_GERUND_AFTER_A = ("вшись", "вши", "в")
+_GERUND = ("ившись", "ывшись", "ивши", "ывши", "ив", "ыв")
+_ADJECTIVE = ("ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой",
+              "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею")
+_PARTICIPLE_AFTER_A = ("ем", "нн", "вш", "ющ", "щ")
+_PARTICIPLE = ("ивш", "ывш", "ующ")
+_REFLEXIVE = ("ся", "сь")
+_VERB_AFTER_A = ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть",
+                 "й", "л", "н")
+_VERB = ("ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует", "уют", "ены",
+         "ить", "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят", "ит", "ыт", "ую", "ю")
+_NOUN = ("иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии", "ей", "ой",
+         "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья", "а", "е", "и", "й", "о", "у",
+         "ы", "ь", "ю", "я")
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+
+def _strip(word, start, endings, after_a=()):
+    """Срезаем самое длинное подходящее окончание, лежащее целиком правее start"""
+    best = None
+    for ending in after_a:
+        cut = len(word) - len(ending)
+        if word.endswith(ending) and cut - 1 >= start and word[cut - 1] in "ая":
+            best = cut
+            break
+    for ending in endings:
+        cut = len(word) - len(ending)
+        if word.endswith(ending) and cut >= start and (best is None or cut < best):
+            best = cut
+            break
+    return (word[:best], True) if best is not None else (word, False)
+
+
+def _region(word, start):
+    """Начало области после первой пары гласная+согласная (R1/R2 в Snowball)"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+
+def stem(word):
+    word = word.lower().replace("ё", "е")
+    if not _RUSSIAN_RE.match(word):
+        return word
+
+    # RV - часть слова после первой гласной, окончания срезаются только из неё
+    rv = next((i + 1 for i, c in enumerate(word) if c in _VOWELS), len(word))
+    r2 = _region(word, _region(word, 0))
+
+    word, done = _strip(word, rv, _GERUND, _GERUND_AFTER_A)
+    if not done:
+        word, _ = _strip(word, rv, _REFLEXIVE)
+        word, done = _strip(word, rv, _ADJECTIVE)
+        if done:
+            word, _ = _strip(word, rv, _PARTICIPLE, _PARTICIPLE_AFTER_A)
+        else:
+            word, done = _strip(word, rv, _VERB, _VERB_AFTER_A)
+            if not done:
+                word, _ = _strip(word, rv, _NOUN)
+
+    word, _ = _strip(word, rv, ("и",))
+    word, _ = _strip(word, r2, _DERIVATIONAL)
+
+    if word.endswith("нн") and len(word) - 1 >= rv:
+        return word[:-1]
+    word, done = _strip(word, rv, _SUPERLATIVE)
+    if done and word.endswith("нн"):
+        return word[:-1]
+    if not done:
+        word, _ = _strip(word, rv, ("ь",))
+    return word
+
+
+def stem_text(text):
+    """Текст -> строка основ через пробел (используется SQL-функцией ru_stem)"""
+    if not text:
+        return ""
+    return " ".join(stem(w) for w in _WORD_RE.findall(text))
+
+
+def match_query(query):
+    """Строка поиска -> выражение MATCH для FTS5 (все слова, поиск по префиксу) или None"""
+    terms = [stem(w) for w in _WORD_RE.findall(query or "")]
+    terms = [t for t in terms if t]
+    if not terms:
+        return None
+    return " ".join(f'"{t}"*' for t in terms)
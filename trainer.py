@@ -0,0 +1,218 @@
+"""Тренажёр: вопросы в базе, наборы из пула в памяти, проверка ответов на сервере.
+
+Активные вопросы загружаются из trainer_questions в QuestionPool и
+перечитываются раз в TRAINER_POOL_TTL секунд, так что правка вопросов в базе
+доходит до всех воркеров без перезапуска. Вопросы в том виде, в каком их
+получает клиент (без правильных ответов), подготовлены в пуле заранее.
+Набор - случайная выборка TRAINER_SET_SIZE вопросов. За вопрос к базе не
+обращаемся: клиент копит ответы у себя и сдаёт всю попытку одним запросом.
+
+Состояние попытки (вопросы набора) хранится на сервере, в trainer_sessions, а
+в cookie сессии - только случайный id попытки, поэтому сдать попытку можно на
+любом воркере. В базу попытка пишется дважды: при старте и при сдаче, когда
+запись удаляется (DELETE ... RETURNING), так что повтор запроса или старой
+cookie попытку уже не найдёт. Правильные ответы клиент узнаёт только в итоге.
+Брошенные попытки удаляются через TRAINER_SESSION_TTL секунд.
+
+Завершённые попытки пишутся пачками через AttemptBuffer (как прогресс в
+progress.py). В trainer_attempts попадают вопросы, ответы и итог - по ним
+результат можно перепроверить.
+"""
+import os, json, math, time, random, asyncio, secrets, datetime
+
+TRAINER_SET_SIZE = int(os.environ.get("TRAINER_SET_SIZE", "10"))
+# Доля верных ответов для прохождения: 8 из 10, как было в script.js
+TRAINER_PASS_RATIO = float(os.environ.get("TRAINER_PASS_RATIO", "0.8"))
+TRAINER_POOL_TTL = float(os.environ.get("TRAINER_POOL_TTL", "300"))
+TRAINER_FLUSH_INTERVAL = float(os.environ.get("TRAINER_FLUSH_INTERVAL", "2"))
+TRAINER_FLUSH_SIZE = int(os.environ.get("TRAINER_FLUSH_SIZE", "500"))
+TRAINER_SESSION_TTL = float(os.environ.get("TRAINER_SESSION_TTL", "3600"))
+
+_random = random.SystemRandom()
+
+
+class TrainerError(Exception):
+    """Сдача не по правилам попытки (её нет, не те ответы) - ответ 409"""
+
+
+def pass_score(total):
+    return math.ceil(total * TRAINER_PASS_RATIO)
+
+
+# === Пул вопросов ===
+class QuestionPool:
+    def __init__(self, ttl=TRAINER_POOL_TTL):
+        self.ttl = ttl
+        self._correct = {}
+        self._public = {}
+        self._ids = ()
+        self._loaded_at = None
+        # Метрики
+        self.loads = 0
+        self.sets_served = 0
+
+    def load(self, questions):
+        """Вопросы из Database.get_trainer_questions (с правильными ответами)"""
+        self._correct = {q["id"]: q["correct"] for q in questions}
+        self._public = {q["id"]: {"id": q["id"], "question": q["question"], "options": q["options"]}
+                        for q in questions}
+        self._ids = tuple(self._public)
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+
+    async def refresh(self, adb, force=False):
+        """Перечитываем вопросы, если пул старше ttl"""
+        if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        try:
+            self.load(await adb.get_trainer_questions())
+        except Exception as e:
+            # Старый пул лучше, чем никакого
+            print(f"Error loading trainer questions: {e}")
+            if self._loaded_at is None:
+                raise
+
+    def draw(self, size=TRAINER_SET_SIZE):
+        """Случайный набор: вопросы без правильных ответов, в случайном порядке"""
+        ids = _random.sample(self._ids, min(size, len(self._ids)))
+        self.sets_served += 1
+        return [self._public[i] for i in ids]
+
+    def correct_answer(self, question_id):
+        try:
+            return self._correct[question_id]
+        except KeyError:
+            raise TrainerError("Question is no longer available, start again") from None
+
+    def stats(self):
+        return {"questions": len(self._ids), "loads": self.loads, "sets_served": self.sets_served}
+
+
+# === Попытка ===
+def start_attempt(pool):
+    """(состояние для сессии, вопросы для клиента)"""
+    questions = pool.draw()
+    if not questions:
+        raise TrainerError("No trainer questions available")
+    state = {
+        "ids": [q["id"] for q in questions],
+        "started_at": datetime.datetime.utcnow().isoformat(),
+    }
+    return state, questions
+
+
+def grade_attempt(pool, state, answers):
+    """Проверяем ответы на весь набор (по порядку вопросов) и дописываем их в state.
+
+    Результат: итог (score, total, passed), оценка каждого ответа (correct)
+    и правильные ответы на все вопросы набора (correct_answers).
+    """
+    if not state:
+        raise TrainerError("No active trainer attempt")
+    if len(answers) != len(state["ids"]):
+        raise TrainerError("Answer every question of the attempt")
+    correct_answers = [pool.correct_answer(i) for i in state["ids"]]
+    correct = [answer == right for answer, right in zip(answers, correct_answers)]
+    state["answers"] = list(answers)
+
+    total = len(state["ids"])
+    score = sum(correct)
+    return {
+        "score": score,
+        "total": total,
+        "passed": score >= pass_score(total),
+        "finished": True,
+        "correct": correct,
+        "correct_answers": correct_answers,
+    }
+
+
+async def begin_attempt(adb, pool, user_id):
+    """Новая попытка в trainer_sessions: (id попытки для cookie сессии, вопросы для клиента)"""
+    state, questions = start_attempt(pool)
+    attempt_id = secrets.token_urlsafe(16)
+    await adb.create_trainer_session(attempt_id, user_id, json.dumps(state), time.time() - TRAINER_SESSION_TTL)
+    return attempt_id, questions
+
+
+async def submit_attempt(adb, pool, user_id, attempt_id, answers):
+    """Сдача попытки по состоянию из базы: (state, result). Сданная попытка удаляется"""
+    state = None
+    if isinstance(attempt_id, str):
+        state = await adb.finish_trainer_session(attempt_id, user_id, time.time() - TRAINER_SESSION_TTL)
+    if state is None:
+        raise TrainerError("No active trainer attempt")
+    state = json.loads(state)
+    return state, grade_attempt(pool, state, answers)
+
+
+def attempt_row(user_id, state, result):
+    """Строка trainer_attempts для завершённой попытки"""
+    return (user_id, json.dumps(state["ids"]), json.dumps(state["answers"]), result["score"],
+            result["total"], result["passed"], state["started_at"], datetime.datetime.utcnow().isoformat())
+
+
+# === Запись попыток ===
+class AttemptBuffer:
+    """Завершённые попытки копятся в памяти и пишутся одной транзакцией
+    раз в interval секунд, при max_pending попытках или при остановке"""
+
+    def __init__(self, adb, interval=TRAINER_FLUSH_INTERVAL, max_pending=TRAINER_FLUSH_SIZE):
+        self.adb = adb
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._task = None
+        self._wakeup = None
+        self._flush_lock = None
+        # Метрики
+        self.flushes = 0
+        self.rows_written = 0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def add(self, row):
+        self._pending.append(row)
+        if len(self._pending) >= self.max_pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+        lock = self._flush_lock or asyncio.Lock()
+        async with lock:
+            batch, self._pending = self._pending, []
+            try:
+                await self.adb.insert_trainer_attempts(batch)
+            except Exception as e:
+                print(f"Error flushing trainer attempts: {e}")
+                self._pending = batch + self._pending
+                return 0
+            self.flushes += 1
+            self.rows_written += len(batch)
+            return len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self):
+        return {"pending_attempts": len(self._pending), "flushes": self.flushes, "rows_written": self.rows_written}